@@ -171,10 +171,22 @@ class BallotSubmissionAdmin(admin.ModelAdmin):
     # This incurs a massive performance hit
     #inlines = (SpeakerScoreByAdjInline, SpeakerScoreInline, TeamScoreInline)
 
+    def save_model(self, request, obj, form, change):
+        # Confirming or unconfirming a ballot here bypasses BallotSet.save()
+        was_confirmed = obj.confirmed_when_saved
+        super(BallotSubmissionAdmin, self).save_model(request, obj, form, change)
+        if obj.confirmed != was_confirmed:
+            models.TeamRoundSummary.objects.update_for_debate(obj.debate)
+
 admin.site.register(models.BallotSubmission, BallotSubmissionAdmin)
 
 class ActionLogAdmin(admin.ModelAdmin):
     list_display = ('type', 'user', 'timestamp', 'get_parameters_display', 'tournament')
     list_filter = ('tournament', 'user', 'type')
     search_fields = ('type', 'tournament__name', 'user__username')
-admin.site.register(models.ActionLog, ActionLogAdmin)
\ No newline at end of file
+admin.site.register(models.ActionLog, ActionLogAdmin)
+
+class DrawJobAdmin(admin.ModelAdmin):
+    list_display = ('round', 'status', 'phase', 'user', 'started', 'updated')
+    list_filter = ('round__tournament', 'status')
+admin.site.register(models.DrawJob, DrawJobAdmin)
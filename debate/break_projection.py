@@ -0,0 +1,322 @@
+"""Monte Carlo projection of the break.
+
+BreakProjector simulates the remaining preliminary rounds many times over,
+starting from the current standings, and applies the break rules (break size,
+institution cap and teams that can't break) to each simulated tab, in the same
+way as TeamManager.breaking_teams(). Everything is vectorised over simulations
+and teams, so it needs nothing but NumPy; project_break() builds a projector
+from the database, and get_break_projection() caches its results."""
+
+# cannot import debate.models at module level - would create circular dep
+
+import copy
+import numpy as np
+
+BREAK_PROJECTION_CACHE_TIMEOUT = 600
+
+# Converts (points, speaker score or margin) into a single sort key. Total
+# speaker scores and margins are always far less than this.
+POINTS_WEIGHT = 1e5
+
+
+def _sorted_breaks(keys, eligible, institutions, crowded, break_size, institution_cap):
+    """Does the work of simulated_breaks() on the teams given, which must be
+    sorted best first in each row. 'crowded' lists the institutions with more
+    teams than the cap (if there are none, the cap is skipped). Returns
+    (breaks, filled), where 'filled' says, for each row, whether there were
+    enough eligible teams to fill the break."""
+    sims, n = keys.shape
+    eligible = eligible.copy()
+
+    if len(crowded):
+        # Find the number of teams from the same institution ranked ahead of
+        # each team, by sorting each row by institution (stably, so that
+        # within an institution teams stay in rank order).
+        rows = np.arange(sims)[:, np.newaxis]
+        by_institution = np.argsort(institutions * n + np.arange(n), axis=1)
+        grouped = institutions[rows, by_institution]
+        starts = np.ones((sims, n), dtype=bool)
+        starts[:, 1:] = grouped[:, 1:] != grouped[:, :-1]
+        positions = np.arange(n)
+        ahead = positions - np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+        capped = np.empty((sims, n), dtype=bool)
+        capped[rows, by_institution] = ahead >= institution_cap
+        eligible &= ~capped
+
+    # A team breaks if the number of breaking-eligible teams ranked strictly
+    # ahead of its rank group is less than the break size.
+    new_group = np.ones((sims, n), dtype=bool)
+    new_group[:, 1:] = keys[:, 1:] != keys[:, :-1]
+    ahead = np.cumsum(eligible, axis=1) - eligible
+    group_ahead = np.maximum.accumulate(np.where(new_group, ahead, 0), axis=1)
+    breaks = eligible & (group_ahead < break_size)
+
+    filled = ahead[:, -1] + eligible[:, -1] >= break_size
+    return breaks, filled
+
+
+def simulated_breaks(points, scores, institutions, eligible, break_size, institution_cap):
+    """Returns a boolean array of which teams break in each simulated tab.
+
+    'points' and 'scores' are arrays of shape (simulations, teams). The other
+    arguments are as for BreakProjector. Teams equal on points and speaker
+    score at the bottom of the break all break, as in breaking_teams().
+
+    To save time, it first considers only the best few teams in each
+    simulation (enough to fill the break in nearly every case), and sorts the
+    whole field only for simulations in which that wasn't enough."""
+    sims, n = points.shape
+    rows = np.arange(sims)[:, np.newaxis]
+    keys = -(points * POINTS_WEIGHT + scores)
+    if institution_cap > 0:
+        crowded = np.nonzero(np.bincount(institutions) > institution_cap)[0]
+    else:
+        crowded = []
+
+    top = min(n, 2 * break_size + 32)
+    if top < n:
+        partition = np.argpartition(keys, top, axis=1)
+        candidates = partition[:, :top]
+        best_excluded = keys[rows[:, 0], partition[:, top]]
+    else:
+        candidates = np.tile(np.arange(n), (sims, 1))
+
+    order = candidates[rows, np.argsort(keys[rows, candidates], axis=1, kind='mergesort')]
+    sorted_keys = keys[rows, order]
+    sorted_breaks, complete = _sorted_breaks(sorted_keys, eligible[order],
+            institutions[order], crowded, break_size, institution_cap)
+
+    breaks = np.zeros((sims, n), dtype=bool)
+    breaks[rows, order] = sorted_breaks
+
+    if top < n:
+        # The break isn't settled if it wasn't filled, or if the last
+        # candidate is tied with a team that wasn't considered.
+        complete &= sorted_keys[:, -1] < best_excluded
+        redo = np.nonzero(~complete)[0]
+        if len(redo):
+            redo_rows = redo[:, np.newaxis]
+            order = np.argsort(keys[redo], axis=1, kind='mergesort')
+            sorted_breaks, _ = _sorted_breaks(keys[redo_rows, order], eligible[order],
+                    institutions[order], crowded, break_size, institution_cap)
+            breaks[redo_rows, order] = sorted_breaks
+
+    return breaks
+
+
+def _choose(n, k):
+    result = 1
+    for i in xrange(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+class BreakProjector(object):
+    """Projects the break from the current standings.
+
+    Arguments (arrays have one element per team):
+        points            current points
+        scores            current totals of the metric that ranks teams on
+                          equal points (speaker score, or margin under WADL)
+        rounds_done       number of rounds the scores are from
+        rounds_remaining  number of preliminary rounds left to simulate
+        institutions      institution of each team, as integers
+        eligible          boolean, False for teams that can't break
+        break_size        number of teams in the break
+        institution_cap   maximum teams per institution, 0 for no cap
+        points_per_win    points for a win
+        points_per_loss   points for a loss
+
+    In each remaining round, each team wins with a probability that depends
+    on how its average score compares to the field's, and gets a score
+    distributed about its average. This ignores who teams
+    actually face, so it's an estimate, not a prediction.
+
+    After run(), these attributes are available (arrays, one per team):
+        probabilities     proportion of simulations in which the team broke
+        conditional       shape (teams, rounds_remaining + 1): column k is the
+                          probability of breaking given k more wins, NaN if
+                          that never happened
+        wins_needed       least number of further wins that gives a
+                          probability of at least 'threshold' of breaking, -1
+                          if there isn't one
+        points_needed     the points from wins_needed wins (and losses in
+                          the other rounds), -1 if there isn't one"""
+
+    def __init__(self, points, scores, rounds_done, rounds_remaining, institutions,
+            eligible, break_size, institution_cap=0, points_per_win=1, points_per_loss=0):
+        self.points = np.asarray(points, dtype=float)
+        self.scores = np.asarray(scores, dtype=float)
+        self.rounds_remaining = rounds_remaining
+        self.institutions = np.unique(np.asarray(institutions), return_inverse=True)[1]
+        self.eligible = np.asarray(eligible, dtype=bool)
+        self.break_size = break_size
+        self.institution_cap = institution_cap
+        self.points_per_win = points_per_win
+        self.points_per_loss = points_per_loss
+
+        n = len(self.points)
+        if rounds_done > 0:
+            self.means = self.scores / rounds_done
+        else:
+            self.means = np.zeros(n)
+        spread = self.means.std() if n else 0
+        if spread > 0:
+            self.win_probabilities = 1 / (1 + np.exp(-(self.means - self.means.mean()) / spread))
+            self.score_sd = spread
+        else:
+            self.win_probabilities = np.full(n, 0.5)
+            self.score_sd = 1.0
+
+    def run(self, simulations=2000, seed=None, threshold=0.5):
+        n = len(self.points)
+        r = self.rounds_remaining
+        random = np.random.RandomState(seed)
+
+        # Sample the number of further wins by inverting each team's binomial
+        # CDF, which is much faster than random.binomial() for few rounds.
+        p = self.win_probabilities
+        k = np.arange(r + 1)
+        choose = np.array([_choose(r, i) for i in k], dtype=float)
+        cdf = np.cumsum(choose * p[:, np.newaxis] ** k * (1 - p[:, np.newaxis]) ** (r - k), axis=1)
+        uniform = random.random_sample((simulations, n))
+        wins = np.zeros((simulations, n), dtype=np.int8)
+        for i in xrange(r):
+            wins += uniform > cdf[:, i]
+        points = self.points + wins * self.points_per_win + (r - wins) * self.points_per_loss
+
+        # Speaker scores are drawn from a logistic distribution (also much
+        # faster to sample), with the same standard deviation as the normal
+        # distribution it approximates.
+        scores = self.scores + self.means * r
+        if r > 0:
+            uniform = random.random_sample((simulations, n))
+            with np.errstate(divide='ignore'):
+                noise = np.log(uniform / (1 - uniform))
+            scores = scores + noise * (self.score_sd * np.sqrt(r) * np.sqrt(3) / np.pi)
+        else:
+            scores = np.tile(scores, (simulations, 1))
+
+        breaks = simulated_breaks(points, scores, self.institutions, self.eligible,
+                self.break_size, self.institution_cap)
+        self.probabilities = breaks.mean(axis=0)
+
+        # Break probability given the number of further wins
+        cells = (np.arange(n) * (r + 1) + wins).ravel()
+        totals = np.bincount(cells, minlength=n * (r + 1)).reshape(n, r + 1)
+        broke = np.bincount(cells[breaks.ravel()], minlength=n * (r + 1)).reshape(n, r + 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.conditional = broke.astype(float) / totals
+
+        enough = np.nan_to_num(self.conditional) >= threshold
+        self.wins_needed = np.where(enough.any(axis=1), enough.argmax(axis=1), -1)
+        self.points_needed = np.where(self.wins_needed >= 0, self.wins_needed * self.points_per_win +
+                (r - self.wins_needed) * self.points_per_loss, -1)
+        return self.probabilities
+
+
+# Metrics that BreakProjector can simulate, for ranking teams on equal points
+PROJECTABLE_METRICS = ("speaker_score", "margins")
+
+
+def _ranking_metric(tournament):
+    """Returns the metric that ranks teams on equal points under the
+    tournament's standings rule, or speaker score if it's not one that can be
+    simulated."""
+    from debate.standings import get_standings_rule
+    metrics = get_standings_rule(tournament).metrics
+    if len(metrics) > 1 and metrics[1] in PROJECTABLE_METRICS:
+        return metrics[1]
+    return "speaker_score"
+
+
+def project_break(round, category='open', simulations=2000):
+    """Projects the break as of the start of 'round', simulating this and all
+    later preliminary rounds. Returns a list of teams in the category, each
+    annotated with 'points', 'speaker_score', 'margins', 'break_probability'
+    and 'points_needed' (None if no number of wins gives better-than-even
+    odds), most likely to break first."""
+    from debate.models import Team
+    from debate.standings import annotate_team_totals
+    from debate.breaking import BREAK_CATEGORIES
+    from debate.result import get_team_points_values
+
+    category = BREAK_CATEGORIES[category]
+    tournament = round.tournament
+    prelims = tournament.prelim_rounds()
+    rounds_done = prelims.filter(seq__lt=round.seq).count()
+    rounds_remaining = prelims.filter(seq__gte=round.seq).count()
+
+    teams = Team.objects.filter(tournament=tournament).select_related('institution')
+    if round.prev is not None:
+        teams = annotate_team_totals(teams, round.prev)
+    else:
+        # Nothing has been debated yet. (annotate_team_totals() would count
+        # every round, given no round.)
+        teams = list(teams)
+        for team in teams:
+            team.points, team.speaker_score, team.margins = 0, 0, 0
+    teams = [t for t in teams if category.predicate(t)]
+    if not teams:
+        return teams
+
+    metric = _ranking_metric(tournament)
+    points_per_win, points_per_loss = get_team_points_values(tournament)
+    projector = BreakProjector(
+        points = [t.points for t in teams],
+        scores = [getattr(t, metric) for t in teams],
+        rounds_done = rounds_done,
+        rounds_remaining = rounds_remaining,
+        institutions = [t.institution_id for t in teams],
+        eligible = [not t.cannot_break for t in teams],
+        break_size = tournament.config.get(category.break_size_option),
+        institution_cap = tournament.config.get('institution_cap'),
+        points_per_win = points_per_win,
+        points_per_loss = points_per_loss,
+    )
+    projector.run(simulations)
+
+    for team, probability, points_needed in zip(teams, projector.probabilities, projector.points_needed):
+        team.break_probability = float(probability)
+        team.points_needed = int(points_needed) if points_needed >= 0 else None
+
+    teams.sort(key=lambda t: (t.break_probability, t.points, getattr(t, metric)), reverse=True)
+    return teams
+
+
+def _cache_key(round, category, simulations):
+    # Config options go in the key, so that changing them is seen immediately
+    config = round.tournament.config
+    return "break_projection_{0:d}_{1}_{2:d}_{3:d}_{4:d}_{5}_{6}".format(round.id, category.name,
+            simulations, config.get(category.break_size_option), config.get('institution_cap'),
+            config.get('team_points_rule'), config.get('team_standings_rule'))
+
+
+def get_break_projection(round, category='open', simulations=2000):
+    """Returns project_break(round, category, simulations), cached until
+    results or teams change (see get_results_version())."""
+    from debate.models import Team
+    from debate.breaking import BREAK_CATEGORIES, get_results_version
+    from django.core.cache import cache
+
+    key = _cache_key(round, BREAK_CATEGORIES[category], simulations)
+    version = get_results_version(round.tournament)
+
+    cached = cache.get(key, version=version)
+    if cached is not None:
+        teams = Team.objects.filter(tournament=round.tournament).select_related(
+                'institution').in_bulk([row[0] for row in cached])
+        result = list()
+        for team_id, points, speaker_score, margins, probability, points_needed in cached:
+            if team_id not in teams:
+                continue # deleted since this was cached
+            team = copy.copy(teams[team_id])
+            team.points, team.speaker_score, team.margins = points, speaker_score, margins
+            team.break_probability, team.points_needed = probability, points_needed
+            result.append(team)
+        return result
+
+    teams = project_break(round, category, simulations)
+    cache.set(key, [(t.id, t.points, t.speaker_score, t.margins, t.break_probability, t.points_needed)
+            for t in teams], BREAK_PROJECTION_CACHE_TIMEOUT, version=version)
+    return teams
@@ -0,0 +1,251 @@
+# cannot import debate.models at module level - would create circular dep
+
+from draw import DrawError
+from collections import OrderedDict, Counter
+import copy
+import random
+
+BREAKING_TEAMS_CACHE_TIMEOUT = 600
+
+
+class BreakCategory(object):
+    """A category of the break. 'predicate' is a function that takes a Team
+    and returns True if the team is in the category, and 'break_size_option'
+    is the name of the config option holding the number of teams in the
+    break."""
+
+    def __init__(self, name, verbose_name, predicate, break_size_option):
+        self.name = name
+        self.verbose_name = verbose_name
+        self.predicate = predicate
+        self.break_size_option = break_size_option
+
+BREAK_CATEGORIES = OrderedDict()
+
+def register_break_category(name, verbose_name, predicate, break_size_option):
+    BREAK_CATEGORIES[name] = BreakCategory(name, verbose_name, predicate, break_size_option)
+
+def _is_esl(team):
+    from debate.models import Team
+    return team.type == Team.TYPE_ESL
+
+register_break_category("open", "Open", lambda team: True, "break_size")
+register_break_category("esl", "ESL", _is_esl, "esl_break_size")
+
+
+class _CategoryBreak(object):
+    """Works through the teams in one category, in standings order, deciding
+    each one's rank and break rank. Does what TeamManager.breaking_teams()
+    used to do in its loop, but one team at a time, so that all categories can
+    share one pass over the standings."""
+
+    def __init__(self, break_size, institution_cap):
+        self.break_size = break_size
+        self.institution_cap = institution_cap
+        self.teams = list()
+        self.done = False
+        self.seen = 0
+        self.prev_rank_value = (None, None)
+        self.current_rank = 0
+        self.current_break_rank = 0
+        self.current_break_seq = 0
+        self.teams_from_institution = Counter()
+
+    def add(self, team):
+        self.seen += 1
+        rank_value = (team.points, team.speaker_score)
+        new_rank = rank_value != self.prev_rank_value
+        if new_rank:
+            self.current_rank = self.seen
+            self.prev_rank_value = rank_value
+
+        # Increment current_break_seq if it won't violate institution cap
+        if self.institution_cap > 0 and self.teams_from_institution[team.institution_id] >= self.institution_cap:
+            if new_rank and self.current_break_rank == self.break_size:
+                self.done = True
+                return
+            break_rank = "- (Capped)"
+        elif team.cannot_break == True:
+            if new_rank and self.current_break_rank == self.break_size:
+                self.done = True
+                return
+            break_rank = "- (Ineligible)"
+        else:
+            self.current_break_seq += 1
+            if new_rank:
+                if self.current_break_rank == self.break_size:
+                    self.done = True
+                    return
+                self.current_break_rank = self.current_break_seq
+            break_rank = self.current_break_rank
+
+        if self.current_break_rank > self.break_size:
+            self.done = True
+            return
+
+        # Take note of the institution
+        self.teams_from_institution[team.institution_id] += 1
+
+        # Teams can be in more than one category, so annotate a copy
+        team = copy.copy(team)
+        team.rank = self.current_rank
+        team.break_rank = break_rank
+        self.teams.append(team)
+
+
+def compute_breaks(teams, categories, institution_cap):
+    """Accepts a list of teams sorted by standings (with 'points' and
+    'speaker_score'), and a list of (BreakCategory, break size) pairs.
+    Returns an OrderedDict mapping each category name to a list of the teams
+    that break in, or are capped or ineligible within, that category. Each
+    team in each list is a copy annotated with 'rank' (among teams in the
+    category) and 'break_rank' for that category.
+
+    All categories are worked out together, in a single pass over 'teams'."""
+    breaks = OrderedDict((category.name, _CategoryBreak(break_size, institution_cap))
+            for category, break_size in categories)
+    pending = [(category.predicate, breaks[category.name]) for category, _ in categories]
+
+    for team in teams:
+        if not pending:
+            break
+        for predicate, category_break in pending:
+            if predicate(team):
+                category_break.add(team)
+        pending = [(p, b) for p, b in pending if not b.done]
+
+    return OrderedDict((name, b.teams) for name, b in breaks.iteritems())
+
+
+def _cache_key(tournament, categories, institution_cap):
+    # Config options go in the key, so that changing them is seen immediately
+    return "breaking_teams_{0:d}_{1}_{2:d}_{3}".format(tournament.id,
+            tournament.config.get('team_standings_rule'), institution_cap,
+            "_".join("{0}{1:d}".format(c.name, size) for c, size in categories))
+
+
+def _cache_version_key(tournament_id):
+    return "breaking_teams_version_{0:d}".format(tournament_id)
+
+
+def _get_cache_version(cache, tournament_id):
+    """Returns the version that the tournament's break is cached under. The
+    version key never expires, since if it did, entries cached under an old
+    version would be read again once it was recreated. In case it's evicted
+    anyway, it's recreated with a random version rather than from zero."""
+    version_key = _cache_version_key(tournament_id)
+    initial = random.getrandbits(48)
+    cache.add(version_key, initial, None)
+    version = cache.get(version_key)
+    return version if version is not None else initial
+
+
+def get_results_version(tournament):
+    """Returns the version that the tournament's break is cached under. It
+    changes whenever invalidate_breaking_teams() is called, so other caches
+    of things that depend on results or teams can use it too."""
+    from django.core.cache import cache
+    return _get_cache_version(cache, getattr(tournament, 'id', tournament))
+
+
+def invalidate_breaking_teams(tournament):
+    """Discards the cached break for the given tournament (or tournament ID).
+    Should be called whenever results or teams change."""
+    from django.core.cache import cache
+    tournament_id = getattr(tournament, 'id', tournament)
+    try:
+        cache.incr(_cache_version_key(tournament_id))
+    except ValueError:
+        pass # nothing cached, so nothing to invalidate
+
+
+def get_breaking_teams(tournament):
+    """Returns an OrderedDict mapping each break category name to its list of
+    breaking teams, as for compute_breaks(). The standings are computed once
+    for all categories, and the result is cached for the tournament."""
+    from debate.models import Team
+    from debate.standings import annotate_team_standings
+    from django.core.cache import cache
+
+    categories = [(c, tournament.config.get(c.break_size_option)) for c in BREAK_CATEGORIES.itervalues()]
+    institution_cap = tournament.config.get('institution_cap')
+    key = _cache_key(tournament, categories, institution_cap)
+    version = _get_cache_version(cache, tournament.id)
+
+    cached = cache.get(key, version=version)
+    if cached is not None:
+        teams = Team.objects.filter(tournament=tournament).select_related(
+                'institution').prefetch_related('speaker_set').in_bulk(
+                set(row[0] for rows in cached.itervalues() for row in rows))
+        breaks = OrderedDict()
+        for name, rows in cached.iteritems():
+            breaks[name] = list()
+            for team_id, points, speaker_score, rank, break_rank in rows:
+                if team_id not in teams:
+                    continue # deleted since this was cached
+                team = copy.copy(teams[team_id])
+                team.points, team.speaker_score, team.rank, team.break_rank = points, speaker_score, rank, break_rank
+                breaks[name].append(team)
+        return breaks
+
+    teams = Team.objects.filter(tournament=tournament).select_related(
+            'institution').prefetch_related('speaker_set')
+    teams = annotate_team_standings(teams)
+    breaks = compute_breaks(teams, categories, institution_cap)
+
+    cache.set(key, OrderedDict((name, [(t.id, t.points, t.speaker_score, t.rank, t.break_rank)
+            for t in category_teams]) for name, category_teams in breaks.iteritems()),
+            BREAKING_TEAMS_CACHE_TIMEOUT, version=version)
+    return breaks
+
+
+def seed_break(teams, break_size):
+    """Returns the first 'break_size' teams that break, from a category's
+    list as returned by compute_breaks(), leaving out capped and ineligible
+    teams. If teams tied at the bottom of the break (that is, with the same
+    break rank) don't all fit in it, there's no rule to choose between them,
+    so raises DrawError rather than cut the tie arbitrarily."""
+    teams = [t for t in teams if not isinstance(t.break_rank, basestring)]
+    if 0 < break_size < len(teams) and teams[break_size].break_rank == teams[break_size - 1].break_rank:
+        tied = [t for t in teams if t.break_rank == teams[break_size].break_rank]
+        places = break_size - teams.index(tied[0])
+        raise DrawError("Teams {0} are tied for the last {1} place(s) in the break. Resolve "
+                "the tie, say by changing the break size or marking a team as unable to "
+                "break, before drawing.".format(", ".join(unicode(t) for t in tied), places))
+    return teams[:break_size]
+
+
+def get_seeded_breaking_teams(tournament, category='open'):
+    """Returns the teams that break in 'category', best first, for seeding
+    the first elimination round, as by seed_break()."""
+    break_size = tournament.config.get(BREAK_CATEGORIES[category].break_size_option)
+    return seed_break(get_breaking_teams(tournament)[category], break_size)
+
+
+def get_elimination_results(round):
+    """Returns a list of Pairings, one for each debate in the (elimination)
+    round, with 'room_rank' and the winner from the confirmed ballot. Loads
+    everything in one query. Raises DrawError if any debate has no confirmed
+    winner."""
+    from debate.models import DebateTeam
+    from debate.draw import Pairing, DrawError
+
+    debate_teams = DebateTeam.objects.filter(debate__round=round).select_related(
+            'team', 'team__institution', 'debate').extra(select={'won': """EXISTS (SELECT 1
+                    FROM debate_teamscore ts
+                    JOIN debate_ballotsubmission bs ON bs.id = ts.ballot_submission_id
+                    WHERE ts.debate_team_id = debate_debateteam.id
+                    AND bs.confirmed AND ts.win)"""}).order_by('debate__room_rank', 'position')
+
+    debates = OrderedDict()
+    for dt in debate_teams:
+        debates.setdefault(dt.debate, list()).append(dt)
+
+    results = list()
+    for debate, dts in debates.iteritems():
+        winners = [dt.team for dt in dts if dt.won]
+        if len(winners) != 1:
+            raise DrawError("The debate {0} doesn't have a confirmed winner.".format(debate))
+        results.append(Pairing([dt.team for dt in dts], bracket=debate.bracket,
+                room_rank=debate.room_rank, winner=winners[0]))
+    return results
@@ -22,6 +22,7 @@ SETTINGS = OrderedDict([
     ('break_size',                  (int,   'Number of breaking teams',                                            16)),
     ('esl_break_size',              (int,   'Number of ESL breaking teams',                                        8)),
     ('institution_cap',             (int,   'Maximum number of teams from one institution that can break. Set to 0 if there is no cap',         3)),
+    ('break_projection_simulations',(int,   'Number of simulations for the break projection on the draw pages. Set to 0 to disable', 2000)),
     ('motion_vetoes_enabled',       (_bool, 'Whether teams can veto motions',                                      True)),
     ('adj_min_score',               (float, 'Minimum adjudicator score',                                           1.5)),
     ('adj_max_score',               (float, 'Maximum adjudicator score',                                           5)),
@@ -30,6 +31,9 @@ SETTINGS = OrderedDict([
     ('draw_side_allocations',       (str,   'Side allocations method, see wiki for allowed values',                'balance')),
     ('draw_pairing_method',         (str,   'Pairing method, see wiki for allowed values',                         'slide')),
     ('draw_avoid_conflicts',        (str,   'Conflict avoidance method, see wiki for allowed values',              'one_up_one_down')),
+    ('draw_random_conflict_method', (str,   'Conflict avoidance method for random draws, "matching" or "swap"',    'matching')),
+    ('draw_candidates',             (int,   'Number of draws to generate for random and power-paired rounds, keeping the best', 1)),
+    ('draw_candidates_time_limit',  (float, 'Time limit in seconds for generating draws, if more than one',         10)),
     ('team_standings_rule',         (str,   'Rule for ordering teams, "australs" or "nz" or "wadl" see wiki',      'australs')),
     ('adj_conflict_penalty',        (int,   'Penalty for adjudicator-team conflict',                               1000000)),
     ('adj_history_penalty',         (int,   'Penalty for adjudicator-team history',                                10000)),
@@ -40,6 +44,7 @@ SETTINGS = OrderedDict([
     ('show_emoji',                  (_bool, 'Shows Emoji in the draw UI',                                          False)),
     ('show_institutions',           (_bool, 'Shows the institutions column in draw and other UIs',                 True)),
     ('show_novices',                (_bool, 'Show if a speaker is a novice in the released tab',                   False)),
+    ('speaker_tab_min_rounds',      (int,   'Minimum number of substantive speeches to be ranked in the average speaker tab', 0)),
     ('public_participants',         (_bool, 'Public interface to see all participants',                            False)),
     ('public_side_allocations',     (_bool, 'Public interface to see side pre-allocations',                        False)),
     ('public_draw',                 (_bool, 'Public interface to see RELEASED draws',                              False)),
@@ -3,11 +3,14 @@ import random
 import math
 import copy
 from one_up_one_down import OneUpOneDownSwapper
+from matching import min_cost_assignment, max_bipartite_matching
 from warnings import warn
+import numpy as np
 
 # Flag codes must NOT have commas in them, because they go into a comma-delimited list.
 DRAW_FLAG_DESCRIPTIONS = {
     "max_swapped":  "Too many swaps",
+    "no_matching":  "No conflict-free pairing",
     "1u1d_hist":    "One-up-one-down (history)",
     "1u1d_inst":    "One-up-one-down (institution)",
     "1u1d_other":   "One-up-one-down (to accommodate)",
@@ -177,6 +180,10 @@ class BaseDrawGenerator(object):
     # All subclasses must define this with any options that may exist.
     DEFAULT_OPTIONS = {}
 
+    # If set, a function that is called with the name of each phase of the
+    # draw as it starts, for progress reports.
+    progress = None
+
     def __init__(self, teams, results=None, **kwargs):
         self.teams = teams
         self.team_flags = dict()
@@ -250,6 +257,10 @@ class BaseDrawGenerator(object):
         """Abstract method."""
         raise NotImplementedError
 
+    def report_progress(self, phase):
+        if self.progress is not None:
+            self.progress(phase)
+
     @classmethod
     def available_options(cls):
         keys = set(cls.BASE_DEFAULT_OPTIONS.keys())
@@ -286,10 +297,19 @@ class RandomDrawGenerator(BaseDrawGenerator):
     If there are allocated sides, use RandomDrawWithSideConstraints instead.
     Options:
         "max_swap_attempts": Maximum number of times to attempt to swap to
-            avoid conflict before giving up.
+            avoid conflict before giving up. With the "matching" method, the
+            maximum number of ways to split the teams to try.
         "avoid_conflicts": Whether to avoid conflicts, should be a string (for
             compatibility with other types of DrawGenerator).  Turned off if
             this values is "off", turned on if anything else.
+        "conflict_method": How to avoid conflicts, if they are avoided.
+            "matching" - pair teams directly from the teams each team may
+                face, so that the draw is conflict-free whenever that's
+                possible. Debates that couldn't be made conflict-free are
+                flagged "no_matching".
+            "swap" - draw randomly, then swap conflicted teams with random
+                other debates. Debates left conflicted are flagged
+                "max_swapped".
     """
 
     can_be_first_round = True
@@ -297,14 +317,80 @@ class RandomDrawGenerator(BaseDrawGenerator):
     requires_prev_results = False
     draw_type = "preliminary"
 
-    DEFAULT_OPTIONS = {"max_swap_attempts": 20, "avoid_conflicts": "off"}
+    DEFAULT_OPTIONS = {"max_swap_attempts": 20, "avoid_conflicts": "off",
+            "conflict_method": "matching"}
 
     def make_draw(self):
-        self._draw = self._make_initial_pairings()
-        self.avoid_conflicts(self._draw) # operates in-place
+        if self.options["conflict_method"] not in ["matching", "swap"]:
+            raise ValueError("Invalid conflict_method: {0!r}".format(self.options["conflict_method"]))
+        self.report_progress("pairings")
+        if self.options["conflict_method"] == "matching" and self._avoiding_conflicts():
+            self._draw = self._make_matched_pairings()
+        else:
+            self._draw = self._make_initial_pairings()
+            self.report_progress("conflicts")
+            self.avoid_conflicts(self._draw) # operates in-place
         self.balance_sides(self._draw) # operates in-place
         return self._draw
 
+    def _avoiding_conflicts(self):
+        return (self.options["avoid_history"] or self.options["avoid_institution"]) \
+                and self.options["avoid_conflicts"] != "off"
+
+    def _compatible(self, teams1, teams2):
+        """Returns a boolean matrix saying whether each team in teams1 may
+        face each team in teams2 without a conflict."""
+        compatible = np.ones((len(teams1), len(teams2)), dtype=bool)
+        if self.options["avoid_institution"]:
+            institutions = dict()
+            insts1 = np.array([institutions.setdefault(t.institution, len(institutions)) for t in teams1])
+            insts2 = np.array([institutions.setdefault(t.institution, len(institutions)) for t in teams2])
+            compatible &= insts1[:, np.newaxis] != insts2[np.newaxis, :]
+        if self.options["avoid_history"]:
+            for i, team in enumerate(teams1):
+                for j, other in enumerate(teams2):
+                    if compatible[i, j] and team.seen(other):
+                        compatible[i, j] = False
+        return compatible
+
+    @staticmethod
+    def _pairings_from_matching(teams1, teams2, match):
+        """Returns pairings of teams1 with teams2 as matched in 'match' (see
+        max_bipartite_matching()). Teams left unmatched are paired with each
+        other in random order, and flagged "no_matching"."""
+        pairings = [Pairing(teams=[teams1[i], teams2[j]], bracket=0, room_rank=0)
+                for i, j in enumerate(match) if j >= 0]
+        left1 = [teams1[i] for i, j in enumerate(match) if j < 0]
+        matched = set(match)
+        left2 = [team for j, team in enumerate(teams2) if j not in matched]
+        random.shuffle(left2)
+        for team1, team2 in zip(left1, left2):
+            pairings.append(Pairing(teams=[team1, team2], bracket=0, room_rank=0, flags=["no_matching"]))
+        return pairings
+
+    def _make_matched_pairings(self):
+        """Splits the teams randomly in half, and finds a conflict-free
+        matching between the halves. If there isn't one, tries other splits,
+        up to 'max_swap_attempts' in all, and uses the best found. Any split
+        works for most fields, since with shuffled halves a conflict-free
+        matching almost always exists if any does."""
+        teams = list(self.teams)
+        debates = len(teams) / 2
+        best = None
+        for attempt in xrange(max(self.options["max_swap_attempts"], 1)):
+            random.shuffle(teams)
+            top, bottom = teams[:debates], teams[debates:]
+            match = max_bipartite_matching(self._compatible(top, bottom))
+            unmatched = np.count_nonzero(match < 0)
+            if best is None or unmatched < best[0]:
+                best = (unmatched, top, bottom, match)
+            if unmatched == 0:
+                break
+        _, top, bottom, match = best
+        pairings = self._pairings_from_matching(top, bottom, match)
+        random.shuffle(pairings)
+        return pairings
+
     def _make_initial_pairings(self):
         teams = list(self.teams) # make a copy
         random.shuffle(teams)
@@ -377,6 +463,16 @@ class RandomWithAllocatedSidesDrawGenerator(RandomDrawGenerator):
                 for t in zip(aff_teams, neg_teams)]
         return pairings
 
+    def _make_matched_pairings(self):
+        """Finds a conflict-free matching between affirmative and negative
+        teams, in random order. This is a maximum matching, so if some
+        debates are flagged "no_matching", there was no way to avoid it."""
+        pairings = self._make_initial_pairings()
+        aff_teams = [p.aff_team for p in pairings]
+        neg_teams = [p.neg_team for p in pairings]
+        match = max_bipartite_matching(self._compatible(aff_teams, neg_teams))
+        return self._pairings_from_matching(aff_teams, neg_teams, match)
+
 
 class PowerPairedDrawGenerator(BaseDrawGenerator):
     """Power-paired draw.
@@ -403,7 +499,19 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
         "avoid_conflicts" - How to avoid conflicts.
             "one_up_one_down" - swap conflicted teams with the debate above or below,
                 in accordance with Australasian Intervarsity Debating Association rules.
+            "min_cost_matching" - re-match the top team of every debate with the
+                bottom team of some debate across the whole draw, minimising the
+                total of the history, institution, bracket, position and side
+                penalties.
             "off" - which turns off conflict avoidance.
+        "bracket_penalty" - for "min_cost_matching", penalty per point of
+            difference between a team's new opponent and its original one.
+        "position_penalty" - for "min_cost_matching", penalty per debate of
+            distance between a team's new opponent and its original one, so that
+            nearby swaps are preferred.
+        "side_penalty" - for "min_cost_matching", penalty for pairing two teams
+            that both need the same side (if side_allocations is "balance" and
+            teams have 'aff_count' and 'neg_count' attributes).
     """
 
     can_be_first_round = False
@@ -412,9 +520,12 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
     draw_type = "preliminary"
 
     DEFAULT_OPTIONS = {
-        "odd_bracket"    : "intermediate_bubble_up_down",
-        "pairing_method" : "slide",
-        "avoid_conflicts": "one_up_one_down"
+        "odd_bracket"     : "intermediate_bubble_up_down",
+        "pairing_method"  : "slide",
+        "avoid_conflicts" : "one_up_one_down",
+        "bracket_penalty" : 100,
+        "position_penalty": 0.01,
+        "side_penalty"    : 0.005,
     }
 
     def __init__(self, *args, **kwargs):
@@ -422,9 +533,12 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
         self.check_teams_for_attribute("points")
 
     def make_draw(self):
+        self.report_progress("brackets")
         self._brackets = self._make_raw_brackets()
         self.resolve_odd_brackets(self._brackets) # operates in-place
+        self.report_progress("pairings")
         self._pairings = self.generate_pairings(self._brackets)
+        self.report_progress("conflicts")
         self.avoid_conflicts(self._pairings) # operates in-place
         self._draw = list()
         for bracket in self._pairings.itervalues():
@@ -622,7 +736,8 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
     ## Conflict avoidance
 
     AVOID_CONFLICT_FUNCTIONS = {
-        "one_up_one_down" : "_one_up_one_down",
+        "one_up_one_down"  : "_one_up_one_down",
+        "min_cost_matching": "_min_cost_matching",
     }
 
     def avoid_conflicts(self, pairings):
@@ -633,6 +748,18 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
         function = self.get_option_function("avoid_conflicts", self.AVOID_CONFLICT_FUNCTIONS)
         return function(pairings)
 
+    @staticmethod
+    def _conflict_matrices(affs, negs):
+        """Returns (same_institution, history) matrices, as for
+        OneUpOneDownSwapper.run(): [i, j] is whether affs[i] and negs[j] are
+        from the same institution, and how many times they've met."""
+        institutions = dict()
+        aff_insts = np.array([institutions.setdefault(t.institution, len(institutions)) for t in affs])
+        neg_insts = np.array([institutions.setdefault(t.institution, len(institutions)) for t in negs])
+        same_institution = aff_insts[:, np.newaxis] == neg_insts[np.newaxis, :]
+        history = np.array([[a.seen(n) for n in negs] for a in affs], dtype=float)
+        return same_institution, history.reshape(len(affs), len(negs))
+
     def _one_up_one_down(self, pairings):
         """We pass the pairings to one_up_one_down.py, then infer annotations
         based on the result."""
@@ -644,7 +771,9 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
                     "institution_penalty"]
             options = dict((key, self.options[key]) for key in OPTIONS)
             swapper = OneUpOneDownSwapper(**options)
-            pairs_new = swapper.run(pairs)
+            same_institution, history = self._conflict_matrices(
+                    [aff for aff, neg in pairs], [neg for aff, neg in pairs])
+            pairs_new = swapper.run(pairs, same_institution=same_institution, history=history)
             swaps = swapper.swaps
 
             for i, (pairing, orig, new) in enumerate(zip(bracket, pairs_orig, pairs_new)):
@@ -659,6 +788,60 @@ class PowerPairedDrawGenerator(BaseDrawGenerator):
                         pairing.add_flag("1u1d_other")
                     pairing.teams = list(new)
 
+    def _matching_costs(self, top, bottom):
+        """Returns a matrix of the cost of pairing each team in 'top' with each
+        team in 'bottom', where top[i] and bottom[i] were originally paired."""
+        n = len(top)
+        positions = np.arange(n)
+        points = np.array([team.points or 0 for team in bottom], dtype=float)
+        cost = np.abs(points[np.newaxis, :] - points[:, np.newaxis]) * self.options["bracket_penalty"]
+        cost += np.abs(positions[np.newaxis, :] - positions[:, np.newaxis]) * self.options["position_penalty"]
+
+        if self.options["avoid_history"]:
+            history = np.array([[t.seen(b) for b in bottom] for t in top], dtype=float)
+            cost += history * self.options["history_penalty"]
+
+        if self.options["avoid_institution"]:
+            institutions = dict()
+            top_insts = np.array([institutions.setdefault(t.institution, len(institutions)) for t in top])
+            bottom_insts = np.array([institutions.setdefault(t.institution, len(institutions)) for t in bottom])
+            cost += (top_insts[:, np.newaxis] == bottom_insts[np.newaxis, :]) * self.options["institution_penalty"]
+
+        teams = top + bottom
+        if self.options["side_allocations"] == "balance" and all(hasattr(t, "neg_count") for t in teams):
+            # +1 if a team needs to negate, -1 if it needs to affirm
+            top_needs = np.sign([t.aff_count - t.neg_count for t in top])
+            bottom_needs = np.sign([t.aff_count - t.neg_count for t in bottom])
+            clash = (top_needs[:, np.newaxis] == bottom_needs[np.newaxis, :]) & (top_needs[:, np.newaxis] != 0)
+            cost += clash * self.options["side_penalty"]
+
+        return cost
+
+    def _min_cost_matching(self, pairings):
+        """Keeps the top team of every debate in place, and finds the
+        assignment of bottom teams to debates that minimises the total cost
+        (see _matching_costs()) over the whole draw. Debates whose bottom team
+        changes are flagged as for one-up-one-down."""
+        # In bracket order, top bracket first, so that positions in the list
+        # are positions in the draw
+        debates = [pairing for points in sorted(pairings, reverse=True) for pairing in pairings[points]]
+        if not debates:
+            return
+        top = [pairing.teams[0] for pairing in debates]
+        bottom = [pairing.teams[1] for pairing in debates]
+        assignment = min_cost_assignment(self._matching_costs(top, bottom))
+
+        for pairing, j in zip(debates, assignment):
+            if bottom[j] is pairing.teams[1]:
+                continue
+            if pairing.conflict_hist:
+                pairing.add_flag("1u1d_hist")
+            if pairing.conflict_inst:
+                pairing.add_flag("1u1d_inst")
+            if not (pairing.conflict_hist or pairing.conflict_inst):
+                pairing.add_flag("1u1d_other")
+            pairing.teams[1] = bottom[j]
+
 
 class PowerPairedWithAllocatedSidesDrawGenerator(PowerPairedDrawGenerator):
     """Power-paired draw with allocated sides.
@@ -685,9 +868,12 @@ class PowerPairedWithAllocatedSidesDrawGenerator(PowerPairedDrawGenerator):
     """
 
     DEFAULT_OPTIONS = {
-        "odd_bracket"    : "intermediate1",
-        "pairing_method" : "fold",
-        "avoid_conflicts": None,
+        "odd_bracket"     : "intermediate1",
+        "pairing_method"  : "fold",
+        "avoid_conflicts" : None,
+        "bracket_penalty" : 100,
+        "position_penalty": 0.01,
+        "side_penalty"    : 0.005,
     }
 
     def __init__(self, *args, **kwargs):
@@ -1023,35 +1209,84 @@ class EliminationDrawGenerator(BaseDrawGenerator):
             pairings.append(pairing)
         return pairings
 
+_circle_schedules = dict()
+
+def circle_schedule(n):
+    """Returns a round-robin schedule for n teams, made by the circle method,
+    as a list of n-1 rounds (n rounds if n is odd), each a list of (aff, neg)
+    pairs of indices from 0 to n-1. If n is odd, the team missing from each
+    round has a bye. Every team affirms and negates equally often (to within
+    one, if n is even). Schedules are cached, since divisions are usually the
+    same size."""
+    if n in _circle_schedules:
+        return _circle_schedules[n]
+
+    # If n is odd, slot 0 is the bye, which stays fixed in the circle.
+    size = n + n % 2
+    offset = n % 2
+    circle = range(size)
+    schedule = list()
+    for r in xrange(size - 1):
+        pairs = list()
+        for i in xrange(size / 2):
+            aff, neg = circle[i], circle[size - 1 - i]
+            if (i == 0 and r % 2 == 1) or i % 2 == 1:
+                aff, neg = neg, aff
+            if offset and 0 in (aff, neg):
+                continue
+            pairs.append((aff - offset, neg - offset))
+        schedule.append(pairs)
+        circle = [circle[0], circle[-1]] + circle[1:-1]
+
+    _circle_schedules[n] = schedule
+    return schedule
+
+
 class RoundRobinDrawGenerator(BaseDrawGenerator):
-    """ Class for round-robin stype matchups using divisions """
+    """ Class for round-robin stype matchups using divisions
+
+    Every team must have a 'division' attribute. Each division's whole
+    schedule is made once, by the circle method (see circle_schedule()), with
+    teams in order of ID, and the draw for a round is looked up from it. Sides
+    come from the schedule. If a division has an odd number of teams, one team
+    has a bye in each round. After every team has met every other team, the
+    schedule repeats with sides swapped.
+
+    The schedule should be made from every team in the division, not just
+    those in this draw, or it would change whenever a team is absent. So if
+    the "rosters" option is given, each division's schedule is made from its
+    roster, and a team whose opponent is absent has a bye.
+    Options:
+        "round_number" - which round of the round robin to draw, starting
+            from 1.
+        "rosters" - dict mapping each division's ID to a list of the IDs of
+            all teams in that division. If None, the teams in the draw are
+            taken to be the whole of their divisions.
+    """
 
     can_be_first_round = True
     requires_even_teams = False
     requires_prev_results = False
     draw_type = "elimination"
 
-    PAIRING_FUNCTIONS = {
-        "random": "_pairings_random"
-    }
+    DEFAULT_OPTIONS = {"round_number": 1, "rosters": None}
 
     def make_draw(self):
         self._brackets = self._make_raw_brackets_from_divisions()
-        # TODO: resolving brackets with odd numbers here (see resolve_odd_brackets)
+        self.schedules = self.make_schedules(self._brackets)
         self._pairings = self.generate_pairings(self._brackets)
-        # TODO: avoiding history conflicts here
         self._draw = list()
         for bracket in self._pairings.itervalues():
-            print bracket
             self._draw.extend(bracket)
 
         return self._draw
 
     def _make_raw_brackets_from_divisions(self):
         """Returns an OrderedDict mapping bracket names (normally numbers)
-        to lists."""
+        to lists of teams in order of ID. If there are rosters, each list
+        covers the division's whole roster, with None for absent teams."""
         brackets = OrderedDict()
-        teams = list(self.teams)
+        teams = sorted(self.teams, key=lambda team: team.id)
         for team in teams:
             # Converting from bracket's name to a float (so it can pretend to be a Bracket)
             division = float(team.division.name)
@@ -1060,56 +1295,44 @@ class RoundRobinDrawGenerator(BaseDrawGenerator):
             else:
                 brackets[division] = [team]
 
+        rosters = self.options["rosters"]
+        if rosters is not None:
+            for division, teams in brackets.iteritems():
+                roster = sorted(rosters.get(teams[0].division.id, []))
+                present = dict((team.id, team) for team in teams)
+                missing = set(present) - set(roster)
+                if missing:
+                    raise DrawError("Teams {0} aren't on the roster of division {1}".format(
+                            sorted(missing), teams[0].division.name))
+                brackets[division] = [present.get(team_id) for team_id in roster]
+
         return brackets
 
+    @staticmethod
+    def make_schedules(brackets):
+        """Returns a dict mapping each bracket to its schedule, a list of
+        rounds, each a list of (aff, neg) pairs of teams (or None, for absent
+        teams)."""
+        schedules = dict()
+        for points, teams in brackets.iteritems():
+            schedules[points] = [[(teams[a], teams[n]) for a, n in pairs]
+                    for pairs in circle_schedule(len(teams))]
+        return schedules
+
     def generate_pairings(self, brackets):
+        index = self.options["round_number"] - 1
         pairings = OrderedDict()
         for points, teams in brackets.iteritems():
-            num_debates = len(teams) / 2 # this rounds down the debates
-            #num_debates = int(math.ceil(len(teams) / 2.0)) # this rounds up
-            if num_debates % 2 != 0:
-                print "There are an odd number of teams in bracket %s" % points
-                # TODO things here when I get around to dealing with Byes
-
+            schedule = self.schedules[points]
+            cycle, r = divmod(index, len(schedule))
             bracket = list()
-            assigned_teams = []
-
-            for aff in teams:
-                if aff not in assigned_teams:
-                    print "Looking for an opposition for %s" % aff
-                    opposition = None
-
-                    for neg in teams:
-                        if neg in assigned_teams:
-                            continue
-                        elif aff == neg:
-                            continue
-                        elif aff.seen(neg):
-                            print "\t already seen %s" % neg
-                            continue
-                        else:
-                            print "\t hasn't seen %s" % neg
-                            opposition = neg
-                            break # Stop searching
-
-                    if opposition:
-                        pairing = Pairing(
-                            teams=(aff,opposition),
-                            bracket=points,
-                            room_rank=1,
-                            division=aff.division
-                        )
-                        print "\t made a pairing %s" % pairing
-                        bracket.append(pairing)
-                        assigned_teams.append(aff)
-                        assigned_teams.append(opposition)
-                    else:
-                        # Need to deal with Byes and the like here
-                        print "couldn't find an opposition"
-
-
-                    print "---"
-
+            for aff, neg in schedule[r]:
+                if aff is None or neg is None:
+                    continue # opponent is absent, so this is a bye
+                if cycle % 2 == 1:
+                    aff, neg = neg, aff
+                bracket.append(Pairing(teams=(aff, neg), bracket=points,
+                        room_rank=1, division=aff.division))
             pairings[points] = bracket
 
         return pairings
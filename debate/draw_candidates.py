@@ -0,0 +1,124 @@
+"""Best-of-K draw generation.
+
+Draws are random in places (pull-ups, random pairings, conflict swaps), so
+generating several and keeping the best one often gives a draw with fewer
+conflicts and flags. best_draw() generates candidate draws in a process pool,
+each with its own random seed, scores them with DrawDiagnostics and returns
+the best one found within a time limit.
+
+This module doesn't depend on Django, but the teams must have everything the
+draw generator needs already loaded, since the worker processes can't use the
+database. They should be plain data, like TeamRecords (see draw_input).
+
+The workers are forked, normally from a DrawJob's thread rather than the main
+thread. That's safe because of what the workers do: they only run the draw
+generators (pure Python and NumPy, with no logging, threads or BLAS) on the
+inputs they inherit, return plain tuples through the pool's pipes, and exit
+without running any cleanup. So they never touch locks or connections that
+other threads of the parent might have held at the time of the fork, and
+(since Python 2's os.fork() holds the import lock) never inherit a half-done
+import. The one thing they would inherit that's in use is the forking thread's
+own database connection, so 'before_fork' lets the caller close it just
+before the pool is made. Round.draw() does, and passes TeamRecords."""
+
+from draw import DrawGenerator, Pairing
+from draw_diagnostics import DrawDiagnostics
+from multiprocessing import Pool, TimeoutError, cpu_count
+import random
+import time
+import numpy as np
+
+
+def score_draw(pairings, options):
+    """Returns a measure of how bad a draw is (lower is better), as by
+    DrawDiagnostics.badness(). 'options' should be the draw generator's
+    options."""
+    return DrawDiagnostics(pairings).badness(options)
+
+
+# Draw inputs, sent once to each worker process by _init_worker()
+_inputs = None
+
+def _init_worker(draw_type, teams, results, options):
+    global _inputs
+    _inputs = (draw_type, teams, results, options)
+
+
+def _generate(seed):
+    """Generates a draw from the inputs given to _init_worker(). Returns
+    (score, seed, rows), where each row describes a pairing by the indices of
+    its teams, so that the teams needn't be sent back."""
+    draw_type, teams, results, options = _inputs
+    random.seed(seed)
+    np.random.seed(seed)
+    drawer = DrawGenerator(draw_type, teams, results, **options)
+    draw = drawer.make_draw()
+    index = dict((id(team), i) for i, team in enumerate(teams))
+    rows = [([index[id(team)] for team in pairing.teams], pairing.bracket,
+            pairing.room_rank, pairing.flags, pairing.division is not None)
+            for pairing in draw]
+    return score_draw(draw, drawer.options), seed, rows
+
+
+def _pairings(teams, rows):
+    return [Pairing([teams[i] for i in indices], bracket, room_rank, flags,
+            division=teams[indices[0]].division if has_division else None)
+            for indices, bracket, room_rank, flags, has_division in rows]
+
+
+def best_draw(draw_type, teams, results=None, options=None, candidates=1, time_limit=None,
+        processes=None, progress=None, seeds=None, before_fork=None):
+    """Generates up to 'candidates' draws, as by DrawGenerator(draw_type,
+    teams, results, **options).make_draw(), and returns the one with the
+    lowest score_draw(). 'seeds', if given, are the random seeds of the
+    candidates, and 'candidates' is ignored; otherwise they're random.
+
+    The draws are generated in a pool of 'processes' worker processes
+    (default one per CPU). If 'time_limit' (in seconds) is given, draws not
+    finished by then are abandoned. If none has finished, the first candidate
+    is still waited for, so the draw can take longer than 'time_limit', but
+    only by as long as that candidate needs to finish. If 'candidates' is 1
+    and there are no 'seeds', there's no pool.
+
+    'progress', if given, is called with the name of each phase of the draw,
+    as for BaseDrawGenerator.progress (only "pairings" if there's a pool).
+    'before_fork', if given, is called just before the pool is made (and not
+    at all if there's no pool)."""
+    teams = list(teams)
+    if options is None:
+        options = {}
+    if seeds is None:
+        if candidates <= 1:
+            drawer = DrawGenerator(draw_type, teams, results, **options)
+            drawer.progress = progress
+            return drawer.make_draw()
+        seeds = [random.getrandbits(32) for i in xrange(candidates)]
+
+    if progress is not None:
+        progress("pairings")
+
+    deadline = time.time() + time_limit if time_limit is not None else None
+    if before_fork is not None:
+        before_fork()
+    pool = Pool(processes or min(len(seeds), cpu_count()), _init_worker,
+            (draw_type, teams, results, options))
+    try:
+        pending = [pool.apply_async(_generate, (seed,)) for seed in seeds]
+        best = None
+        for result in pending:
+            timeout = max(deadline - time.time(), 0) if deadline is not None else None
+            try:
+                candidate = result.get(timeout)
+            except TimeoutError:
+                continue # still check the others, which may have finished
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+        if best is None:
+            # Nothing finished in time. The first candidate has been running
+            # longest, so wait for it rather than start another draw.
+            best = pending[0].get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return _pairings(teams, best[2])
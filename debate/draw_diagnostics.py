@@ -0,0 +1,145 @@
+"""Measures of the quality of a draw.
+
+DrawDiagnostics goes through a draw once, and works out how many conflicts,
+pull-ups, rematches and side imbalances it has. It works on Pairings (from the
+draw generators) and on Debates alike, since it needs only 'aff_team' and
+'neg_team', so it's used both to report on a draft draw and to compare
+candidate draws. get_draw_diagnostics() does the former from the database."""
+
+# cannot import debate.models at module level - would create circular dep
+
+from collections import Counter
+
+PULLUP_PENALTY = 1
+SIDE_PENALTY = 0.5
+
+
+class DrawDiagnostics(object):
+    """Diagnostics for a draw.
+
+    Arguments:
+        debates   list of Pairings or Debates
+        history   dict mapping (team1_id, team2_id) to the number of times the
+                  teams have met before, as from get_team_history(); if None,
+                  Team.seen() is used
+        sides     object with aff_count(team) and neg_count(team) methods
+                  giving each team's sides before this round, like
+                  SideHistory; if None, teams' 'aff_count' and 'neg_count'
+                  attributes are used (or zero)
+
+    Teams with a 'points' attribute (not None) are checked for pull-ups.
+
+    Attributes:
+        debates                number of debates
+        history_conflicts      number of debates between teams that have met
+        history_total          total number of previous meetings, over all
+                               debates
+        rematches              dict mapping number of previous meetings to
+                               number of debates
+        institution_conflicts  number of debates between teams from the same
+                               institution
+        pullups                number of debates between teams on different
+                               points
+        bracket_distance_total total points difference, over all debates
+        bracket_distance_max   largest points difference in a debate
+        side_imbalance         dict mapping (affirmatives - negatives),
+                               including this round, to number of teams"""
+
+    def __init__(self, debates, history=None, sides=None):
+        self.debates = 0
+        self.history_conflicts = 0
+        self.history_total = 0
+        rematches = Counter()
+        self.institution_conflicts = 0
+        self.pullups = 0
+        self.bracket_distance_total = 0
+        self.bracket_distance_max = 0
+        side_imbalance = Counter()
+
+        for debate in debates:
+            aff, neg = debate.aff_team, debate.neg_team
+            self.debates += 1
+
+            if history is None:
+                met = aff.seen(neg)
+            else:
+                met = history.get((aff.id, neg.id), 0)
+            rematches[met] += 1
+            self.history_total += met
+            if met:
+                self.history_conflicts += 1
+
+            if aff.institution == neg.institution:
+                self.institution_conflicts += 1
+
+            aff_points, neg_points = getattr(aff, 'points', None), getattr(neg, 'points', None)
+            if aff_points is not None and neg_points is not None:
+                distance = abs(aff_points - neg_points)
+                if distance:
+                    self.pullups += 1
+                self.bracket_distance_total += distance
+                self.bracket_distance_max = max(self.bracket_distance_max, distance)
+
+            for team, this_round in ((aff, 1), (neg, -1)):
+                if sides is None:
+                    before = getattr(team, 'aff_count', 0) - getattr(team, 'neg_count', 0)
+                else:
+                    before = sides.aff_count(team) - sides.neg_count(team)
+                side_imbalance[before + this_round] += 1
+
+        self.rematches = dict(rematches)
+        self.side_imbalance = dict(side_imbalance)
+
+    @property
+    def sorted_rematches(self):
+        return sorted(self.rematches.iteritems())
+
+    @property
+    def sorted_side_imbalance(self):
+        return sorted(self.side_imbalance.iteritems())
+
+    @property
+    def side_imbalanced_teams(self):
+        """Number of teams that will have taken one side at least twice more
+        than the other."""
+        return sum(n for imbalance, n in self.side_imbalance.iteritems() if abs(imbalance) > 1)
+
+    def badness(self, options):
+        """Returns a measure of how bad the draw is (lower is better), from
+        a draw generator's options: history and institution conflicts are
+        weighted by the 'history_penalty' and 'institution_penalty' options
+        (if avoided), and side imbalances count only if sides are balanced."""
+        score = self.pullups * PULLUP_PENALTY
+        if options["avoid_history"]:
+            score += self.history_total * options["history_penalty"]
+        if options["avoid_institution"]:
+            score += self.institution_conflicts * options["institution_penalty"]
+        if options["side_allocations"] == "balance":
+            score += self.side_imbalanced_teams * SIDE_PENALTY
+        return score
+
+    def as_dict(self):
+        return {
+            "debates": self.debates,
+            "history_conflicts": self.history_conflicts,
+            "history_total": self.history_total,
+            "rematches": self.rematches,
+            "institution_conflicts": self.institution_conflicts,
+            "pullups": self.pullups,
+            "bracket_distance_total": self.bracket_distance_total,
+            "bracket_distance_max": self.bracket_distance_max,
+            "side_imbalance": self.side_imbalance,
+            "side_imbalanced_teams": self.side_imbalanced_teams,
+        }
+
+
+def get_draw_diagnostics(round, draw=None):
+    """Returns DrawDiagnostics for the round's draw. 'draw', if given, should
+    be from Round.get_draw_with_standings(), which it is loaded with if not.
+    History and sides take one query each."""
+    from debate.history import get_team_history, SideHistory
+
+    if draw is None:
+        draw = round.get_draw_with_standings(round)
+    sides = SideHistory(round.prev) if round.prev else None
+    return DrawDiagnostics(draw, get_team_history(round), sides)
@@ -0,0 +1,181 @@
+"""Manual editing of a draft draw.
+
+Tab directors often swap teams between debates by hand after the draw is
+generated. DrawEditIndex holds what's needed to check a swap for conflicts:
+every team's institution and the history of which teams have met, loaded once
+per round and cached. With it, the change in conflicts from a swap is worked
+out from the four teams involved, without going through the draw.
+evaluate_swap() reports that change, and swap_teams() also saves the swap,
+updating only the two DebateTeams affected."""
+
+# cannot import debate.models at module level - would create circular dep
+
+DRAW_EDIT_INDEX_CACHE_TIMEOUT = 600
+
+
+class DrawEditIndex(object):
+    """Conflict index for a round.
+
+    Arguments:
+        institutions  dict mapping team ID to institution ID
+        history       dict mapping (team1_id, team2_id) to the number of
+                      times the teams have met before, as from
+                      get_team_history()"""
+
+    def __init__(self, institutions, history):
+        self.institutions = institutions
+        self.history = history
+
+    def conflicts(self, aff_id, neg_id):
+        """Returns a dict of the conflicts between two teams, given by ID:
+        'history' is the number of times they've met, and 'institution' is 1
+        if they're from the same institution, 0 otherwise."""
+        institution = self.institutions.get(aff_id)
+        return {
+            "history": self.history.get((aff_id, neg_id), 0),
+            "institution": int(institution is not None and institution == self.institutions.get(neg_id)),
+        }
+
+    def swap_delta(self, teams1, teams2, slot1, slot2):
+        """Returns the change in conflicts from swapping a team between two
+        debates. 'teams1' and 'teams2' are (aff_id, neg_id) tuples for the two
+        debates, and the team in 'slot1' (0 for affirmative, 1 for negative)
+        of the first swaps with the team in 'slot2' of the second. If 'teams2'
+        is None, the swap is within the first debate, so its teams swap sides.
+
+        Returns a dict with 'history' and 'institution', the change in the
+        number of previous meetings and institution conflicts over the
+        debates, and 'before' and 'after', each a list of the conflicts of
+        the debates, as from conflicts()."""
+        new1 = list(teams1)
+        if teams2 is None:
+            new1[slot1], new1[slot2] = teams1[slot2], teams1[slot1]
+            before = [self.conflicts(*teams1)]
+            after = [self.conflicts(*new1)]
+        else:
+            new2 = list(teams2)
+            new1[slot1], new2[slot2] = teams2[slot2], teams1[slot1]
+            before = [self.conflicts(*teams1), self.conflicts(*teams2)]
+            after = [self.conflicts(*new1), self.conflicts(*new2)]
+
+        delta = dict((key, sum(c[key] for c in after) - sum(c[key] for c in before))
+                for key in ("history", "institution"))
+        delta.update(before=before, after=after)
+        return delta
+
+
+def _cache_key(round):
+    return "draw_edit_index_{0:d}".format(round.id)
+
+
+def get_draw_edit_index(round, refresh=False):
+    """Returns the DrawEditIndex for the round, from the cache if it's there
+    (unless 'refresh' is True). Loading it takes two queries. The index
+    depends only on earlier rounds and the teams, so it doesn't change as the
+    round's draw is edited."""
+    from debate.models import Team
+    from debate.history import get_team_history
+    from django.core.cache import cache
+
+    key = _cache_key(round)
+    if not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return DrawEditIndex(*cached)
+
+    institutions = dict(Team.objects.filter(tournament=round.tournament).values_list(
+            'id', 'institution_id'))
+    history = get_team_history(round)
+    cache.set(key, (institutions, history), DRAW_EDIT_INDEX_CACHE_TIMEOUT)
+    return DrawEditIndex(institutions, history)
+
+
+def invalidate_draw_edit_index(round):
+    """Discards the cached DrawEditIndex for the round, including the one
+    that the Round itself holds (see Round.draw_edit_index), so that it's
+    loaded afresh when next needed."""
+    from django.core.cache import cache
+    cache.delete(_cache_key(round))
+    round.__dict__.pop('_draw_edit_index', None)
+
+
+def _position_slots():
+    from debate.models import DebateTeam
+    return {DebateTeam.POSITION_AFFIRMATIVE: 0, DebateTeam.POSITION_NEGATIVE: 1}
+
+
+def _load_debate_teams(round, debate_ids, lock=False):
+    """Returns a dict mapping each debate ID to a list of (debateteam_id,
+    team_id) for its affirmative and negative teams, in one query. Raises
+    ValueError if any of the debates isn't a debate in the round."""
+    from debate.models import DebateTeam
+    slot_of = _position_slots()
+
+    debateteams = DebateTeam.objects.filter(debate_id__in=debate_ids, debate__round=round)
+    if lock:
+        debateteams = debateteams.select_for_update()
+    slots = dict((debate_id, [None, None]) for debate_id in debate_ids)
+    for dt_id, debate_id, team_id, position in debateteams.values_list(
+            'id', 'debate_id', 'team_id', 'position'):
+        slots[debate_id][slot_of[position]] = (dt_id, team_id)
+    for debate_id, debate_slots in slots.iteritems():
+        if None in debate_slots:
+            raise ValueError("Debate {0} isn't a debate between two teams in {1}".format(debate_id, round))
+    return slots
+
+
+def _prepare_swap(round, debate1, side1, debate2, side2, index, lock=False):
+    """Loads the two debates and returns (slots, index, args), where 'args'
+    are the arguments for index.swap_delta(). 'side1' and 'side2' are
+    positions (DebateTeam.POSITION_*). If 'index' is None or doesn't know
+    all four teams (say, if a team was added since it was loaded), it's
+    loaded afresh."""
+    slot_of = _position_slots()
+    if side1 not in slot_of or side2 not in slot_of:
+        raise ValueError("Invalid position: {0!r}".format(side1 if side1 not in slot_of else side2))
+    if debate1 == debate2 and side1 == side2:
+        raise ValueError("Can't swap a team with itself")
+
+    slots = _load_debate_teams(round, set([debate1, debate2]), lock)
+    teams1 = tuple(team_id for dt_id, team_id in slots[debate1])
+    teams2 = tuple(team_id for dt_id, team_id in slots[debate2])
+
+    if index is None:
+        index = get_draw_edit_index(round)
+    if not all(team_id in index.institutions for team_id in teams1 + teams2):
+        index = get_draw_edit_index(round, refresh=True)
+
+    if debate1 == debate2:
+        teams2 = None
+    return slots, index, (teams1, teams2, slot_of[side1], slot_of[side2])
+
+
+def evaluate_swap(round, debate1, side1, debate2, side2, index=None):
+    """Returns the change in conflicts, as for DrawEditIndex.swap_delta(),
+    from swapping the team in position 'side1' of debate ID 'debate1' with
+    that in position 'side2' of debate ID 'debate2'. Takes one query, given
+    the index (which is got with get_draw_edit_index() if not given).
+    Raises ValueError if the swap isn't valid."""
+    slots, index, args = _prepare_swap(round, debate1, side1, debate2, side2, index)
+    return index.swap_delta(*args)
+
+
+def swap_teams(round, debate1, side1, debate2, side2, index=None):
+    """Swaps the team in position 'side1' of debate ID 'debate1' with that in
+    position 'side2' of debate ID 'debate2', and returns the change in
+    conflicts, as for evaluate_swap(). The two DebateTeams are locked while
+    they're read, then each updated with a single UPDATE, so DebateTeams and
+    Debates already loaded don't see the swap and should be loaded again.
+    The round's DrawEditIndex is invalidated afterwards."""
+    from debate.models import DebateTeam
+    from django.db import transaction
+
+    with transaction.atomic():
+        slots, index, args = _prepare_swap(round, debate1, side1, debate2, side2, index, lock=True)
+        delta = index.swap_delta(*args)
+        dt1, team1 = slots[debate1][args[2]]
+        dt2, team2 = slots[debate2][args[3]]
+        DebateTeam.objects.filter(id=dt1).update(team_id=team2)
+        DebateTeam.objects.filter(id=dt2).update(team_id=team1)
+    invalidate_draw_edit_index(round)
+    return delta
@@ -0,0 +1,110 @@
+"""Compact, database-free inputs for draw generation.
+
+The draw generators only need a few facts about each team: its ID,
+institution, standing, side history, allocated side, division and which teams
+it has met. TeamRecord holds just those, in slots, so that a draw's inputs
+can be built once from the database and then pickled to worker processes,
+cached or replayed (say, in benchmarks) without Django. Round.draw() builds
+them with make_team_records() and make_result_records().
+
+Institutions are represented by their IDs, and divisions by DivisionRecords,
+which are shared between the teams in a division. Every team record refers to
+the same history index, a dict mapping (team1_id, team2_id) to the number of
+times the two teams have met, as from get_team_history()."""
+
+# cannot import debate.models at module level - would create circular dep
+
+from draw import Pairing
+
+
+class _SlottedRecord(object):
+    """Base class for records with __slots__. Provides pickling, which
+    objects with __slots__ don't support by default (below protocol 2)."""
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class DivisionRecord(_SlottedRecord):
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return "<DivisionRecord {0} ({1})>".format(self.id, self.name)
+
+
+class TeamRecord(_SlottedRecord):
+    """A team, as the draw generators see it. 'history' is the history index
+    shared by all teams in the draw (or None, if history isn't needed)."""
+    __slots__ = ('id', 'institution', 'points', 'speaker_score', 'aff_count',
+            'neg_count', 'allocated_side', 'division', 'history')
+
+    def __init__(self, id, institution, points=None, speaker_score=None, aff_count=0,
+            neg_count=0, allocated_side=None, division=None, history=None):
+        self.id = id
+        self.institution = institution
+        self.points = points
+        self.speaker_score = speaker_score
+        self.aff_count = aff_count
+        self.neg_count = neg_count
+        self.allocated_side = allocated_side
+        self.division = division
+        self.history = history
+
+    def __repr__(self):
+        return "<TeamRecord {0} of {1}>".format(self.id, self.institution)
+
+    def seen(self, other):
+        """Returns the number of times this team has met 'other'."""
+        if self.history is None:
+            return 0
+        return self.history.get((self.id, other.id), 0)
+
+
+def make_team_records(teams, history=None, sides=None, allocated_sides=None):
+    """Returns a list of TeamRecords for the given teams, in the same order.
+
+    'teams' are Team objects, with 'points' and 'speaker_score' attributes
+    if they've been annotated with standings. 'history' is the history index.
+    'sides', if given, should have aff_count(team) and neg_count(team)
+    methods, like SideHistory; otherwise side counts are zero.
+    'allocated_sides', if given, maps team IDs to "aff" or "neg"."""
+    divisions = dict()
+    records = list()
+    for team in teams:
+        division = None
+        if team.division_id is not None:
+            if team.division_id not in divisions:
+                divisions[team.division_id] = DivisionRecord(team.division_id, team.division.name)
+            division = divisions[team.division_id]
+        record = TeamRecord(team.id, team.institution_id,
+                points=getattr(team, 'points', None),
+                speaker_score=getattr(team, 'speaker_score', None),
+                division=division, history=history)
+        if sides is not None:
+            record.aff_count = sides.aff_count(team)
+            record.neg_count = sides.neg_count(team)
+        if allocated_sides is not None:
+            record.allocated_side = allocated_sides.get(team.id)
+        records.append(record)
+    return records
+
+
+def make_result_records(results):
+    """Returns copies of the given Pairings (from get_elimination_results()),
+    with TeamRecords in place of teams."""
+    records = list()
+    for pairing in results:
+        teams = make_team_records(pairing.teams)
+        winner = teams[pairing.teams.index(pairing.winner)]
+        records.append(Pairing(teams, pairing.bracket, pairing.room_rank, pairing.flags,
+                winner=winner))
+    return records
@@ -0,0 +1,72 @@
+"""Bulk lookups of which teams have faced each other, for places that would
+otherwise ask Team.seen() once per pair."""
+
+# cannot import debate.models at module level - would create circular dep
+
+from collections import defaultdict
+
+
+def get_team_history(round):
+    """Returns a dict mapping (team1_id, team2_id) to the number of times the
+    two teams faced each other in rounds before 'round' (of any stage), with
+    both orders of each pair present. This is what Team.seen() counts, but for
+    every pair of teams in the tournament, from one query."""
+    from debate.models import DebateTeam
+
+    debateteams = DebateTeam.objects.filter(debate__round__tournament=round.tournament,
+            debate__round__seq__lt=round.seq).values_list('debate_id', 'team_id')
+
+    debates = defaultdict(list)
+    for debate_id, team_id in debateteams:
+        debates[debate_id].append(team_id)
+
+    history = defaultdict(int)
+    for team_ids in debates.itervalues():
+        for team1 in team_ids:
+            for team2 in team_ids:
+                if team1 != team2:
+                    history[(team1, team2)] += 1
+    return dict(history)
+
+
+class SideHistory(object):
+    """The side each team took in each preliminary round up to and including
+    a given round, for every team in the tournament, loaded in one query.
+    This is what Team.get_aff_count() and Team.get_neg_count() count, without
+    a query per team.
+
+    annotate() attaches the history to teams as 'side_history', which the
+    aff_count and neg_count template tags use if it's for the right round."""
+
+    def __init__(self, round):
+        from debate.models import DebateTeam, Round
+
+        self.seq = round.seq
+        debateteams = DebateTeam.objects.filter(debate__round__tournament=round.tournament,
+                debate__round__stage=Round.STAGE_PRELIMINARY, debate__round__seq__lte=round.seq
+                ).values_list('team_id', 'position').order_by('debate__round__seq')
+
+        self._sides = defaultdict(list)
+        for team_id, position in debateteams:
+            self._sides[team_id].append(position)
+
+    def sides(self, team):
+        """Returns a list of the team's positions (DebateTeam.POSITION_*), in
+        round order. Accepts a Team or team ID."""
+        return self._sides.get(getattr(team, 'id', team), [])
+
+    def count(self, team, position):
+        return self.sides(team).count(position)
+
+    def aff_count(self, team):
+        from debate.models import DebateTeam
+        return self.count(team, DebateTeam.POSITION_AFFIRMATIVE)
+
+    def neg_count(self, team):
+        from debate.models import DebateTeam
+        return self.count(team, DebateTeam.POSITION_NEGATIVE)
+
+    def annotate(self, teams):
+        for team in teams:
+            team.side_history = self
+        return teams
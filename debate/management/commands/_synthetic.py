@@ -0,0 +1,122 @@
+"""Builds large synthetic tournaments for benchmarking. This module begins with
+an underscore so that Django doesn't treat it as a management command."""
+
+import random
+
+import debate.models as m
+
+SPEAKERS_PER_TEAM = 3
+
+
+def _refetch(queryset, key):
+    """bulk_create() doesn't set primary keys on most backends, so we have to
+    read the objects back. Returns a dict mapping key(obj) to obj."""
+    return dict((key(obj), obj) for obj in queryset)
+
+
+def build_tournament(num_teams, num_rounds, num_institutions=None, seed=None):
+    """Creates a tournament with 'num_teams' teams and 'num_rounds' preliminary
+    rounds, every one of which has a random draw and a confirmed ballot for
+    every debate. Most objects are created using bulk_create(), so callers
+    should normally wrap this in a transaction. Returns the Tournament."""
+
+    rng = random.Random(seed)
+    num_teams -= num_teams % 2
+    if num_institutions is None:
+        num_institutions = max(num_teams // 4, 1)
+
+    tag = random.randint(0, 10**6) # not rng, so that repeated seeds don't clash
+    t = m.Tournament(name="Synthetic %d" % num_teams,
+            slug="synthetic-%d-%d" % (num_teams, tag))
+    t.save()
+
+    prefix = "SYN%d-" % tag
+    m.Institution.objects.bulk_create([m.Institution(code=prefix + str(i),
+            name="Synthetic Institution %d" % i, abbreviation="S%d" % i)
+            for i in xrange(num_institutions)])
+    institutions = list(m.Institution.objects.filter(code__startswith=prefix))
+
+    m.Team.objects.bulk_create([m.Team(tournament=t, reference=str(i),
+            short_reference=str(i), institution=institutions[i % num_institutions],
+            type=(m.Team.TYPE_ESL if rng.random() < 0.2 else m.Team.TYPE_NONE))
+            for i in xrange(num_teams)])
+    teams = list(m.Team.objects.filter(tournament=t))
+
+    # Speaker uses multi-table inheritance, so can't be bulk-created.
+    speakers = dict()
+    for team in teams:
+        speakers[team.id] = list()
+        for i in xrange(SPEAKERS_PER_TEAM):
+            speaker = m.Speaker(name="%s Speaker %d" % (team.reference, i),
+                    team=team, novice=rng.random() < 0.3)
+            speaker.save()
+            speakers[team.id].append(speaker)
+
+    m.Round.objects.bulk_create([m.Round(tournament=t, seq=seq,
+            name="Round %d" % seq, abbreviation="R%d" % seq,
+            draw_type=m.Round.DRAW_RANDOM, draw_status=m.Round.STATUS_CONFIRMED)
+            for seq in xrange(1, num_rounds+1)])
+    rounds = list(m.Round.objects.filter(tournament=t).order_by('seq'))
+    t.current_round = rounds[-1]
+    t.save()
+
+    strength = dict((team.id, rng.gauss(75, 2)) for team in teams)
+
+    for r in rounds:
+        rng.shuffle(teams)
+        pairs = [(teams[i], teams[i+1]) for i in xrange(0, num_teams, 2)]
+
+        m.Debate.objects.bulk_create([m.Debate(round=r, room_rank=i,
+                result_status=m.Debate.STATUS_CONFIRMED) for i in xrange(len(pairs))])
+        debates = _refetch(m.Debate.objects.filter(round=r), lambda d: d.room_rank)
+
+        debateteams = list()
+        for i, (aff, neg) in enumerate(pairs):
+            debateteams.append(m.DebateTeam(debate=debates[i], team=aff, position=m.DebateTeam.POSITION_AFFIRMATIVE))
+            debateteams.append(m.DebateTeam(debate=debates[i], team=neg, position=m.DebateTeam.POSITION_NEGATIVE))
+        m.DebateTeam.objects.bulk_create(debateteams)
+        debateteams = _refetch(m.DebateTeam.objects.filter(debate__round=r),
+                lambda dt: (dt.debate_id, dt.position))
+
+        m.BallotSubmission.objects.bulk_create([m.BallotSubmission(debate=debate,
+                version=1, submitter_type=m.Submission.SUBMITTER_TABROOM,
+                confirmed=True) for debate in debates.itervalues()])
+        ballotsubs = _refetch(m.BallotSubmission.objects.filter(debate__round=r),
+                lambda bs: bs.debate_id)
+
+        teamscores = list()
+        speakerscores = list()
+        for i, (aff, neg) in enumerate(pairs):
+            debate = debates[i]
+            ballotsub = ballotsubs[debate.id]
+            totals = dict()
+            for team, position in ((aff, m.DebateTeam.POSITION_AFFIRMATIVE), (neg, m.DebateTeam.POSITION_NEGATIVE)):
+                dt = debateteams[(debate.id, position)]
+                total = 0
+                for pos, speaker in enumerate(speakers[team.id], start=1):
+                    score = round(rng.gauss(strength[team.id], 1.5) * 2) / 2
+                    speakerscores.append(m.SpeakerScore(ballot_submission=ballotsub,
+                            debate_team=dt, speaker=speaker, score=score, position=pos))
+                    total += score
+                reply = round(rng.gauss(strength[team.id], 1.5)) / 2
+                speakerscores.append(m.SpeakerScore(ballot_submission=ballotsub,
+                        debate_team=dt, speaker=speakers[team.id][0], score=reply,
+                        position=SPEAKERS_PER_TEAM+1))
+                totals[position] = (dt, total + reply)
+
+            (aff_dt, aff_total), (neg_dt, neg_total) = totals[m.DebateTeam.POSITION_AFFIRMATIVE], totals[m.DebateTeam.POSITION_NEGATIVE]
+            if aff_total == neg_total:
+                aff_total += 0.5
+            aff_win = aff_total > neg_total
+            teamscores.append(m.TeamScore(ballot_submission=ballotsub, debate_team=aff_dt,
+                    points=int(aff_win), win=aff_win, score=aff_total, margin=aff_total-neg_total))
+            teamscores.append(m.TeamScore(ballot_submission=ballotsub, debate_team=neg_dt,
+                    points=int(not aff_win), win=not aff_win, score=neg_total, margin=neg_total-aff_total))
+
+        m.TeamScore.objects.bulk_create(teamscores)
+        m.SpeakerScore.objects.bulk_create(speakerscores)
+
+    # bulk_create() bypasses BallotSubmission.save(), so build this directly
+    m.TeamRoundSummary.objects.rebuild(t)
+
+    return t
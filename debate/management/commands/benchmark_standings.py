@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+import time
+
+import debate.models as m
+from debate.standings import get_team_totals
+from _synthetic import build_tournament
+
+LEGACY_EXTRA_QUERY = """
+    SELECT DISTINCT SUM({field:s})
+    FROM "debate_teamscore"
+    JOIN "debate_ballotsubmission" ON "debate_teamscore"."ballot_submission_id" = "debate_ballotsubmission"."id"
+    JOIN "debate_debateteam" ON "debate_teamscore"."debate_team_id" = "debate_debateteam"."id"
+    JOIN "debate_debate" ON "debate_debateteam"."debate_id" = "debate_debate"."id"
+    JOIN "debate_round" ON "debate_debate"."round_id" = "debate_round"."id"
+    WHERE "debate_ballotsubmission"."confirmed" = True
+    AND "debate_debateteam"."team_id" = "debate_team"."id"
+    AND "debate_round"."stage" = '""" + str(m.Round.STAGE_PRELIMINARY) + "'" + """
+    AND "debate_round"."seq" <= {round:d}"""
+
+
+def legacy_standings(round):
+    """The standings as they used to be computed, with three correlated
+    subqueries per team. Kept here only for comparison."""
+    teams = m.Team.objects.filter(tournament=round.tournament,
+            debateteam__debate__round__seq__lte=round.seq)
+    teams = teams.extra({
+        "points": LEGACY_EXTRA_QUERY.format(field="points", round=round.seq),
+        "speaker_score": LEGACY_EXTRA_QUERY.format(field="score", round=round.seq),
+        "margins": LEGACY_EXTRA_QUERY.format(field="margin", round=round.seq),
+    }).distinct()
+    return list(teams.order_by("-points", "-speaker_score"))
+
+
+def aggregate_standings(round):
+    """Totals from a single grouped aggregate over the raw results."""
+    teams = list(m.Team.objects.filter(tournament=round.tournament,
+            debateteam__debate__round__seq__lte=round.seq).distinct())
+    totals = get_team_totals([t.id for t in teams], round)
+    for team in teams:
+        row = totals.get(team.id, {})
+        team.points = row.get('points') or 0
+        team.speaker_score = row.get('speaker_score') or 0
+    teams.sort(key=lambda x: (x.points, x.speaker_score), reverse=True)
+    return teams
+
+
+def summary_standings(round):
+    """Totals read from the TeamRoundSummary table."""
+    return m.Team.objects.standings(round)
+
+
+class Command(BaseCommand):
+    args = '[num_teams [num_rounds [repeats]]]'
+    help = 'Builds a synthetic tournament and compares the number of queries ' \
+           'and time taken to compute team standings, old against new. ' \
+           'Nothing is saved to the database.'
+
+    def handle(self, *args, **options):
+        try:
+            num_teams, num_rounds, repeats = ([int(x) for x in args] + [400, 8, 3][len(args):])[:3]
+        except ValueError:
+            raise CommandError("Arguments must be integers")
+
+        with transaction.atomic():
+            self.stdout.write("Building tournament with %d teams and %d rounds..." % (num_teams, num_rounds))
+            t = build_tournament(num_teams, num_rounds, seed=0)
+            round = m.Round.objects.get(tournament=t, seq=num_rounds)
+            t.config.set('team_standings_rule', 'australs')
+
+            for name, func in (("legacy", legacy_standings), ("grouped", aggregate_standings),
+                    ("summary", summary_standings)):
+                times = list()
+                for i in xrange(repeats):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.time()
+                        standings = func(round)
+                        times.append(time.time() - start)
+                self.stdout.write("%-8s  teams: %4d  queries: %3d  best: %8.1f ms  mean: %8.1f ms" % (
+                        name, len(standings), len(queries), min(times) * 1000,
+                        sum(times) / len(times) * 1000))
+
+            transaction.set_rollback(True)
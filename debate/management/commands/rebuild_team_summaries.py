@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+import debate.models as m
+
+class Command(BaseCommand):
+    args = '[tournament_slug ...]'
+    help = 'Rebuilds the team round summaries (used for team standings) from ' \
+           'confirmed ballots, for the given tournaments or all tournaments'
+
+    def handle(self, *args, **options):
+        if args:
+            tournaments = list()
+            for slug in args:
+                try:
+                    tournaments.append(m.Tournament.objects.get(slug=slug))
+                except m.Tournament.DoesNotExist:
+                    raise CommandError("There's no tournament with slug '%s'" % slug)
+        else:
+            tournaments = m.Tournament.objects.all()
+
+        for t in tournaments:
+            m.TeamRoundSummary.objects.rebuild(t)
+            count = m.TeamRoundSummary.objects.filter(team__tournament=t).count()
+            self.stdout.write('Rebuilt %d team round summaries for %s' % (count, t.name))
@@ -0,0 +1,110 @@
+"""Minimum-cost assignment and bipartite matching, for conflict avoidance in
+draws.
+
+This module doesn't depend on Django; it needs only NumPy."""
+
+import numpy as np
+
+
+def min_cost_assignment(cost):
+    """Solves the assignment problem for an n-by-m cost matrix, n <= m, using
+    the Hungarian algorithm (in its shortest augmenting path form, O(n^2 m)).
+    Returns an array 'assignment' of length n, where row i is assigned to
+    column assignment[i], such that the sum of cost[i, assignment[i]] is as
+    small as possible. The inner loop over columns is vectorised, so this is
+    fast enough for a few hundred rows."""
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("Cost matrix must have no more rows than columns")
+
+    # Index 0 is a dummy column, so rows and columns are numbered from 1.
+    u = np.zeros(n + 1)          # row potentials
+    v = np.zeros(m + 1)          # column potentials
+    p = np.zeros(m + 1, dtype=int)   # row assigned to each column, 0 if none
+    way = np.zeros(m + 1, dtype=int) # previous column on the augmenting path
+
+    for i in xrange(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # Augment along the path found
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = np.zeros(n, dtype=int)
+    for j in xrange(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def max_bipartite_matching(compatible):
+    """Finds a maximum matching in a bipartite graph, given as an n-by-m
+    boolean matrix 'compatible', where compatible[i, j] says whether row i may
+    be matched with column j. Returns an array 'match' of length n, where row
+    i is matched with column match[i], or -1 if it is unmatched.
+
+    Rows are first matched greedily, in order, each to its first free
+    compatible column; then a breadth-first search for an augmenting path is
+    run from each row left over. Shuffle the rows and columns beforehand to
+    get a random matching."""
+    compatible = np.asarray(compatible, dtype=bool)
+    n, m = compatible.shape
+    neighbours = [np.nonzero(row)[0].tolist() for row in compatible]
+    match = [-1] * n        # column matched with each row
+    matched_by = [-1] * m   # row matched with each column
+
+    for i in xrange(n):
+        for j in neighbours[i]:
+            if matched_by[j] < 0:
+                match[i], matched_by[j] = j, i
+                break
+
+    for start in xrange(n):
+        if match[start] >= 0:
+            continue
+        # Breadth-first search over alternating paths from this row
+        came_from = dict()  # column -> row it was reached from
+        queue = [start]
+        end = -1
+        for i in queue:
+            for j in neighbours[i]:
+                if j in came_from:
+                    continue
+                came_from[j] = i
+                if matched_by[j] < 0:
+                    end = j
+                    break
+                queue.append(matched_by[j])
+            if end >= 0:
+                break
+        # Flip the matching along the path found, if any
+        while end >= 0:
+            i = came_from[end]
+            next_end = match[i]
+            match[i], matched_by[end] = end, i
+            end = next_end
+
+    return np.array(match, dtype=int)
@@ -1,17 +1,29 @@
 import random
 import re
-from django.db import models
+from django.db import models, transaction, connection, IntegrityError
 from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError, ObjectDoesNotExist, MultipleObjectsReturned
 
 from debate.utils import pair_list, memoize
 from debate.adjudicator.anneal import SAAllocator
 from debate.result import BallotSet
-from debate.draw import DrawGenerator, DrawError, DRAW_FLAG_DESCRIPTIONS
+from debate.draw import DrawError, DRAW_FLAG_DESCRIPTIONS
+from debate.draw_candidates import best_draw
+from debate.draw_input import make_team_records, make_result_records
+from debate.draw_editor import get_draw_edit_index
+from debate.standings import annotate_team_standings, get_standings_rule, rank_teams, subrank_teams
+from debate.standings import serialise_standings, deserialise_standings
+from debate.breaking import get_breaking_teams, invalidate_breaking_teams
+from debate.breaking import get_seeded_breaking_teams, get_elimination_results
+from debate.history import get_team_history, SideHistory
 
 from warnings import warn
-from threading import BoundedSemaphore
+from threading import BoundedSemaphore, Thread
 from collections import OrderedDict
+from datetime import timedelta
+import json
 
 
 class ScoreField(models.FloatField):
@@ -58,6 +70,7 @@ class Tournament(models.Model):
         next_round_seq = self.current_round.seq + 1
         next_round = Round.objects.get(seq=next_round_seq, tournament=self)
         if next_round in self.prelim_rounds():
+            StandingsSnapshot.objects.take(self.current_round)
             self.current_round = next_round
             self.save()
 
@@ -143,243 +156,48 @@ class Institution(models.Model):
             return self.code[:5]
 
 
-def annotate_team_standings(teams, round=None, shuffle=False):
-    """Accepts a QuerySet, returns a list.
-    If 'shuffle' is True, it shuffles the list before sorting so that teams that
-    are equal are in random order. This should be turned on for draw generation,
-    and turned off for display."""
-    # This is what might be more concisely expressed, if it were permissible
-    # in Django, as:
-    # teams = teams.annotate_if(
-    #     dict(points = models.Count('debateteam__teamscore__points'),
-    #     speaker_score = models.Count('debateteam__teamscore__score')),
-    #     dict(debateteam__teamscore__ballot_submission__confirmed = True)
-    # )
-    # That is, it adds up all the wins and points of each team on CONFIRMED
-    # ballots and adds them as columns to the table it returns.
-    # The standings include only preliminary rounds.
-
-    EXTRA_QUERY = """
-        SELECT DISTINCT SUM({field:s})
-        FROM "debate_teamscore"
-        JOIN "debate_ballotsubmission" ON "debate_teamscore"."ballot_submission_id" = "debate_ballotsubmission"."id"
-        JOIN "debate_debateteam" ON "debate_teamscore"."debate_team_id" = "debate_debateteam"."id"
-        JOIN "debate_debate" ON "debate_debateteam"."debate_id" = "debate_debate"."id"
-        JOIN "debate_round" ON "debate_debate"."round_id" = "debate_round"."id"
-        WHERE "debate_ballotsubmission"."confirmed" = True
-        AND "debate_debateteam"."team_id" = "debate_team"."id"
-        AND "debate_round"."stage" = '""" + str(Round.STAGE_PRELIMINARY) + "\'"
-
-    if round is not None:
-        EXTRA_QUERY += """AND "debate_round"."seq" <= {round:d}""".format(round=round.seq)
-
-    teams = teams.extra({
-        "points": EXTRA_QUERY.format(field="points"),
-        "speaker_score": EXTRA_QUERY.format(field="score"),
-        "margins": EXTRA_QUERY.format(field="margin"),
-    }).distinct()
-
-    # Extract which rule to use from the tournament config
-    if round is not None:
-        tournament = round.tournament
-    else:
-        tournament = teams[0].tournament
-    rule = tournament.config.get('team_standings_rule')
-
-    if rule == "australs":
-
-        if shuffle:
-            sorted_teams = list(teams)
-            random.shuffle(sorted_teams) # shuffle first, so that if teams are truly equal, they'll be in random order
-            sorted_teams.sort(key=lambda x: (x.points, x.speaker_score), reverse=True)
-            return sorted_teams
-        else:
-            teams = teams.order_by("-points", "-speaker_score")
-            return list(teams)
-
-    elif rule == "nz":
-
-        # Add draw strength annotation.
-        for team in teams:
-            draw_strength = 0
-            # Find all teams that they've faced.
-            debateteam_set = team.debateteam_set.all()
-            if round is not None:
-                debateteam_set = debateteam_set.filter(debate__round__seq__lte=round.seq)
-            for dt in debateteam_set:
-                # Can't just use dt.opposition.team.points, as dt.opposition.team isn't annotated.
-                draw_strength += teams.get(id=dt.opposition.team.id).points
-            team.draw_strength = draw_strength
-
-        def who_beat_whom(team1, team2):
-            """Returns a positive value if team1 won more debates, a negative value
-            if team2 won more, 0 if the teams won the same number against each other
-            or haven't faced each other."""
-            # Find all debates between these two teams
-            def get_wins(team, other):
-                ts =  TeamScore.objects.filter(
-                    ballot_submission__confirmed=True,
-                    debate_team__team=team,
-                    debate_team__debate__debateteam__team=other).aggregate(models.Sum('points'))
-                return ts["points__sum"]
-            wins1 = get_wins(team1, team2)
-            wins2 = get_wins(team2, team1)
-            # Print this to the logs, just so we know it happened
-            print "who beat whom, {0} vs {1}: {2} wins against {3}".format(team1, team2, wins1, wins2)
-            return cmp(wins1, wins2)
-
-        def cmp_teams(team1, team2):
-            """Returns 1 if team1 ranks ahead of team2, -1 if team2 ranks ahead of team1,
-            and 0 if they rank the same. Requires access to teams, so that it knows whether
-            it can apply who-beat-whom."""
-            # If there are only two teams on this number of points, or points/speakers,
-            # or points/speaks/draw-strength, then use who-beat-whom.
-            def two_teams_left(key):
-                return key(team1) == key(team2) and len(filter(lambda x: key(x) == key(team1), teams)) == 2
-            if two_teams_left(lambda x: x.points) or two_teams_left(lambda x: (x.points, x.speaker_score)) \
-                    or two_teams_left(lambda x: (x.points, x.speaker_score, x.draw_strength)):
-                winner = who_beat_whom(team1, team2)
-                if winner != 0: # if this doesn't help, keep going
-                    return winner
-            key = lambda x: (x.points, x.speaker_score, x.draw_strength)
-            return cmp(key(team1), key(team2))
-
-        sorted_teams = list(teams)
-        if shuffle:
-            random.shuffle(sorted_teams) # shuffle first, so that if teams are truly equal, they'll be in random order
-        sorted_teams.sort(cmp=cmp_teams, reverse=True)
-        return sorted_teams
-
-    elif rule == "wadl":
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error("logging for %s rules" % rule)
-
-        # Sort by points
-        if shuffle:
-            sorted_teams = list(teams)
-            random.shuffle(sorted_teams) # shuffle first, so that if teams are truly equal, they'll be in random order
-            sorted_teams.sort(key=lambda x: (x.points, x.margins), reverse=True)
-            return sorted_teams
-        else:
-            teams = teams.order_by("-points", "-margins")
-            return list(teams)
-
-    else:
-        raise ValueError("Invalid team_standings_rule option: {0}".format(rule))
-
-
 class TeamManager(models.Manager):
     def standings(self, round):
-        """Returns a list."""
-        teams = self.filter(
-            tournament = round.tournament,
-            debateteam__debate__round__seq__lte = round.seq,
-        )
-        return annotate_team_standings(teams, round)
+        """Returns a list. Loaded from the round's standings snapshot if there
+        is one, in which case the teams are also ranked and subranked."""
+        teams = self._snapshot_standings(round)
+        if teams is None:
+            teams = self._live_standings(round)
+        return teams
 
     def ranked_standings(self, round):
         """Returns a list."""
-
-        teams = self.standings(round)
-
-        prev_rank_value = (None, None)
-        current_rank = 0
-        for i, team in enumerate(teams, start=1):
-            rank_value = (team.points, team.speaker_score)
-            if rank_value != prev_rank_value:
-                current_rank = i
-                prev_rank_value = rank_value
-            team.rank = current_rank
-
+        teams = self._snapshot_standings(round)
+        if teams is None:
+            teams = rank_teams(self._live_standings(round), get_standings_rule(round.tournament).metrics)
         return teams
 
     def subrank_standings(self, round):
         """Returns a list."""
-        teams = self.standings(round)
-
-        prev_rank_value = None
-        prev_points = None
-        current_rank = 0
-        for team in teams:
-            if team.points != prev_points:
-                counter = 1
-                prev_points = team.points
-            rank_value = team.speaker_score
-            if rank_value != prev_rank_value:
-                current_rank = counter
-                prev_rank_value = rank_value
-            team.subrank = current_rank
-            counter += 1
-
+        teams = self._snapshot_standings(round)
+        if teams is None:
+            teams = subrank_teams(self._live_standings(round), get_standings_rule(round.tournament).metrics)
         return teams
 
-    def breaking_teams(self, tournament, category='open'):
-        """Returns a list."""
-
-        FILTER_ARGS = {
-            'open': dict(),
-            'esl':  dict(type=Team.TYPE_ESL),
-        }
-        filterargs = FILTER_ARGS[category]
-
-        teams = self.filter(tournament=tournament, **filterargs)
-        teams = annotate_team_standings(teams)
-
-        BREAK_SIZE_CONFIG_OPTIONS = {
-            'open': 'break_size',
-            'esl':  'esl_break_size',
-        }
-        break_size = tournament.config.get(BREAK_SIZE_CONFIG_OPTIONS[category])
-        institution_cap = tournament.config.get('institution_cap')
-
-        prev_rank_value = (None, None)
-        current_rank = 0
-        breaking_teams = list()
-
-        # Variables for insutitional caps and non-breaking teams:
-        current_break_rank = 0
-        current_break_seq = 0
-        from collections import Counter
-        teams_from_institution = Counter()
-
-        for i, team in enumerate(teams, start=1):
-
-            # Overall rank
-            rank_value = (team.points, team.speaker_score)
-            new_rank = rank_value != prev_rank_value
-            if new_rank:
-                current_rank = i
-                prev_rank_value = rank_value
-            team.rank = current_rank
-
-
-            # Increment current_break_seq if it won't violate institution cap
-            if institution_cap > 0 and teams_from_institution[team.institution] >= institution_cap:
-                if new_rank and current_break_rank == break_size:
-                    break
-                team.break_rank = "- (Capped)"
-            elif team.cannot_break == True:
-                if new_rank and current_break_rank == break_size:
-                    break
-                team.break_rank = "- (Ineligible)"
-            else:
-                current_break_seq += 1
-                if new_rank:
-                    if current_break_rank == break_size:
-                        break
-                    current_break_rank = current_break_seq
-                team.break_rank = current_break_rank
-
-            if current_break_rank > break_size:
-                break
+    def _standings_queryset(self, round):
+        return self.filter(
+            tournament = round.tournament,
+            debateteam__debate__round__seq__lte = round.seq,
+        ).distinct().select_related('institution', 'division').prefetch_related('speaker_set')
 
-            # Take note of the institution
-            teams_from_institution[team.institution] += 1
+    def _live_standings(self, round):
+        return annotate_team_standings(self._standings_queryset(round), round)
 
-            breaking_teams.append(team)
+    def _snapshot_standings(self, round):
+        snapshot = StandingsSnapshot.objects.lookup(round)
+        if snapshot is None:
+            return None
+        return deserialise_standings(snapshot.standings, self._standings_queryset(round))
 
-        return breaking_teams
+    def breaking_teams(self, tournament, category='open'):
+        """Returns a list. All break categories are computed together (and
+        cached), so asking for another category afterwards is cheap."""
+        return get_breaking_teams(tournament)[category]
 
 
 class Division(models.Model):
@@ -436,6 +254,10 @@ class Team(models.Model):
     def __unicode__(self):
         return self.short_name
 
+    def save(self, *args, **kwargs):
+        super(Team, self).save(*args, **kwargs)
+        invalidate_breaking_teams(self.tournament_id)
+
     @property
     def name(self):
         # TODO make this an exception so that we get rid of all of them
@@ -517,132 +339,33 @@ class TeamVenuePreference(models.Model):
 
 
 class SpeakerManager(models.Manager):
-    def standings(self, round=None):
-        # only include scoresheets for up to this round, exclude replies
-        if round:
-            speakers = self.filter(
-                team__tournament=round.tournament,
-                speakerscore__position__lte=round.tournament.LAST_SUBSTANTIVE_POSITION,
-                speakerscore__debate_team__debate__round__seq__lte = round.seq,
-            )
-        else:
-            speakers = self.filter(
-                team__tournament=round.tournament,
-                speakerscore__position__lte=round.tournament.LAST_SUBSTANTIVE_POSITION,
-            )
-
-        # TODO is there a way to add round scores without so many database hits?
-        # Maybe using a select subquery?
-
-        # This is what might be more concisely expressed, if it were permissible
-        # in Django, as:
-        # speakers = speakers.annotate_if(
-        #     dict(total = models.Sum('speakerscore__score')),
-        #     dict(ballot_submission__confirmed = True)
-        # )
-        # That is, it adds up all the points of each speaker on CONFIRMED
-        # ballots and adds them as columns to the table it returns.
-        EXTRA_QUERY = """
-            SELECT DISTINCT {aggregator:s}("score")
-            FROM "debate_speakerscore"
-            JOIN "debate_debateteam" ON "debate_speakerscore"."debate_team_id" = "debate_debateteam"."id"
-            JOIN "debate_debate" ON "debate_debateteam"."debate_id" = "debate_debate"."id"
-            JOIN "debate_round" ON "debate_debate"."round_id" = "debate_round"."id"
-            JOIN "debate_ballotsubmission" ON "debate_speakerscore"."ballot_submission_id" = "debate_ballotsubmission"."id"
-            WHERE "debate_ballotsubmission"."confirmed" = True
-            AND "debate_speakerscore"."speaker_id" = "debate_speaker"."person_ptr_id"
-            AND "debate_speakerscore"."position" <= {position:d}
-            AND "debate_round"."seq" <= {round:d}
-            AND "debate_round"."stage" = '{stage}'
-        """
-        speakers = speakers.extra({"total": EXTRA_QUERY.format(
-            aggregator = "SUM",
-            round = round.seq,
-            position = round.tournament.LAST_SUBSTANTIVE_POSITION,
-            stage = round.STAGE_PRELIMINARY,
-        ), "average": EXTRA_QUERY.format(
-            aggregator = "AVG",
-            round = round.seq,
-            position = round.tournament.LAST_SUBSTANTIVE_POSITION,
-            stage = round.STAGE_PRELIMINARY,
-        )}).distinct().order_by('-total')
-
-        prev_total = None
-        current_rank = 0
-        for i, speaker in enumerate(speakers, start=1):
-            if speaker.total != prev_total:
-                current_rank = i
-                prev_total = speaker.total
-            speaker.rank = current_rank
-
+    def standings(self, round):
+        """Returns a list of speakers with confirmed (substantive) scores up to
+        and including this round, each annotated with 'total', 'average',
+        'rank' and 'scores' (one for each preliminary round), best first."""
+        from debate.tab import SpeakerScoreMatrix
+        matrix = SpeakerScoreMatrix(round)
+        speakers = list(self.filter(id__in=matrix.speaker_ids).select_related(
+                'team', 'team__institution').prefetch_related('team__speaker_set'))
+        matrix.annotate(speakers)
+        speakers.sort(key=lambda s: s.rank)
         return speakers
 
-    def reply_standings(self, round=None):
+    def reply_standings(self, round):
+        """Returns a list of speakers with confirmed reply scores up to and
+        including this round, each annotated with 'average', 'replies',
+        'rank' and 'scores' (one for each preliminary round), best first."""
         # If replies aren't enabled, return an empty queryset.
         if not round.tournament.config.get('reply_scores_enabled'):
-            return self.objects.none()
-
-        if round:
-            speakers = self.filter(
-                team__tournament=round.tournament,
-                speakerscore__position=round.tournament.REPLY_POSITION,
-                speakerscore__debate_team__debate__round__seq__lte =
-                round.seq,
-            )
-        else:
-            speakers = self.filter(
-                team__tournament=round.tournament,
-                speakerscore__position=round.tournament.REPLY_POSITION,
-            )
-
-        # This is what might be more concisely expressed, if it were permissible
-        # in Django, as:
-        # speakers = speakers.annotate_if(
-        #     dict(average = models.Avg('speakerscore__score'),
-        #          count   = models.Count('speakerscore__score')),
-        #     dict(ballot_submission__confirmed = True)
-        # )
-        # That is, it adds up all the reply scores of each speaker on CONFIRMED
-        # ballots and adds them as columns to the table it returns.
-        EXTRA_QUERY = """
-            SELECT DISTINCT {aggregator:s}("score")
-            FROM "debate_speakerscore"
-            JOIN "debate_debateteam" ON "debate_speakerscore"."debate_team_id" = "debate_debateteam"."id"
-            JOIN "debate_debate" ON "debate_debateteam"."debate_id" = "debate_debate"."id"
-            JOIN "debate_round" ON "debate_debate"."round_id" = "debate_round"."id"
-            JOIN "debate_ballotsubmission" ON "debate_speakerscore"."ballot_submission_id" = "debate_ballotsubmission"."id"
-            WHERE "debate_ballotsubmission"."confirmed" = True
-            AND "debate_speakerscore"."speaker_id" = "debate_speaker"."person_ptr_id"
-            AND "debate_speakerscore"."position" = {position:d}
-            AND "debate_round"."seq" <= {round:d}
-            AND "debate_round"."stage" = '{stage}'
-        """
-        speakers = speakers.extra({"average": EXTRA_QUERY.format(
-            aggregator = "AVG",
-            round = round.seq,
-            position = round.tournament.REPLY_POSITION,
-            stage = round.STAGE_PRELIMINARY
-        ), "replies": EXTRA_QUERY.format(
-            aggregator = "COUNT",
-            round = round.seq,
-            position = round.tournament.REPLY_POSITION,
-            stage = round.STAGE_PRELIMINARY
-        )}).distinct().order_by('-average', '-replies', 'name')
-
-        # Use this to filter out speakers with an unconfirmed ballot submission,
-        # since they get caught up in the query above.
-        speakers_filtered = filter(lambda x: x.replies > 0, speakers)
-
-        prev_rank_value = (None, None)
-        current_rank = 0
-        for i, speaker in enumerate(speakers_filtered, start=1):
-            rank_value = (speaker.average, speaker.replies)
-            if rank_value != prev_rank_value:
-                current_rank = i
-                prev_rank_value = rank_value
-            speaker.rank = current_rank
-
-        return speakers_filtered
+            return self.none()
+
+        from debate.tab import SpeakerScoreMatrix
+        matrix = SpeakerScoreMatrix(round, replies=True)
+        speakers = list(self.filter(id__in=matrix.speaker_ids).select_related(
+                'team', 'team__institution').prefetch_related('team__speaker_set'))
+        matrix.annotate(speakers)
+        speakers.sort(key=lambda s: (s.rank, s.name))
+        return speakers
 
 
 class Person(models.Model):
@@ -865,12 +588,27 @@ class Round(models.Model):
     def motions(self):
         return self.motion_set.order_by('seq')
 
-    def draw(self):
+    def draw(self, progress=None):
+        """Generates the draw for this round and saves it. 'progress', if
+        given, is called with the name of each phase as it starts: "standings",
+        then those of the draw generator (see BaseDrawGenerator.progress), then
+        "save"."""
         if self.draw_status != self.STATUS_NONE:
             raise RuntimeError("Tried to run draw on round that already has a draw")
-
-        # Delete all existing debates for this round.
+        if progress is not None:
+            progress("standings")
+
+        # Delete all existing debates for this round. Any results go with
+        # them, so the teams' summaries (whose cumulative totals run through
+        # later rounds) are rebuilt.
+        if TeamRoundSummary.objects.filter(round=self).exists():
+            team_ids = list(DebateTeam.objects.filter(debate__round=self).values_list('team_id', flat=True))
+        else:
+            team_ids = []
         Debate.objects.filter(round=self).delete()
+        if team_ids:
+            TeamRoundSummary.objects.update_for_teams(team_ids)
+            StandingsSnapshot.objects.results_changed(self)
 
         # There is a bit of logic to go through to figure out what we need to
         # provide to the draw class.
@@ -882,15 +620,20 @@ class Round(models.Model):
             "side_allocations"   : "draw_side_allocations",
         }
 
+        # Division names are used for round robins, so load them now
+        active_teams = self.active_teams.select_related('division')
+        results = None
+
         # Set type-specific options
         if self.draw_type == self.DRAW_RANDOM:
-            teams = self.active_teams.all()
+            teams = active_teams
             draw_type = "random"
             OPTIONS_TO_CONFIG_MAPPING.update({
                 "avoid_conflicts" : "draw_avoid_conflicts",
+                "conflict_method" : "draw_random_conflict_method",
             })
         elif self.draw_type == self.DRAW_POWERPAIRED:
-            teams = annotate_team_standings(self.active_teams, self.prev, shuffle=True)
+            teams = annotate_team_standings(active_teams, self.prev, shuffle=True)
             draw_type = "power_paired"
             OPTIONS_TO_CONFIG_MAPPING.update({
                 "avoid_conflicts" : "draw_avoid_conflicts",
@@ -898,36 +641,74 @@ class Round(models.Model):
                 "pairing_method"  : "draw_pairing_method",
             })
         elif self.draw_type == self.DRAW_ROUNDROBIN:
-            teams = self.active_teams.all()
+            teams = active_teams
             draw_type = "round_robin"
+        elif self.draw_type == self.DRAW_FIRSTBREAK:
+            teams = get_seeded_breaking_teams(self.tournament)
+            draw_type = "first_elimination"
+        elif self.draw_type == self.DRAW_BREAK:
+            if self.prev is None:
+                raise DrawError("There is no previous elimination round to draw from.")
+            results = get_elimination_results(self.prev)
+            if self.prev.draw_type == self.DRAW_FIRSTBREAK:
+                # Teams that bypassed the first elimination round join now
+                debated = set(team.id for pairing in results for team in pairing.teams)
+                teams = [team for team in get_seeded_breaking_teams(self.tournament)
+                        if team.id not in debated]
+            else:
+                teams = []
+            draw_type = "elimination"
         else:
-            raise RuntimeError("Break rounds aren't supported yet.")
-
-        # Annotate attributes as required by DrawGenerator.
-        if self.prev:
-            for team in teams:
-                team.aff_count = team.get_aff_count(self.prev.seq)
+            raise RuntimeError("Unrecognised draw type: {0!r}".format(self.draw_type))
+
+        # Build the draw inputs, so that the draw generator needn't touch the
+        # database. Other draws come from a fixed schedule or the break, so
+        # don't need any history.
+        if draw_type in ["random", "power_paired"]:
+            history = get_team_history(self)
+            sides = SideHistory(self.prev) if self.prev else None
         else:
-            for team in teams:
-                team.aff_count = 0
+            history = None
+            sides = None
 
-        # Evaluate this query set first to avoid hitting the database inside a loop.
-        tpas = dict()
         TPA_MAP = {TeamPositionAllocation.POSITION_AFFIRMATIVE: "aff",
             TeamPositionAllocation.POSITION_NEGATIVE: "neg"}
-        for tpa in self.teampositionallocation_set.all():
-            tpas[tpa.team] = TPA_MAP[tpa.position]
-        for team in teams:
-            if team in tpas:
-                team.allocated_side = tpas[team]
-        del tpas
+        allocated_sides = dict((team_id, TPA_MAP[position]) for team_id, position in
+                self.teampositionallocation_set.values_list('team_id', 'position'))
+
+        teams = make_team_records(teams, history, sides, allocated_sides)
+        if results is not None:
+            results = make_result_records(results)
 
         options = dict()
         for key, value in OPTIONS_TO_CONFIG_MAPPING.iteritems():
             options[key] = self.tournament.config.get(value)
-
-        drawer = DrawGenerator(draw_type, teams, results=None, **options)
-        draw = drawer.make_draw()
+        if draw_type == "round_robin":
+            options["round_number"] = self.tournament.prelim_rounds(before=self).filter(
+                    draw_type=self.DRAW_ROUNDROBIN).count() + 1
+            # Schedules come from whole divisions, so that they don't shift
+            # when teams are absent
+            rosters = dict()
+            for division_id, team_id in Team.objects.filter(
+                    division__in=set(team.division.id for team in teams if team.division)
+                    ).values_list('division_id', 'id'):
+                rosters.setdefault(division_id, []).append(team_id)
+            options["rosters"] = rosters
+        elif draw_type == "first_elimination":
+            options["break_size"] = len(teams)
+
+        if draw_type in ["random", "power_paired"]:
+            candidates = self.tournament.config.get('draw_candidates')
+        else:
+            candidates = 1
+        # If best_draw() forks worker processes, they mustn't share this
+        # connection, so it's closed just before. It's reopened when the draw
+        # is saved.
+        draw = best_draw(draw_type, teams, results, options, candidates,
+                self.tournament.config.get('draw_candidates_time_limit'), progress=progress,
+                before_fork=connection.close)
+        if progress is not None:
+            progress("save")
         self.make_debates(draw)
         self.draw_status = self.STATUS_DRAFT
         self.save()
@@ -980,17 +761,51 @@ class Round(models.Model):
         draw_by_team.sort(key=lambda x: str(x[0]))
         return draw_by_team
 
+    def get_draw_with_teams(self):
+        """Returns the draw as a list, with the DebateTeams of every debate
+        loaded in one query (along with their teams and institutions), and the
+        teams' speakers in one more, so that debate.aff_team and
+        debate.neg_team don't need their own queries."""
+        draw = list(self.get_draw().select_related('venue', 'division'))
+        debateteams = DebateTeam.objects.filter(debate__round=self).select_related(
+                'team', 'team__institution', 'team__division').prefetch_related('team__speaker_set')
+        by_debate = dict()
+        for dt in debateteams:
+            by_debate.setdefault(dt.debate_id, dict())[dt.position] = dt
+        for debate in draw:
+            debate.round = self
+            debate._team_cache = by_debate.get(debate.id, dict())
+        return draw
+
+    @property
+    def draw_edit_index(self):
+        """The round's DrawEditIndex (see debate.draw_editor), got once per
+        Round object."""
+        if not hasattr(self, '_draw_edit_index'):
+            self._draw_edit_index = get_draw_edit_index(self)
+        return self._draw_edit_index
+
     def get_draw_with_standings(self, round):
-        draw = self.get_draw()
+        """Returns the draw as a list, with each team annotated with its
+        standings as of the previous round, and each debate with its history
+        conflicts. Uses a fixed number of queries."""
+        draw = self.get_draw_with_teams()
+
+        history = get_team_history(self)
+        for debate in draw:
+            debate._draw_history = history.get((debate.aff_team.id, debate.neg_team.id), 0)
+
         if round.prev:
-            standings = list(Team.objects.subrank_standings(round.prev))
+            sides = SideHistory(round.prev)
+            for debate in draw:
+                sides.annotate((debate.aff_team, debate.neg_team))
+
+            standings = dict((team.id, team) for team in Team.objects.subrank_standings(round.prev))
             for debate in draw:
                 for side in ('aff_team', 'neg_team'):
-                    # TODO is there a more efficient way to do this?
                     team = getattr(debate, side)
-                    annotated_team = filter(lambda x: x == team, standings)
-                    if len(annotated_team) == 1:
-                        annotated_team = annotated_team[0]
+                    annotated_team = standings.get(team.id)
+                    if annotated_team is not None:
                         team.points = annotated_team.points
                         team.speaker_score = annotated_team.speaker_score
                         team.subrank = annotated_team.subrank
@@ -999,6 +814,10 @@ class Round(models.Model):
         return draw
 
     def make_debates(self, pairings):
+        """Writes the debates for the given pairings, all in one transaction,
+        so that either the whole draw is written or none of it is. Debates
+        and debate teams are each inserted in bulk. Teams and divisions in the
+        pairings need only have IDs, so they can be TeamRecords."""
 
         import random
         venues = list(self.active_venues.order_by('-priority'))[:len(pairings)]
@@ -1009,19 +828,29 @@ class Round(models.Model):
         random.shuffle(venues)
         random.shuffle(pairings) # to avoid IDs indicating room raks
 
-        for pairing in pairings:
-            debate = Debate(round=self, venue=venues.pop(0))
+        debates = list()
+        for pairing, venue in zip(pairings, venues):
+            debate = Debate(round=self, venue=venue)
             debate.bracket   = pairing.bracket
             debate.room_rank = pairing.room_rank
             debate.flags     = ",".join(pairing.flags) # comma-separated list
-            debate.division  = pairing.division
-            debate.save()
-
-            aff = DebateTeam(debate=debate, team=pairing.teams[0], position=DebateTeam.POSITION_AFFIRMATIVE)
-            neg = DebateTeam(debate=debate, team=pairing.teams[1], position=DebateTeam.POSITION_NEGATIVE)
-
-            aff.save()
-            neg.save()
+            debate.division_id = pairing.division.id if pairing.division is not None else None
+            debates.append(debate)
+
+        with transaction.atomic():
+            Debate.objects.bulk_create(debates)
+
+            # bulk_create() doesn't set primary keys, but each debate in the
+            # round has its own venue, so look them up by venue.
+            debate_ids = dict(Debate.objects.filter(round=self).values_list('venue_id', 'id'))
+            debateteams = list()
+            for pairing, venue in zip(pairings, venues):
+                debate_id = debate_ids[venue.id]
+                debateteams.append(DebateTeam(debate_id=debate_id, team_id=pairing.teams[0].id,
+                        position=DebateTeam.POSITION_AFFIRMATIVE))
+                debateteams.append(DebateTeam(debate_id=debate_id, team_id=pairing.teams[1].id,
+                        position=DebateTeam.POSITION_NEGATIVE))
+            DebateTeam.objects.bulk_create(debateteams)
 
     def base_availability(self, model, active_table, active_column, model_table,
                          id_field='id'):
@@ -1306,7 +1135,12 @@ class Debate(models.Model):
     @property
     def draw_conflicts(self):
         d = []
-        history = self.aff_team.seen(self.neg_team, before_round=self.round.seq)
+        # Round.get_draw_with_standings() fills in _draw_history in bulk;
+        # otherwise use the round's draw editing index, loaded once
+        history = getattr(self, '_draw_history', None)
+        if history is None:
+            history = self.round.draw_edit_index.conflicts(
+                    self.aff_team.id, self.neg_team.id)["history"]
         if history:
             d.append("History conflict (%d)" % history)
         if self.aff_team.institution == self.neg_team.institution:
@@ -1645,6 +1479,16 @@ class BallotSubmission(Submission):
     class Meta:
         unique_together = [('debate', 'version')]
 
+    def __init__(self, *args, **kwargs):
+        super(BallotSubmission, self).__init__(*args, **kwargs)
+        self.confirmed_when_saved = self.confirmed if self.pk is not None else False
+
+    def save(self, *args, **kwargs):
+        # The team round summaries aren't updated here, since the scores
+        # usually haven't been saved yet; BallotSet.save() updates them.
+        super(BallotSubmission, self).save(*args, **kwargs)
+        self.confirmed_when_saved = self.confirmed
+
     def __unicode__(self):
         return 'Ballot for ' + unicode(self.debate) + ' submitted at ' + unicode(self.timestamp.isoformat())
 
@@ -1737,6 +1581,326 @@ class TeamScore(models.Model):
         unique_together = [('debate_team', 'ballot_submission')]
 
 
+class TeamRoundSummaryManager(models.Manager):
+
+    def update_for_teams(self, teams):
+        """Recomputes all summary rows for the given teams (or team IDs) from
+        their confirmed TeamScores. Should be called whenever a ballot involving
+        any of these teams is confirmed, unconfirmed or changed."""
+        team_ids = [getattr(team, 'id', team) for team in teams]
+        if not team_ids:
+            return
+
+        scores = TeamScore.objects.filter(
+            ballot_submission__confirmed = True,
+            debate_team__team_id__in = team_ids,
+            debate_team__debate__round__stage = Round.STAGE_PRELIMINARY,
+        ).values('debate_team_id', 'debate_team__team_id', 'debate_team__debate_id',
+            'debate_team__debate__round_id', 'debate_team__debate__round__seq',
+            'points', 'score', 'margin', 'win'
+        ).order_by('debate_team__team_id', 'debate_team__debate__round__seq')
+        scores = list(scores)
+
+        # Find the opposition for each debate
+        teams_in_debate = dict()
+        for dt in DebateTeam.objects.filter(debate_id__in=set(s['debate_team__debate_id'] for s in scores)).values('debate_id', 'team_id'):
+            teams_in_debate.setdefault(dt['debate_id'], []).append(dt['team_id'])
+
+        summaries = OrderedDict()
+        for s in scores:
+            team_id = s['debate_team__team_id']
+            key = (team_id, s['debate_team__debate__round_id'])
+            if key in summaries:
+                # Shouldn't happen, but if a team has two results in one round, add them up.
+                summary = summaries[key]
+                warn("Team %d has more than one confirmed result in round %d" % key)
+            else:
+                opponents = [t for t in teams_in_debate.get(s['debate_team__debate_id'], []) if t != team_id]
+                summary = summaries[key] = TeamRoundSummary(team_id=team_id,
+                        round_id=s['debate_team__debate__round_id'],
+                        debate_team_id=s['debate_team_id'],
+                        opposition_id=opponents[0] if len(opponents) == 1 else None)
+            summary.points += s['points']
+            summary.score += s['score']
+            summary.margin += s['margin']
+            summary.win = summary.win or bool(s['win'])
+
+        cumulative = dict()
+        for (team_id, round_id), summary in summaries.iteritems():
+            totals = cumulative.setdefault(team_id, [0, 0, 0, 0])
+            totals[0] += summary.points
+            totals[1] += summary.score
+            totals[2] += summary.margin
+            totals[3] += int(summary.win)
+            summary.cumulative_points, summary.cumulative_score, summary.cumulative_margins, summary.cumulative_wins = totals
+
+        with transaction.atomic():
+            self.filter(team_id__in=team_ids).delete()
+            self.bulk_create(summaries.values())
+
+    def update_for_debate(self, debate):
+        self.update_for_teams(DebateTeam.objects.filter(debate=debate).values_list('team_id', flat=True))
+        StandingsSnapshot.objects.results_changed(debate.round)
+
+    def rebuild(self, tournament):
+        """Rebuilds the whole table for a tournament. Standings snapshots are
+        discarded, since they might not agree with the rebuilt totals."""
+        self.update_for_teams(Team.objects.filter(tournament=tournament).values_list('id', flat=True))
+        StandingsSnapshot.objects.filter(round__tournament=tournament).delete()
+        invalidate_breaking_teams(tournament)
+
+    def totals(self, team_ids, round=None):
+        """Returns a dict mapping team IDs to tuples (points, speaker_score,
+        margins, wins), being the cumulative totals from each team's latest
+        result up to and including 'round' (or in any round, if 'round' is
+        None). Teams with no confirmed results don't appear in the dict."""
+        summaries = self.filter(team_id__in=team_ids)
+        if round is not None:
+            summaries = summaries.filter(round__seq__lte=round.seq)
+        summaries = summaries.order_by('round__seq').values_list('team_id',
+                'cumulative_points', 'cumulative_score', 'cumulative_margins', 'cumulative_wins')
+        return dict((row[0], row[1:]) for row in summaries)
+
+
+class TeamRoundSummary(models.Model):
+    """Denormalised results of a team in a (preliminary) round, taken from the
+    confirmed ballot, along with cumulative totals up to and including that
+    round. Maintained by BallotSet.save() (and by Round.draw() when it deletes
+    debates); use the rebuild_team_summaries command to regenerate it."""
+
+    team = models.ForeignKey(Team)
+    round = models.ForeignKey(Round)
+    debate_team = models.ForeignKey(DebateTeam)
+    opposition = models.ForeignKey(Team, blank=True, null=True, related_name='+')
+
+    points = models.IntegerField(default=0)
+    score = ScoreField(default=0)
+    margin = ScoreField(default=0)
+    win = models.BooleanField(default=False)
+
+    cumulative_points = models.IntegerField(default=0)
+    cumulative_score = ScoreField(default=0)
+    cumulative_margins = ScoreField(default=0)
+    cumulative_wins = models.IntegerField(default=0)
+
+    objects = TeamRoundSummaryManager()
+
+    class Meta:
+        unique_together = [('team', 'round')]
+        index_together = [('round', 'team')]
+
+    def __unicode__(self):
+        return u'%s in %s' % (self.team, self.round)
+
+
+class StandingsSnapshotManager(models.Manager):
+
+    def take(self, round):
+        """Computes the team standings as of 'round' and stores them, replacing
+        any existing snapshot for that round."""
+        rule_name = round.tournament.config.get('team_standings_rule')
+        metrics = get_standings_rule(round.tournament).metrics
+        teams = Team.objects._live_standings(round)
+        rank_teams(teams, metrics)
+        subrank_teams(teams, metrics)
+        data = json.dumps(serialise_standings(teams, metrics), separators=(',', ':'))
+        with transaction.atomic():
+            self.filter(round=round).delete()
+            return self.create(round=round, rule=rule_name, data=data)
+
+    def lookup(self, round):
+        """Returns the snapshot for 'round', or None if there isn't a valid
+        one. If there isn't one (or it was taken under a different standings
+        rule) but every debate in the round has a confirmed result, it's taken
+        now. So after results change, it's taken once, when it's next needed,
+        not on every ballot save."""
+        try:
+            snapshot = self.get(round=round)
+        except self.model.DoesNotExist:
+            snapshot = None
+        if snapshot is not None and snapshot.rule == round.tournament.config.get('team_standings_rule'):
+            return snapshot
+        if not self._results_complete(round):
+            return None
+        try:
+            return self.take(round)
+        except IntegrityError:
+            return None # another request took it at the same time
+
+    def _results_complete(self, round):
+        if round.stage != Round.STAGE_PRELIMINARY:
+            return False
+        debates = Debate.objects.filter(round=round)
+        return debates.exists() and not debates.exclude(ballotsubmission__confirmed=True).exists()
+
+    def invalidate(self, round):
+        """Deletes the snapshots for 'round' and all later rounds, since they
+        all include the results of 'round'."""
+        self.filter(round__tournament=round.tournament, round__seq__gte=round.seq).delete()
+
+    def results_changed(self, round):
+        """Should be called whenever a confirmed result in 'round' changes.
+        Invalidates the affected snapshots and the cached break. A new
+        snapshot is taken by lookup() when it's next needed."""
+        self.invalidate(round)
+        invalidate_breaking_teams(round.tournament_id)
+
+
+class StandingsSnapshot(models.Model):
+    """The team standings as of the end of a round, frozen so that they don't
+    need to be recomputed whenever standings at a past round are shown. Taken
+    when the tournament advances past the round, or when first looked up
+    after every result in the round is confirmed, and deleted if a result in
+    or before the round changes. Use StandingsSnapshot.objects.lookup() to find a valid one."""
+
+    round = models.OneToOneField(Round)
+    rule = models.CharField(max_length=20)
+    data = models.TextField()
+    timestamp = models.DateTimeField(auto_now=True)
+
+    objects = StandingsSnapshotManager()
+
+    @property
+    def standings(self):
+        """The standings, as returned by serialise_standings()."""
+        return json.loads(self.data)
+
+    def __unicode__(self):
+        return u'Standings after %s' % self.round
+
+
+class DrawJobManager(models.Manager):
+
+    def start(self, round, user=None):
+        """Starts drawing 'round' in a background thread, unless a draw job
+        for it is already queued or running. Returns (job, started), where
+        'started' is False if the job already existed."""
+        with transaction.atomic():
+            # Lock the round, so that two requests can't both start a job
+            Round.objects.select_for_update().get(pk=round.pk)
+            self.fail_stale(round)
+            job = self.filter(round=round, status__in=DrawJob.ACTIVE_STATUSES).first()
+            if job is not None:
+                return job, False
+            job = self.create(round=round, user=user)
+        thread = Thread(target=job.run)
+        thread.daemon = True
+        thread.start()
+        return job, True
+
+    def fail_stale(self, round):
+        """Marks queued or running jobs for the round that haven't reported
+        progress within DrawJob.STALE_AFTER as failed. Their thread has most
+        likely died with the process that ran it, say, if the server was
+        restarted."""
+        from django.utils import timezone
+        self.filter(round=round, status__in=DrawJob.ACTIVE_STATUSES,
+                updated__lt=timezone.now() - DrawJob.STALE_AFTER).update(
+                status=DrawJob.STATUS_FAILED, error=DrawJob.STALE_ERROR, updated=timezone.now())
+
+    def cancel(self, round):
+        """Marks any queued or running jobs for the round as failed, so that
+        another can be started. If a cancelled job is in fact still running,
+        it stops before saving its draw."""
+        from django.utils import timezone
+        return self.filter(round=round, status__in=DrawJob.ACTIVE_STATUSES).update(
+                status=DrawJob.STATUS_FAILED, error=DrawJob.CANCELLED_ERROR, updated=timezone.now())
+
+    def latest_for_round(self, round):
+        self.fail_stale(round)
+        return self.filter(round=round).order_by('-id').first()
+
+
+class DrawJobCancelled(Exception):
+    pass
+
+
+class DrawJob(models.Model):
+    """A draw being generated in the background, so that drawing a large
+    round doesn't hold up a web request. Started by DrawJob.objects.start(),
+    which runs Round.draw() in a thread, recording its progress here."""
+
+    STATUS_QUEUED = 'Q'
+    STATUS_RUNNING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    PHASE_CHOICES = (
+        ('standings', 'Loading standings'),
+        ('brackets', 'Forming brackets'),
+        ('pairings', 'Pairing teams'),
+        ('conflicts', 'Avoiding conflicts'),
+        ('save', 'Saving draw'),
+    )
+
+    # An active job that hasn't reported progress for this long is taken to
+    # have died. No phase of a draw should take nearly this long.
+    STALE_AFTER = timedelta(minutes=5)
+    STALE_ERROR = "The draw stopped responding, probably because the server restarted. Try again."
+    CANCELLED_ERROR = "The draw was cancelled."
+
+    round = models.ForeignKey(Round)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, blank=True)
+    error = models.TextField(blank=True)
+    started = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = DrawJobManager()
+
+    def _update_if_active(self, **fields):
+        """Updates the given fields (and 'updated'), but only if the job is
+        still queued or running in the database. Raises DrawJobCancelled if
+        not, since then it's been cancelled or given up on as stale."""
+        from django.utils import timezone
+        fields['updated'] = timezone.now()
+        if not DrawJob.objects.filter(pk=self.pk, status__in=self.ACTIVE_STATUSES).update(**fields):
+            raise DrawJobCancelled()
+        for name, value in fields.iteritems():
+            setattr(self, name, value)
+
+    def set_phase(self, phase):
+        self._update_if_active(phase=phase)
+
+    def run(self):
+        try:
+            self._update_if_active(status=self.STATUS_RUNNING)
+            self.round.draw(progress=self.set_phase)
+            self._update_if_active(status=self.STATUS_DONE)
+        except DrawJobCancelled:
+            pass # leave the job as whoever stopped it left it
+        except Exception as e:
+            try:
+                self._update_if_active(status=self.STATUS_FAILED, error=unicode(e))
+            except DrawJobCancelled:
+                pass
+        finally:
+            connection.close() # this thread's connection isn't closed otherwise
+
+    @property
+    def active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def as_dict(self):
+        return {
+            "status": self.get_status_display(),
+            "active": self.active,
+            "phase": self.get_phase_display(),
+            "error": self.error,
+        }
+
+    def __unicode__(self):
+        return u'Draw for %s (%s)' % (self.round, self.get_status_display())
+
+
 class SpeakerScoreManager(models.Manager):
     use_for_related_fields = True
 
@@ -1872,6 +2036,7 @@ class ActionLog(models.Model):
     ACTION_TYPE_DRAW_RELEASE            = 34
     ACTION_TYPE_DRAW_UNRELEASE          = 35
     ACTION_TYPE_DIVISIONS_SAVE          = 36
+    ACTION_TYPE_DRAW_EDIT               = 37
     ACTION_TYPE_MOTION_EDIT             = 40
     ACTION_TYPE_MOTIONS_RELEASE         = 41
     ACTION_TYPE_MOTIONS_UNRELEASE       = 42
@@ -1899,6 +2064,7 @@ class ActionLog(models.Model):
         (ACTION_TYPE_DRAW_RELEASE           , 'Released draw'),
         (ACTION_TYPE_DRAW_UNRELEASE         , 'Unreleased draw'),
         (ACTION_TYPE_DRAW_UNRELEASE         , 'Saved divisions'),
+        (ACTION_TYPE_DRAW_EDIT              , 'Edited draw'),
         (ACTION_TYPE_MOTION_EDIT            , 'Added/edited motion'),
         (ACTION_TYPE_MOTIONS_RELEASE        , 'Released motions'),
         (ACTION_TYPE_MOTIONS_UNRELEASE      , 'Unreleased motions'),
@@ -1926,6 +2092,7 @@ class ActionLog(models.Model):
         ACTION_TYPE_DRAW_CONFIRM           : ('round',),
         ACTION_TYPE_DRAW_RELEASE           : ('round',),
         ACTION_TYPE_DRAW_UNRELEASE         : ('round',),
+        ACTION_TYPE_DRAW_EDIT              : ('round',),
         ACTION_TYPE_DEBATE_IMPORTANCE_EDIT : ('debate',),
         ACTION_TYPE_ROUND_START_TIME_SET   : ('round',),
         ACTION_TYPE_MOTION_EDIT            : ('motion',),
@@ -2018,3 +2185,26 @@ class Config(models.Model):
     value = models.CharField(max_length=40)
 
     objects = ConfigManager()
+
+
+# Deleting teams or results changes the break, but isn't caught by Team.save()
+# or BallotSet.save(). Queryset deletions (including cascades) don't call
+# delete() on each object, so these use signals.
+
+@receiver(post_delete, sender=Team)
+def _team_deleted(sender, instance, **kwargs):
+    invalidate_breaking_teams(instance.tournament_id)
+
+@receiver(post_delete, sender=DebateTeam)
+def _debate_team_deleted(sender, instance, **kwargs):
+    tournament_id = Team.objects.filter(id=instance.team_id).values_list(
+            'tournament_id', flat=True).first()
+    if tournament_id is not None:
+        invalidate_breaking_teams(tournament_id)
+
+@receiver(post_delete, sender=TeamScore)
+def _team_score_deleted(sender, instance, **kwargs):
+    tournament_id = DebateTeam.objects.filter(id=instance.debate_team_id).values_list(
+            'team__tournament_id', flat=True).first()
+    if tournament_id is not None:
+        invalidate_breaking_teams(tournament_id)
@@ -1,3 +1,12 @@
+from itertools import islice, izip
+import numpy as np
+
+def _same_institution(aff, neg):
+    return aff.institution == neg.institution
+
+def _seen(aff, neg):
+    return aff.seen(neg)
+
 class OneUpOneDownSwapper(object):
 
     DEFAULT_OPTIONS = {
@@ -25,7 +34,7 @@ class OneUpOneDownSwapper(object):
 
     @staticmethod
     def dp(data):
-        """'data' is a list of integers.  Returns a 2-tuple.
+        """'data' is a list (or array) of integers.  Returns a 2-tuple.
         The second item is the indices of the elements in data that have the
         maximum possible sum, subject to the constraint that you can't pick two
         adjacent elements. Note that negative elements will never be included,
@@ -35,6 +44,9 @@ class OneUpOneDownSwapper(object):
         of indices of the optimal swap combinations. The first item is the
         maximum possible sum so obtained."""
 
+        # Plain floats are much faster than NumPy scalars in this loop
+        if isinstance(data, np.ndarray):
+            data = data.tolist()
         N = len(data) + 1
 
         # 'state' is the cumulative sum of the relevant elements.
@@ -51,7 +63,7 @@ class OneUpOneDownSwapper(object):
         # and only if, adding this element to the cumulative sum as of *two*
         # elements ago (to form the potential cumulative sum of this element)
         # would beat the cumulative sum as of last element.
-        for i in range(2, N+1):
+        for i in xrange(2, N+1):
             if (state[i-2] + data[i-2]) > state[i-1]:
                 action[i] = 1
                 state[i] = state[i-2] + data[i-2]
@@ -59,49 +71,100 @@ class OneUpOneDownSwapper(object):
                 action[i] = 0
                 state[i] = state[i-1]
 
-        j = N
-        L = []
-        #while j >= 0:
-        #    L.insert(0, j)
-        #    j -= (action[j] + 1)
-        #return state[N], L
-
         # Now go back through the list starting at the end (since a 1 nullifies
         # the 1 immediately preceding, assuming the former is not itself
         # nullified).
+        j = N
+        L = []
         while j >= 2:
             if action[j]:
-                L.insert(0, j-2) # insert index corresponding to start of swap
+                L.append(j-2) # index corresponding to start of swap
             j -= (action[j] + 1)
+        L.reverse()
         return state[N], L
 
-    def score_swap(self, (a1, n1), (a2, n2)):
-        """Returns an integer representing the improvement from swapping the
-        teams in these two debates.  The higher the integer, the more you want to
-        do the swap."""
-        inst = (a1.institution == n1.institution,
-                a2.institution == n2.institution)
-        hist = (a1.seen(n1), a2.seen(n2))
-
-        if not ((inst[0] or inst[1]) and self.avoid_institution) and \
-                (sum(hist) == 0 and self.avoid_history):
-            return self.exclude_penalty
-
-        inst_swap = (a1.institution == n2.institution,
-                     a2.institution == n1.institution)
-        hist_swap = (a1.seen(n2), a2.seen(n1))
+    @staticmethod
+    def _pairs(affs, negs, func, offset=0, where=None):
+        """Returns an array of func(aff, neg) for the affirmative of each debate
+        i and the negative of debate i+offset, or zero where 'where' is False."""
+        n = len(affs) - abs(offset)
+        aff_start, neg_start = max(-offset, 0), max(offset, 0)
+        if where is None:
+            pairs = izip(islice(affs, aff_start, None), islice(negs, neg_start, None))
+            return np.fromiter((func(a, b) for a, b in pairs), dtype=float, count=n)
+        result = np.zeros(n)
+        for i in np.flatnonzero(where).tolist():
+            result[i] = func(affs[aff_start + i], negs[neg_start + i])
+        return result
+
+    def conflict_bands(self, draw, same_institution=None, history=None):
+        """Returns a 2-tuple, of institution conflicts and history conflicts.
+        Each is a 3-tuple of arrays, (current, up, down): current[i] is the
+        conflict between the teams in debate i, up[i] is that between the
+        affirmative of debate i and the negative of debate i+1, and down[i] is
+        that between the affirmative of debate i+1 and the negative of debate
+        i. These are diagonals of 'same_institution' and 'history' if given
+        (see run()). Otherwise, 'up' and 'down' are only worked out where
+        either debate has a conflict, and are zero elsewhere, since swapping
+        two debates without conflicts is never worthwhile."""
+        affs = [aff for aff, neg in draw]
+        negs = [neg for aff, neg in draw]
+        matrices = [np.asarray(m, dtype=float) if m is not None else None
+                for m in (same_institution, history)]
+        funcs = [_same_institution, _seen]
+
+        currents = [np.diagonal(m) if m is not None else self._pairs(affs, negs, func)
+                for m, func in zip(matrices, funcs)]
+        conflicted = (currents[0] > 0) | (currents[1] > 0)
+        candidates = conflicted[:-1] | conflicted[1:]
+
+        bands = list()
+        for current, m, func in zip(currents, matrices, funcs):
+            if m is not None:
+                bands.append((current, np.diagonal(m, 1), np.diagonal(m, -1)))
+            else:
+                bands.append((current, self._pairs(affs, negs, func, 1, candidates),
+                        self._pairs(affs, negs, func, -1, candidates)))
+        return tuple(bands)
+
+    def score_swaps(self, inst_bands, hist_bands):
+        """Returns an array of how much better the draw gets by swapping the
+        teams in each debate with the debate below, from the conflicts returned
+        by conflict_bands().  The higher the score, the more you want to do the
+        swap."""
+        inst_current, inst_up, inst_down = inst_bands
+        hist_current, hist_up, hist_down = hist_bands
+
+        inst = (inst_current[:-1] > 0).astype(int) + (inst_current[1:] > 0)
+        hist = hist_current[:-1] + hist_current[1:]
+        inst_swap = (inst_up > 0).astype(int) + (inst_down > 0)
+        hist_swap = hist_up + hist_down
+
+        # Don't swap if neither debate has a conflict being avoided
+        exclude = ~((inst > 0) & bool(self.avoid_institution)) & \
+                ((hist == 0) & bool(self.avoid_history))
 
         # Definitely don't swap if you'd have more history conflicts by swapping
-        if self.avoid_history and sum(hist_swap) > sum(hist):
-            return self.exclude_penalty
+        if self.avoid_history:
+            exclude |= hist_swap > hist
 
-        def badness(i, h):
-            return i.count(True) * self.institution_penalty + sum(h) \
-                    * self.history_penalty
+        badness = inst * self.institution_penalty + hist * self.history_penalty
+        badness_swap = inst_swap * self.institution_penalty + hist_swap * self.history_penalty
 
         # Discount by 1e-3 so that, if there are two otherwise-equivalent
         # swap combinations, fewer swaps is preferred to more swaps
-        return badness(inst, hist) - badness(inst_swap, hist_swap) - 1e-3
+        scores = badness - badness_swap - 1e-3
+        scores[exclude] = self.exclude_penalty
+        return scores
+
+    def score_swap(self, (a1, n1), (a2, n2)):
+        """Returns an integer representing the improvement from swapping the
+        teams in these two debates.  The higher the integer, the more you want to
+        do the swap."""
+        affs, negs = [a1, a2], [n1, n2]
+        bands = [tuple(self._pairs(affs, negs, func, offset) for offset in (0, 1, -1))
+                for func in (_same_institution, _seen)]
+        return self.score_swaps(*bands)[0]
 
     @staticmethod
     def one_up_down_swap(draw, i):
@@ -110,19 +173,28 @@ class OneUpOneDownSwapper(object):
         draw[i] = m1
         draw[i+1] = m2
 
-    def run(self, draw):
+    def run(self, draw, same_institution=None, history=None):
         """'draw' is a list of 2-tuples of Teams [(aff, neg), (aff, neg)...]
-        representing the entire draw"""
-
-        # Find a list of integers representing how much better you get by
-        # executing the each team with the team below.
-        swap_scores = [(self.score_swap(draw[i], draw[i+1])) for i in range(len(draw) - 1)]
+        representing the entire draw.
+
+        'same_institution' and 'history', if given, are matrices whose [i, j]
+        elements are whether the affirmative of debate i and the negative of
+        debate j are from the same institution, and how many times they've met,
+        respectively. If not, they're found from the teams' 'institution'
+        attributes and seen() methods, for only the pairs of teams that a
+        worthwhile swap could bring together."""
+
+        # Find an array representing how much better you get by swapping the
+        # teams in each debate with the debate below.
+        if len(draw) < 2:
+            swap_scores = np.zeros(0)
+        else:
+            swap_scores = self.score_swaps(*self.conflict_bands(draw, same_institution, history))
 
         # Adjust scores so that if there are two equivalent ways to resolve a
         # conflict, swaps higher in the ranking are preferred to those lower.
-        for i, score in enumerate(swap_scores):
-            if score > 0:
-                swap_scores[i] += (len(swap_scores) - i) * 1e-6
+        positive = np.flatnonzero(swap_scores > 0)
+        swap_scores[positive] += (len(swap_scores) - positive) * 1e-6
 
         best_score, best_swaps = self.dp(swap_scores)
         for s in best_swaps:
@@ -1,5 +1,20 @@
 # cannot import debate.models here - would create circular dep
 
+from django.db import transaction
+
+# Points for a win and for a loss under each 'team_points_rule' option
+TEAM_POINTS_RULES = {
+    "normal": (1, 0),
+    "wadl": (2, 1),
+}
+
+def get_team_points_values(tournament):
+    """Returns (points for a win, points for a loss) under the tournament's
+    'team_points_rule' option. Unknown rules are treated as "normal"."""
+    return TEAM_POINTS_RULES.get(tournament.config.get('team_points_rule'),
+            TEAM_POINTS_RULES["normal"])
+
+
 class Scoresheet(object):
     """
     Representation of an adjudicator's scoresheet
@@ -271,15 +286,24 @@ class BallotSet(object):
         return self._adjudicator_sheets
 
     def save(self):
-        self.ballots.save()
+        from debate.models import TeamRoundSummary
 
-        for sheet in self.adjudicator_sheets.values():
-            sheet.save()
+        with transaction.atomic():
+            was_confirmed = self.ballots.confirmed_when_saved
+            self.ballots.save()
 
-        self._calc_decision()
+            for sheet in self.adjudicator_sheets.values():
+                sheet.save()
+
+            self._calc_decision()
+
+            self._save('aff')
+            self._save('neg')
 
-        self._save('aff')
-        self._save('neg')
+            # Now that the scores are saved, update the summaries once, if
+            # this ballot's results count (or did until now)
+            if self.ballots.confirmed or was_confirmed:
+                TeamRoundSummary.objects.update_for_debate(self.debate)
 
     def _calc_decision(self):
         decision = []
@@ -373,18 +397,11 @@ class BallotSet(object):
         if not self.loaded_sheets:
             return self.points[side]
 
-        if self.debate.round.tournament.config.get('team_points_rule') != 'wadl':
-            if self._score(side):
-                if self._score(side) > self._score(self._other[side]):
-                    return 1
-                return 0
-        else:
-            if self._score(side):
-                if self._score(side) > self._score(self._other[side]):
-                    return 2 # 2pts for a win
-                else:
-                    return 1 # 1pt for a loss
-                return 0 # TODO: 0 for a forfeit
+        if self._score(side):
+            win, loss = get_team_points_values(self.debate.round.tournament)
+            if self._score(side) > self._score(self._other[side]):
+                return win
+            return loss # TODO: 0 for a forfeit under "wadl"
 
         return None
 
@@ -0,0 +1,299 @@
+# cannot import debate.models at module level - would create circular dep
+
+from operator import attrgetter
+from django.db.models import Sum
+import numpy as np
+
+
+def get_team_totals(team_ids, round=None):
+    """Returns a dict mapping team IDs to dicts with keys 'points',
+    'speaker_score' and 'margins', being the sums of those fields over all
+    CONFIRMED ballots in preliminary rounds up to and including 'round' (or all
+    preliminary rounds, if 'round' is None). Teams with no confirmed results
+    don't appear in the dict.
+
+    This is a single grouped aggregate query, regardless of how many teams
+    there are."""
+    from debate.models import TeamScore, Round
+
+    scores = TeamScore.objects.filter(
+        ballot_submission__confirmed = True,
+        debate_team__team_id__in = team_ids,
+        debate_team__debate__round__stage = Round.STAGE_PRELIMINARY,
+    )
+    if round is not None:
+        scores = scores.filter(debate_team__debate__round__seq__lte=round.seq)
+
+    scores = scores.values('debate_team__team_id').annotate(
+        points = Sum('points'),
+        speaker_score = Sum('score'),
+        margins = Sum('margin'),
+    ).order_by()
+
+    totals = dict()
+    for row in scores:
+        totals[row['debate_team__team_id']] = row
+    return totals
+
+
+def annotate_team_totals(teams, round=None):
+    """Accepts an iterable of Teams (normally a QuerySet), returns a list of
+    the same (distinct) teams, each annotated with 'points', 'speaker_score'
+    and 'margins' attributes. Teams without confirmed results get zero for
+    each.
+
+    The totals are read from the TeamRoundSummary table, which is kept up to
+    date as ballots are confirmed. get_team_totals() computes the same thing
+    from the raw results."""
+    from debate.models import TeamRoundSummary
+
+    teams = list(teams)
+    seen = set()
+    teams = [t for t in teams if not (t.id in seen or seen.add(t.id))]
+
+    totals = TeamRoundSummary.objects.totals([t.id for t in teams], round)
+    for team in teams:
+        team.points, team.speaker_score, team.margins, _ = totals.get(team.id, (0, 0, 0, 0))
+    return teams
+
+
+def metric_array(teams, metrics):
+    """Returns an n-by-k NumPy array, where n is the number of teams and k is
+    the number of metrics, holding the value of each metric for each team."""
+    values = np.array([[getattr(team, metric) for metric in metrics] for team in teams], dtype=float)
+    return values.reshape(len(teams), len(metrics))
+
+
+def sort_teams(teams, metrics, shuffle=False):
+    """Sorts the given list in-place, best team first, by each of 'metrics' in
+    turn, using a single NumPy lexsort. If 'shuffle' is True, teams that are
+    equal on all metrics are put in random order; otherwise they keep their
+    existing order."""
+    values = metric_array(teams, metrics)
+    if shuffle:
+        tiebreak = np.random.random(len(teams))
+    else:
+        tiebreak = np.arange(len(teams))
+    # lexsort sorts ascending, with the last key being the primary one
+    order = np.lexsort([tiebreak] + [-values[:, i] for i in reversed(xrange(len(metrics)))])
+    teams[:] = [teams[i] for i in order]
+    return teams
+
+
+def _changes(values):
+    """Returns a boolean array indicating which rows of 'values' differ from
+    the row before. The first row is always considered a change."""
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = (values[1:] != values[:-1]).any(axis=1)
+    return changed
+
+
+def competition_ranks(values):
+    """Returns an array of standard competition ranks ("1224") for 'values',
+    which must already be sorted. 'values' may be one-dimensional, or a 2-D
+    array with one row per item, in which case items are equal only if their
+    whole rows are equal."""
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    positions = np.arange(1, len(values) + 1)
+    return np.maximum.accumulate(np.where(_changes(values), positions, 0))
+
+
+def rank_teams(teams, metrics):
+    """Annotates each team in a sorted list with 'rank', using standard
+    competition ranking ("1224") on all of 'metrics'."""
+    if not teams:
+        return teams
+    ranks = competition_ranks(metric_array(teams, metrics))
+    for team, rank in zip(teams, ranks):
+        team.rank = int(rank)
+    return teams
+
+
+def subrank_teams(teams, metrics):
+    """Annotates each team in a sorted list with 'subrank', its rank among
+    teams equal on the first metric, using the remaining metrics."""
+    if not teams:
+        return teams
+    values = metric_array(teams, metrics)
+    positions = np.arange(1, len(teams) + 1)
+    group_starts = np.maximum.accumulate(np.where(_changes(values[:, :1]), positions, 0))
+    rank_starts = np.maximum.accumulate(np.where(_changes(values), positions, 0))
+    for team, subrank in zip(teams, rank_starts - group_starts + 1):
+        team.subrank = int(subrank)
+    return teams
+
+
+def get_team_debates(team_ids, round=None):
+    """Returns a dict mapping debate IDs to lists of the IDs of the teams in
+    that debate, for every debate involving any of the given teams up to and
+    including 'round' (or in any round, if 'round' is None). Uses one query."""
+    from debate.models import DebateTeam
+
+    debateteams = DebateTeam.objects.filter(debate__debateteam__team_id__in=team_ids)
+    if round is not None:
+        debateteams = debateteams.filter(debate__round__seq__lte=round.seq)
+
+    debates = dict()
+    for debate_id, team_id in debateteams.values_list('debate_id', 'team_id').distinct():
+        debates.setdefault(debate_id, []).append(team_id)
+    return debates
+
+
+def annotate_draw_strength(teams, debates):
+    """Annotates each team with 'draw_strength', the sum of the points of the
+    teams it has faced. 'teams' must already have 'points' annotated, and
+    'debates' is as returned by get_team_debates()."""
+    points = dict((team.id, team.points) for team in teams)
+    draw_strength = dict.fromkeys(points, 0)
+    for team_ids in debates.itervalues():
+        for team_id in team_ids:
+            if team_id in draw_strength:
+                draw_strength[team_id] += sum(points.get(t, 0) for t in team_ids if t != team_id)
+    for team in teams:
+        team.draw_strength = draw_strength[team.id]
+
+
+def get_head_to_head(debates):
+    """Returns a dict mapping (team1_id, team2_id) to the number of points
+    team1 won (on confirmed ballots) in debates against team2, for the debates
+    in 'debates' (as returned by get_team_debates()). Uses one query."""
+    from debate.models import TeamScore
+
+    scores = TeamScore.objects.filter(ballot_submission__confirmed=True,
+            debate_team__debate_id__in=debates.keys()).values_list(
+            'debate_team__debate_id', 'debate_team__team_id', 'points')
+
+    head_to_head = dict()
+    for debate_id, team_id, points in scores:
+        for other_id in debates[debate_id]:
+            if other_id != team_id:
+                key = (team_id, other_id)
+                head_to_head[key] = head_to_head.get(key, 0) + points
+    return head_to_head
+
+
+def break_ties_head_to_head(teams, keys, head_to_head):
+    """Applies who-beat-whom to a list of teams already sorted by keys[-1].
+    'keys' is a list of successively finer sort keys. Wherever exactly two
+    teams are equal on some key (and not on a coarser one), the team that won
+    more points against the other goes first; if this doesn't separate them,
+    they keep their existing order. Returns the list, reordered in-place."""
+
+    # teams[start:stop] are equal on keys[:level]; at level 0, that's no
+    # tie at all, so head-to-head doesn't apply even if there are two teams
+    def resolve(start, stop, level):
+        if stop - start == 2 and level > 0:
+            team1, team2 = teams[start], teams[stop-1]
+            if head_to_head.get((team2.id, team1.id), 0) > head_to_head.get((team1.id, team2.id), 0):
+                teams[start], teams[stop-1] = team2, team1
+            return
+        if stop - start < 2 or level == len(keys):
+            return
+        key = keys[level]
+        group_start = start
+        for i in xrange(start + 1, stop + 1):
+            if i == stop or key(teams[i]) != key(teams[group_start]):
+                resolve(group_start, i, level + 1)
+                group_start = i
+
+    resolve(0, len(teams), 0)
+    return teams
+
+
+SNAPSHOT_FIELDS = ("points", "speaker_score", "margins")
+
+def serialise_standings(teams, metrics):
+    """Returns a compact, JSON-serialisable dict holding the order of a list of
+    ranked and subranked teams, their totals, the values of 'metrics', and
+    their ranks. The inverse of deserialise_standings()."""
+    fields = list(SNAPSHOT_FIELDS) + [m for m in metrics if m not in SNAPSHOT_FIELDS] + ["rank", "subrank"]
+    return {
+        "fields": fields,
+        "teams": [[team.id] + [getattr(team, f) for f in fields] for team in teams],
+    }
+
+
+def deserialise_standings(data, teams):
+    """Accepts a dict from serialise_standings() and an iterable of Teams,
+    and returns a list of those teams in the stored order, annotated with the
+    stored values. Teams not in the stored standings are left out."""
+    teams = dict((team.id, team) for team in teams)
+    fields = data["fields"]
+    result = list()
+    for row in data["teams"]:
+        team = teams.get(row[0])
+        if team is None:
+            continue
+        for field, value in zip(fields, row[1:]):
+            setattr(team, field, value)
+        result.append(team)
+    return result
+
+
+class StandingsRule(object):
+    """A team standings rule. 'metrics' is a tuple of team attributes, in order
+    of precedence. If 'head_to_head' is True, who-beat-whom is applied wherever
+    exactly two teams are equal on some prefix of the metrics."""
+
+    def __init__(self, metrics, head_to_head=False):
+        self.metrics = tuple(metrics)
+        self.head_to_head = head_to_head
+
+# Functions that annotate teams with metrics other than the team totals. Each
+# takes a list of teams and the debates dict from get_team_debates().
+METRIC_ANNOTATORS = {
+    "draw_strength": annotate_draw_strength,
+}
+
+STANDINGS_RULES = dict()
+
+def register_standings_rule(name, metrics, head_to_head=False):
+    """Makes a standings rule available for the 'team_standings_rule' option."""
+    STANDINGS_RULES[name] = StandingsRule(metrics, head_to_head)
+
+register_standings_rule("australs", ("points", "speaker_score"))
+register_standings_rule("nz", ("points", "speaker_score", "draw_strength"), head_to_head=True)
+register_standings_rule("wadl", ("points", "margins"))
+
+
+def get_standings_rule(tournament):
+    rule = tournament.config.get('team_standings_rule')
+    try:
+        return STANDINGS_RULES[rule]
+    except KeyError:
+        raise ValueError("Invalid team_standings_rule option: {0}".format(rule))
+
+
+def annotate_team_standings(teams, round=None, shuffle=False):
+    """Accepts a QuerySet, returns a list.
+    If 'shuffle' is True, it shuffles the list before sorting so that teams that
+    are equal are in random order. This should be turned on for draw generation,
+    and turned off for display."""
+    # Adds up all the points, speaker scores and margins of each team on
+    # CONFIRMED ballots, in preliminary rounds only (see annotate_team_totals()).
+    teams = annotate_team_totals(teams, round)
+    if not teams:
+        return teams
+
+    # Extract which rule to use from the tournament config
+    if round is not None:
+        tournament = round.tournament
+    else:
+        tournament = teams[0].tournament
+    rule = get_standings_rule(tournament)
+
+    annotators = [METRIC_ANNOTATORS[m] for m in rule.metrics if m in METRIC_ANNOTATORS]
+    if annotators or rule.head_to_head:
+        debates = get_team_debates([t.id for t in teams], round)
+        for annotator in annotators:
+            annotator(teams, debates)
+
+    sort_teams(teams, rule.metrics, shuffle)
+
+    if rule.head_to_head:
+        keys = [attrgetter(*rule.metrics[:i]) for i in xrange(1, len(rule.metrics) + 1)]
+        break_ties_head_to_head(teams, keys, get_head_to_head(debates))
+
+    return teams
@@ -0,0 +1,275 @@
+# cannot import debate.models at module level - would create circular dep
+
+from collections import OrderedDict
+from warnings import warn
+import copy
+import numpy as np
+
+from debate.standings import competition_ranks
+
+
+class SpeakerScoreMatrix(object):
+    """A speaker-by-round matrix of confirmed speaker scores in preliminary
+    rounds up to and including a given round, loaded in a single query.
+
+    Attributes:
+        rounds       list of Rounds, being the columns of the matrix
+        speaker_ids  list of speaker IDs, being the rows of the matrix
+        scores       array of scores, NaN where a speaker didn't speak (or had
+                     more than one score) in a round
+        counts       array of the number of scores for each speaker and round
+        totals       array of each speaker's total score
+        averages     array of each speaker's average score
+        num_scores   array of the number of scores each speaker has
+        ranks        array of each speaker's rank, by total for substantive
+                     speeches, or by average then number of replies for
+                     replies
+        duplicates   list of (speaker_id, round) for cells with more than one
+                     score
+
+    If 'replies' is True, it holds reply scores rather than substantive
+    speeches."""
+
+    def __init__(self, round, replies=False):
+        from debate.models import SpeakerScore, Round
+
+        tournament = round.tournament
+        self.rounds = list(tournament.prelim_rounds(until=round).order_by('seq'))
+        round_index = dict((r.id, i) for i, r in enumerate(self.rounds))
+
+        scores = SpeakerScore.objects.filter(
+            ballot_submission__confirmed = True,
+            speaker__team__tournament = tournament,
+            debate_team__debate__round__stage = Round.STAGE_PRELIMINARY,
+            debate_team__debate__round__seq__lte = round.seq,
+        )
+        if replies:
+            scores = scores.filter(position=tournament.REPLY_POSITION)
+        else:
+            scores = scores.filter(position__lte=tournament.LAST_SUBSTANTIVE_POSITION)
+        rows = scores.values_list('speaker_id', 'debate_team__debate__round_id', 'score').order_by()
+        rows = [(s, round_index[r], score) for s, r, score in rows]
+
+        self.speaker_ids = sorted(set(row[0] for row in rows))
+        self._index = dict((speaker_id, i) for i, speaker_id in enumerate(self.speaker_ids))
+
+        shape = (len(self.speaker_ids), len(self.rounds))
+        if rows:
+            speaker_col, round_col, score_col = [np.array(col) for col in zip(*rows)]
+            speaker_col = np.array([self._index[s] for s in speaker_col], dtype=int)
+            score_col = score_col.astype(float)
+        else:
+            speaker_col = round_col = np.zeros(0, dtype=int)
+            score_col = np.zeros(0, dtype=float)
+
+        self.counts = np.zeros(shape, dtype=int)
+        np.add.at(self.counts, (speaker_col, round_col), 1)
+        self.scores = np.full(shape, np.nan)
+        self.scores[speaker_col, round_col] = score_col
+        self.scores[self.counts > 1] = np.nan
+
+        # Totals and averages are over all confirmed scores, as they always were
+        n = len(self.speaker_ids)
+        self.num_scores = np.bincount(speaker_col, minlength=n)
+        self.totals = np.bincount(speaker_col, weights=score_col, minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.averages = self.totals / self.num_scores
+
+        if replies:
+            rank_values = np.column_stack((self.averages, self.num_scores)).reshape(n, 2)
+        else:
+            rank_values = self.totals.reshape(n, 1)
+        # lexsort sorts ascending, with the last key being the primary one
+        order = np.lexsort([-rank_values[:, i] for i in reversed(xrange(rank_values.shape[1]))])
+        self.ranks = np.zeros(n, dtype=int)
+        self.ranks[order] = competition_ranks(rank_values[order])
+
+        self.duplicates = [(self.speaker_ids[i], self.rounds[j]) for i, j in zip(*np.nonzero(self.counts > 1))]
+        if self.duplicates:
+            warn("Multiple speaker scores seen for these speakers and rounds: " + ", ".join(
+                "speaker {0:d} in round {1:d}".format(s, r.seq) for s, r in self.duplicates))
+
+    def __contains__(self, speaker_id):
+        return speaker_id in self._index
+
+    def get_scores(self, speaker_id):
+        """Returns a list of the speaker's scores, one for each round, with
+        None where there is no (unique) score."""
+        i = self._index.get(speaker_id)
+        if i is None:
+            return [None] * len(self.rounds)
+        return [None if np.isnan(x) else float(x) for x in self.scores[i]]
+
+    def annotate(self, speakers):
+        """Annotates each speaker in 'speakers' with 'total', 'average',
+        'replies' (the number of scores), 'rank' and 'scores' (a list, one for
+        each round). Speakers not in the matrix get None for each."""
+        for speaker in speakers:
+            i = self._index.get(speaker.id)
+            if i is None:
+                speaker.total = speaker.average = speaker.replies = speaker.rank = None
+            else:
+                speaker.total = float(self.totals[i])
+                speaker.average = float(self.averages[i])
+                speaker.replies = int(self.num_scores[i])
+                speaker.rank = int(self.ranks[i])
+            speaker.scores = self.get_scores(speaker.id)
+        return speakers
+
+
+def category_ranks(values, masks):
+    """Ranks speakers within several categories at once. 'values' is a k-by-n
+    array holding the value each of n speakers is ranked by (higher is better)
+    in each of k categories, and 'masks' is a k-by-n boolean array saying which
+    speakers are ranked in each category. Returns a k-by-n array of standard
+    competition ranks within each category, with 0 for speakers not ranked."""
+    values = np.where(masks, values, -np.inf)
+    k, n = values.shape
+    rows = np.arange(k)[:, np.newaxis]
+    order = np.argsort(-values, axis=1, kind='mergesort')
+    sorted_values = values[rows, order]
+    changed = np.ones((k, n), dtype=bool)
+    changed[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    positions = np.arange(1, n + 1)
+    ranks = np.zeros((k, n), dtype=int)
+    ranks[rows, order] = np.maximum.accumulate(np.where(changed, positions, 0), axis=1)
+    ranks[~masks] = 0
+    return ranks
+
+
+class SpeakerCategory(object):
+    """A category of the speaker tab. 'predicate' is a function that takes a
+    Speaker (with its team) and returns True if the speaker is in the
+    category. If 'by_average' is True, speakers are ranked by average rather
+    than total score, and if 'min_rounds_option' is given, it is the name of
+    the config option holding the number of scores a speaker needs to be
+    ranked."""
+
+    def __init__(self, name, verbose_name, predicate, by_average=False, min_rounds_option=None):
+        self.name = name
+        self.verbose_name = verbose_name
+        self.predicate = predicate
+        self.by_average = by_average
+        self.min_rounds_option = min_rounds_option
+
+SPEAKER_CATEGORIES = OrderedDict()
+
+def register_speaker_category(name, verbose_name, predicate, by_average=False, min_rounds_option=None):
+    SPEAKER_CATEGORIES[name] = SpeakerCategory(name, verbose_name, predicate, by_average, min_rounds_option)
+
+def _is_esl_speaker(speaker):
+    from debate.models import Team
+    return speaker.team.type == Team.TYPE_ESL
+
+register_speaker_category("overall", "Overall", lambda speaker: True)
+register_speaker_category("novice", "Novice", lambda speaker: speaker.novice)
+register_speaker_category("esl", "ESL", _is_esl_speaker)
+register_speaker_category("average", "Average", lambda speaker: True, by_average=True,
+        min_rounds_option='speaker_tab_min_rounds')
+
+
+class SpeakerTabs(object):
+    """Speaker tabs for every category in SPEAKER_CATEGORIES, as of a round.
+    The scores are loaded into one SpeakerScoreMatrix, and each category is a
+    mask over the same speakers; all categories are ranked together by
+    category_ranks(). Use get(category) for a category's tab."""
+
+    def __init__(self, round):
+        from debate.models import Speaker
+
+        tournament = round.tournament
+        self.matrix = SpeakerScoreMatrix(round)
+        speakers = Speaker.objects.filter(id__in=self.matrix.speaker_ids).select_related(
+                'team', 'team__institution').prefetch_related('team__speaker_set')
+        speakers = dict((speaker.id, speaker) for speaker in speakers)
+        self.speakers = self.matrix.annotate([speakers[i] for i in self.matrix.speaker_ids])
+        self.categories = SPEAKER_CATEGORIES.values()
+
+        n = len(self.speakers)
+        masks = np.array([[c.predicate(s) for s in self.speakers] for c in self.categories], dtype=bool)
+        masks = masks.reshape(len(self.categories), n)
+        values = np.empty(masks.shape)
+        for i, category in enumerate(self.categories):
+            values[i] = self.matrix.averages if category.by_average else self.matrix.totals
+            if category.min_rounds_option:
+                masks[i] &= self.matrix.num_scores >= tournament.config.get(category.min_rounds_option)
+        self.ranks = category_ranks(values, masks)
+
+    def get(self, category):
+        """Returns a list of the speakers ranked in 'category' (a name), best
+        first, each a copy annotated as by SpeakerScoreMatrix.annotate(), but
+        with 'rank' being the rank in the category."""
+        index = [c.name for c in self.categories].index(category)
+        ranks = self.ranks[index]
+        speakers = list()
+        for i in np.nonzero(ranks)[0]:
+            speaker = copy.copy(self.speakers[i])
+            speaker.rank = int(ranks[i])
+            speakers.append(speaker)
+        speakers.sort(key=lambda s: (s.rank, s.name))
+        return speakers
+
+
+def get_teams_with_results(round):
+    """Returns a set of the IDs of teams whose debate in this round has a
+    confirmed ballot. Uses one query."""
+    from debate.models import DebateTeam
+    return set(DebateTeam.objects.filter(debate__round=round,
+            debate__ballotsubmission__confirmed=True).values_list('team_id', flat=True))
+
+
+class TeamRoundResult(object):
+    """The result of a team in a round, as held by TeamResultsMatrix."""
+
+    def __init__(self, team_id, round_id, debate_id, score, points, win, margin):
+        self.team_id = team_id
+        self.round_id = round_id
+        self.debate_id = debate_id
+        self.score = score
+        self.points = points
+        self.win = win
+        self.margin = margin
+        self.opposition_id = None
+        self.opposition = None
+
+
+class TeamResultsMatrix(object):
+    """The results of every team in every preliminary round up to and
+    including a given round, from confirmed ballots. The results are loaded in
+    one query, joining each TeamScore to both teams in its debate, and the
+    teams themselves (used for 'opposition') in one more, plus one to prefetch
+    their speakers.
+
+    Use get(team, round) to look up a result; it returns a TeamRoundResult,
+    or None if the team has no confirmed result in that round."""
+
+    def __init__(self, round):
+        from debate.models import TeamScore, Team, Round
+
+        tournament = round.tournament
+        scores = TeamScore.objects.filter(
+            ballot_submission__confirmed = True,
+            debate_team__team__tournament = tournament,
+            debate_team__debate__round__stage = Round.STAGE_PRELIMINARY,
+            debate_team__debate__round__seq__lte = round.seq,
+        ).values_list('debate_team__team_id', 'debate_team__debate__round_id',
+            'debate_team__debate_id', 'score', 'points', 'win', 'margin',
+            'debate_team__debate__debateteam__team_id').order_by()
+
+        self._results = dict()
+        for team_id, round_id, debate_id, score, points, win, margin, other_id in scores:
+            key = (team_id, round_id)
+            result = self._results.get(key)
+            if result is None:
+                result = self._results[key] = TeamRoundResult(team_id, round_id,
+                        debate_id, score, points, win, margin)
+            if other_id != team_id:
+                result.opposition_id = other_id
+
+        self.teams = dict((team.id, team) for team in Team.objects.filter(
+                tournament=tournament).select_related('institution').prefetch_related('speaker_set'))
+        for result in self._results.itervalues():
+            result.opposition = self.teams.get(result.opposition_id)
+
+    def get(self, team, round):
+        return self._results.get((getattr(team, 'id', team), getattr(round, 'id', round)))
@@ -30,15 +30,28 @@ def version(path_string, base_url=settings.MEDIA_URL):
         return base_url + path_string
 register.simple_tag(version)
 
+def _side_history(team, round):
+    """Returns the SideHistory annotated on the team, if it's for this round."""
+    history = getattr(team, 'side_history', None)
+    if history is not None and history.seq == round.seq:
+        return history
+    return None
+
 def aff_count(team, round):
     if round is None:
         return 0
+    history = _side_history(team, round)
+    if history is not None:
+        return history.aff_count(team)
     return team.get_aff_count(round.seq)
 register.simple_tag(aff_count)
 
 def neg_count(team, round):
     if round is None:
         return 0
+    history = _side_history(team, round)
+    if history is not None:
+        return history.neg_count(team)
     return team.get_neg_count(round.seq)
 register.simple_tag(neg_count)
 
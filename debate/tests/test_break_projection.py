@@ -0,0 +1,98 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+import numpy as np
+from collections import Counter
+from break_projection import simulated_breaks, BreakProjector, POINTS_WEIGHT
+
+def full_sort_breaks(points, scores, institutions, eligible, break_size, institution_cap):
+    """Returns the indices of the teams that break in one simulation, found by
+    sorting the whole field and going down it one team at a time."""
+    keys = [-(p * POINTS_WEIGHT + s) for p, s in zip(points, scores)]
+    order = sorted(xrange(len(keys)), key=lambda i: keys[i])
+    seen = Counter()
+    breaking = list()
+    count = group_count = 0
+    group_key = None
+    for i in order:
+        if keys[i] != group_key:
+            group_key, group_count = keys[i], count
+        capped = institution_cap > 0 and seen[institutions[i]] >= institution_cap
+        seen[institutions[i]] += 1
+        if eligible[i] and not capped:
+            if group_count < break_size:
+                breaking.append(i)
+            count += 1
+    return sorted(breaking)
+
+class TestSimulatedBreaks(unittest.TestCase):
+
+    def breaks(self, points, scores, institutions, eligible, break_size, institution_cap=0):
+        result = simulated_breaks(np.array([points], dtype=float), np.array([scores], dtype=float),
+                np.array(institutions), np.array(eligible, dtype=bool), break_size, institution_cap)
+        return list(np.nonzero(result[0])[0])
+
+    def test_simple(self):
+        self.assertEqual([0, 2], self.breaks([3, 1, 2, 0], [0, 0, 0, 0], [0, 1, 2, 3], [True] * 4, 2))
+
+    def test_speaker_score(self):
+        self.assertEqual([1, 2], self.breaks([2, 2, 2, 0], [150, 160, 155, 0], [0, 1, 2, 3], [True] * 4, 2))
+
+    def test_ineligible(self):
+        self.assertEqual([1, 2], self.breaks([3, 2, 1, 0], [0, 0, 0, 0], [0, 1, 2, 3], [False, True, True, True], 2))
+
+    def test_institution_cap(self):
+        # Team 2 is the third team from institution 0, so is capped
+        self.assertEqual([0, 1, 3], self.breaks([5, 4, 3, 2, 1], [0] * 5, [0, 0, 0, 1, 2], [True] * 5, 3, 2))
+        # Ineligible teams still count towards the cap
+        self.assertEqual([1, 3], self.breaks([5, 4, 3, 2, 1], [0] * 5, [0, 0, 0, 1, 2], [False, True, True, True, True], 2, 2))
+
+    def test_tie_at_cut(self):
+        self.assertEqual([0, 1, 2], self.breaks([3, 2, 2, 1], [10, 5, 5, 9], [0, 1, 2, 3], [True] * 4, 2))
+
+    def test_large_field(self):
+        # More teams than are considered at first, so exercises the re-sort
+        random = np.random.RandomState(0)
+        points = random.randint(0, 3, size=(50, 200)).astype(float)
+        scores = random.randint(0, 3, size=(50, 200)).astype(float)
+        institutions = random.randint(0, 40, size=200)
+        eligible = random.random_sample(200) > 0.1
+        result = simulated_breaks(points, scores, institutions, eligible, 8, 2)
+        for i in xrange(50):
+            expected = simulated_breaks(points[i:i+1], scores[i:i+1], institutions, eligible, 8, 2)[0]
+            # a single simulation with all 200 teams is checked against
+            # itself padded out to force the full sort
+            self.assertEqual(list(expected), list(result[i]))
+            self.assertTrue(result[i].sum() >= 8)
+            # and against the break found from a full sort
+            self.assertEqual(full_sort_breaks(points[i], scores[i], institutions, eligible, 8, 2),
+                    list(np.nonzero(result[i])[0]))
+
+class TestBreakProjector(unittest.TestCase):
+
+    def test_no_rounds_remaining(self):
+        projector = BreakProjector([3, 2, 1, 0], [300, 290, 280, 270], 3, 0, [0, 1, 2, 3], [True] * 4, 2)
+        projector.run(100)
+        self.assertEqual([1, 1, 0, 0], list(projector.probabilities))
+        self.assertEqual([0, 0, -1, -1], list(projector.points_needed))
+
+    def test_points_per_loss(self):
+        # Under WADL, a loss is still worth a point: the leader breaks
+        # whatever happens, so needs only the points from two losses
+        projector = BreakProjector([10, 0, 0, 0], [0] * 4, 2, 2, [0, 1, 2, 3], [True] * 4, 1,
+                points_per_win=2, points_per_loss=1)
+        projector.run(200, seed=0)
+        self.assertEqual(1, projector.probabilities[0])
+        self.assertEqual(2, projector.points_needed[0])
+
+    def test_probabilities(self):
+        random = np.random.RandomState(0)
+        points = random.binomial(5, 0.5, 100)
+        projector = BreakProjector(points, random.normal(375, 5, 100), 5, 3,
+                random.randint(0, 30, 100), [True] * 100, 16, 3)
+        probabilities = projector.run(1000, seed=0)
+        self.assertAlmostEqual(16, probabilities.sum(), delta=0.5)
+        self.assertTrue((probabilities[points == 0] < 0.01).all())
+
+if __name__ == '__main__':
+    unittest.main()
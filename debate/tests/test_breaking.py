@@ -0,0 +1,130 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+from breaking import BreakCategory, compute_breaks, seed_break
+from draw import DrawError
+import breaking
+
+class TestTeam(object):
+    """Basic implementation of team interface"""
+
+    def __init__(self, id, points, speaker_score, institution_id, type='N', cannot_break=False):
+        self.id = id
+        self.points = points
+        self.speaker_score = speaker_score
+        self.institution_id = institution_id
+        self.type = type
+        self.cannot_break = cannot_break
+
+    def __repr__(self):
+        return "<Team {0}>".format(self.id)
+
+OPEN = BreakCategory("open", "Open", lambda team: True, "break_size")
+ESL = BreakCategory("esl", "ESL", lambda team: team.type == 'E', "esl_break_size")
+
+class TestComputeBreaks(unittest.TestCase):
+
+    def breaks(self, data, categories, institution_cap=0):
+        teams = [TestTeam(*args) for args in data]
+        result = compute_breaks(teams, categories, institution_cap)
+        return dict((name, [(t.id, t.rank, t.break_rank) for t in teams])
+                for name, teams in result.iteritems())
+
+    def test_simple(self):
+        data = [(1, 3, 300, 1), (2, 2, 300, 2), (3, 1, 300, 3), (4, 0, 300, 4)]
+        self.assertEqual({"open": [(1, 1, 1), (2, 2, 2)]}, self.breaks(data, [(OPEN, 2)]))
+
+    def test_tie_at_cut(self):
+        data = [(1, 3, 300, 1), (2, 2, 300, 2), (3, 2, 300, 3), (4, 0, 300, 4)]
+        self.assertEqual({"open": [(1, 1, 1), (2, 2, 2), (3, 2, 2)]}, self.breaks(data, [(OPEN, 2)]))
+
+    def test_capped_and_ineligible(self):
+        data = [(1, 4, 300, 1), (2, 3, 300, 1), (3, 2, 300, 2, 'N', True), (4, 1, 300, 3), (5, 0, 300, 4)]
+        self.assertEqual({"open": [(1, 1, 1), (2, 2, "- (Capped)"), (3, 3, "- (Ineligible)"), (4, 4, 2)]},
+                self.breaks(data, [(OPEN, 2)], institution_cap=1))
+
+    def test_categories(self):
+        data = [(1, 3, 300, 1), (2, 2, 300, 2, 'E'), (3, 1, 300, 3), (4, 0, 300, 4, 'E')]
+        result = self.breaks(data, [(OPEN, 1), (ESL, 2)])
+        self.assertEqual([(1, 1, 1)], result["open"])
+        # Ranks and break ranks are within the category
+        self.assertEqual([(2, 1, 1), (4, 2, 2)], result["esl"])
+
+class TestSeedBreak(unittest.TestCase):
+
+    category = BreakCategory("open", "Open", lambda team: True, "break_size")
+
+    def seed(self, data, break_size):
+        teams = [TestTeam(*args) for args in data]
+        teams = compute_breaks(teams, [(self.category, break_size)], 0)["open"]
+        return [t.id for t in seed_break(teams, break_size)]
+
+    def test_simple(self):
+        data = [(1, 3, 300, 1), (2, 2, 290, 2), (3, 2, 280, 3), (4, 1, 270, 4)]
+        self.assertEqual([1, 2], self.seed(data, 2))
+
+    def test_ineligible(self):
+        data = [(1, 3, 300, 1, 'N', True), (2, 2, 290, 2), (3, 2, 280, 3), (4, 1, 270, 4)]
+        self.assertEqual([2, 3], self.seed(data, 2))
+
+    def test_tie_within_break(self):
+        data = [(1, 3, 300, 1), (2, 3, 300, 2), (3, 2, 280, 3), (4, 1, 270, 4)]
+        self.assertEqual([1, 2], self.seed(data, 2))
+
+    def test_tie_at_cut(self):
+        data = [(1, 3, 300, 1), (2, 2, 290, 2), (3, 2, 290, 3), (4, 1, 270, 4)]
+        self.assertRaises(DrawError, self.seed, data, 2)
+
+class FakeCache(object):
+    """Enough of Django's cache API for the break's cache versioning, with
+    a way to expire keys."""
+
+    def __init__(self):
+        self.data = dict()
+        self.timeouts = dict()
+
+    def add(self, key, value, timeout=300, version=None):
+        if (key, version) in self.data:
+            return False
+        self.set(key, value, timeout, version)
+        return True
+
+    def set(self, key, value, timeout=300, version=None):
+        self.data[(key, version)] = value
+        self.timeouts[(key, version)] = timeout
+
+    def get(self, key, default=None, version=None):
+        return self.data.get((key, version), default)
+
+    def incr(self, key, delta=1, version=None):
+        if (key, version) not in self.data:
+            raise ValueError("Key '%s' not found" % key)
+        self.data[(key, version)] += delta
+        return self.data[(key, version)]
+
+    def expire(self, key, version=None):
+        del self.data[(key, version)]
+
+class TestCacheVersion(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FakeCache()
+        self.version_key = breaking._cache_version_key(1)
+
+    def test_version_key_never_expires(self):
+        breaking._get_cache_version(self.cache, 1)
+        self.assertIsNone(self.cache.timeouts[(self.version_key, None)])
+
+    def test_no_stale_entry_after_version_key_expires(self):
+        version = breaking._get_cache_version(self.cache, 1)
+        self.cache.set("break", "stale", version=version)
+
+        # Results are entered, then the version key is lost
+        self.cache.incr(self.version_key)
+        self.cache.expire(self.version_key)
+
+        version = breaking._get_cache_version(self.cache, 1)
+        self.assertIsNone(self.cache.get("break", version=version))
+
+if __name__ == '__main__':
+    unittest.main()
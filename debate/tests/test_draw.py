@@ -36,6 +36,49 @@ class TestRandomDrawGenerator(unittest.TestCase):
                     self.assertEqual(pairing.flags, [])
 
 
+class TestRandomMatchingDrawGenerator(unittest.TestCase):
+    """Random draws using the matching method, with a field in which one
+    institution has nearly half the teams."""
+
+    teams = [(i, 'A') for i in xrange(1, 10)] + [(i, chr(ord('B') + i % 4)) for i in xrange(10, 21)]
+
+    def check_conflict_free(self, draw):
+        for pairing in draw:
+            self.assertFalse(pairing.aff_team.seen(pairing.neg_team))
+            self.assertNotEqual(pairing.aff_team.institution, pairing.neg_team.institution)
+            self.assertEqual(pairing.flags, [])
+
+    def test_draw(self):
+        for i in xrange(20):
+            teams = [TestTeam(*args, aff_count=0, hist=[args[0] + 1, args[0] - 1]) for args in self.teams]
+            draw = DrawGenerator("random", teams, avoid_conflicts="on").make_draw()
+            self.assertEqual(10, len(draw))
+            self.assertItemsEqual(teams, [t for pairing in draw for t in pairing.teams])
+            self.check_conflict_free(draw)
+
+    def test_impossible(self):
+        teams = [TestTeam(i, 'A' if i < 8 else 'B', aff_count=0) for i in xrange(10)]
+        draw = DrawGenerator("random", teams, avoid_conflicts="on").make_draw()
+        flags = sorted(pairing.flags for pairing in draw)
+        # Each B team can face an A team, leaving six A teams to face each other
+        self.assertEqual([[], [], ["no_matching"], ["no_matching"], ["no_matching"]], flags)
+
+    def test_allocated_sides(self):
+        for i in xrange(20):
+            teams = [TestTeam(*args, allocated_side="aff" if args[0] % 2 else "neg") for args in self.teams]
+            draw = DrawGenerator("random", teams, side_allocations="preallocated",
+                    avoid_conflicts="on").make_draw()
+            for pairing in draw:
+                self.assertEqual("aff", pairing.aff_team.allocated_side)
+                self.assertEqual("neg", pairing.neg_team.allocated_side)
+            self.check_conflict_free(draw)
+
+    def test_invalid_method(self):
+        teams = [TestTeam(*args, aff_count=0) for args in self.teams]
+        drawer = DrawGenerator("random", teams, avoid_conflicts="on", conflict_method="magic")
+        self.assertRaises(ValueError, drawer.make_draw)
+
+
 class TestPowerPairedDrawGeneratorParts(unittest.TestCase):
     """Basic unit test for core functionality of power-paired draws.
     Nowhere near comprehensive."""
@@ -270,6 +313,13 @@ class TestPowerPairedDrawGeneratorParts(unittest.TestCase):
     def _1u1d_no_change(data):
         return [((t1[0], t2[0]), []) for t1, t2 in data]
 
+    def test_conflict_matrices(self):
+        affs = [TestTeam(1, 'A', None, [6]), TestTeam(2, 'B'), TestTeam(3, 'C', None, [5, 5])]
+        negs = [TestTeam(4, 'B'), TestTeam(5, 'A'), TestTeam(6, 'C')]
+        same_institution, history = self.ppd._conflict_matrices(affs, negs)
+        self.assertEqual([[0, 1, 0], [1, 0, 0], [0, 0, 1]], same_institution.astype(int).tolist())
+        self.assertEqual([[0, 0, 1], [0, 0, 0], [0, 2, 0]], history.tolist())
+
     def test_no_swap(self):
         data = (((1, 'A'), (5, 'B')),
                 ((2, 'C'), (6, 'A')),
@@ -327,6 +377,53 @@ class TestPowerPairedDrawGeneratorParts(unittest.TestCase):
                     ((4, 7), ["1u1d_hist"])]
         self.one_up_one_down(data, expected)
 
+    def test_min_cost_matching_swap_institution(self):
+        data = (((1, 'A'), (5, 'A')),
+                ((2, 'C'), (6, 'B')),
+                ((3, 'B'), (7, 'D')),
+                ((4, 'C'), (8, 'A')))
+        expected = [((1, 6), ["1u1d_inst"]),
+                    ((2, 5), ["1u1d_other"]),
+                    ((3, 7), []),
+                    ((4, 8), [])]
+        self.one_up_one_down(data, expected, avoid_conflicts="min_cost_matching")
+
+    def test_min_cost_matching_no_change(self):
+        data = (((1, 'A'), (5, 'B')),
+                ((2, 'C'), (6, 'A')),
+                ((3, 'B'), (7, 'D')),
+                ((4, 'C'), (8, 'A')))
+        expected = self._1u1d_no_change(data)
+        self.one_up_one_down(data, expected, avoid_conflicts="min_cost_matching")
+
+    def test_min_cost_matching_cluster(self):
+        # Swapping with the debate above or below can't fix the first two
+        # debates, but matching over the whole draw can.
+        self.ppd.options["avoid_conflicts"] = "min_cost_matching"
+        data = (((1, 'A'), (5, 'A')),
+                ((2, 'A'), (6, 'A')),
+                ((3, 'B'), (7, 'C')),
+                ((4, 'C'), (8, 'B')))
+        pairings = [Pairing([TestTeam(*d1), TestTeam(*d2)], None, None) for d1, d2 in data]
+        self.ppd.avoid_conflicts({0: pairings})
+        for pairing in pairings:
+            self.assertFalse(pairing.conflict_inst)
+        self.assertEqual([p.flags for p in pairings], [["1u1d_inst"], ["1u1d_inst"],
+                ["1u1d_other"], ["1u1d_other"]])
+        self.assertEqual([1, 2, 3, 4], [p.teams[0].id for p in pairings])
+
+    def test_min_cost_matching_bracket_order(self):
+        # The conflicted debate is next to the 2-point bracket in bracket
+        # order, though not in the order of the dict
+        self.ppd.options["avoid_conflicts"] = "min_cost_matching"
+        teams = dict((points, Pairing([TestTeam(*d1), TestTeam(*d2)], points, None))
+                for points, d1, d2 in ((3, (1, 'A'), (4, 'A')), (2, (2, 'D'), (5, 'B')),
+                        (1, (3, 'E'), (6, 'C'))))
+        pairings = OrderedDict((points, [teams[points]]) for points in (3, 1, 2))
+        self.ppd.avoid_conflicts(pairings)
+        self.assertEqual([(1, 5), (2, 4), (3, 6)],
+                [tuple(t.id for t in teams[points].teams) for points in (3, 2, 1)])
+
 
 class TestPowerPairedDrawGenerator(unittest.TestCase):
     """Test the entire draw functions as a black box."""
@@ -785,5 +882,66 @@ class TestEliminationDrawGenerator(unittest.TestCase):
         pairings = self.ed.make_draw()
         self.assertEqual([(p.aff_team.id, p.neg_team.id) for p in pairings], expected)
 
+class TestRoundRobinDrawGenerator(unittest.TestCase):
+
+    class Division(object):
+        def __init__(self, id, name):
+            self.id = id
+            self.name = name
+
+    def test_circle_schedule(self):
+        from draw import circle_schedule
+        for n in xrange(2, 14):
+            schedule = circle_schedule(n)
+            self.assertEqual(n - 1 + n % 2, len(schedule))
+            met = [frozenset(pair) for pairs in schedule for pair in pairs]
+            self.assertEqual(n * (n - 1) / 2, len(set(met)))
+            self.assertEqual(len(met), len(set(met)))
+            for pairs in schedule:
+                teams = [t for pair in pairs for t in pair]
+                self.assertEqual(len(teams), len(set(teams)))
+                self.assertEqual(n - n % 2, len(teams))
+            for team in xrange(n):
+                affs = sum(1 for pairs in schedule for aff, neg in pairs if aff == team)
+                negs = sum(1 for pairs in schedule for aff, neg in pairs if neg == team)
+                self.assertLessEqual(abs(affs - negs), 1)
+
+    def test_draw(self):
+        divisions = [self.Division(1, "1"), self.Division(2, "2")]
+        teams = [TestTeam(i, 'A', division=divisions[i % 2]) for i in xrange(11)]
+        met = list()
+        for r in xrange(1, 11):
+            draw = DrawGenerator("round_robin", teams, round_number=r).make_draw()
+            self.assertEqual(5, len(draw)) # six and five teams
+            for pairing in draw:
+                self.assertIs(pairing.aff_team.division, pairing.neg_team.division)
+                self.assertIs(pairing.division, pairing.aff_team.division)
+            met.extend((p.aff_team.id, p.neg_team.id) for p in draw)
+        # Each division is complete after five rounds, and then repeats with
+        # sides swapped
+        self.assertEqual(15 + 10, len(set(frozenset(pair) for pair in met)))
+        self.assertEqual(50, len(set(met)))
+
+    def test_absent_teams(self):
+        # Division membership changes between rounds, but the schedule
+        # doesn't: the teams that would have met absent teams have byes.
+        division = self.Division(1, "1")
+        teams = [TestTeam(i, 'A', division=division) for i in xrange(8)]
+        rosters = {1: [team.id for team in teams]}
+        absences = {1: [], 2: [3], 3: [0, 5], 4: [5, 6, 7], 5: []}
+        for r, absent in sorted(absences.iteritems()):
+            full = DrawGenerator("round_robin", teams, round_number=r, rosters=rosters).make_draw()
+            present = [team for team in teams if team.id not in absent]
+            draw = DrawGenerator("round_robin", present, round_number=r, rosters=rosters).make_draw()
+            expected = [(p.aff_team.id, p.neg_team.id) for p in full
+                    if p.aff_team.id not in absent and p.neg_team.id not in absent]
+            self.assertEqual(expected, [(p.aff_team.id, p.neg_team.id) for p in draw])
+
+    def test_team_not_on_roster(self):
+        division = self.Division(1, "1")
+        teams = [TestTeam(i, 'A', division=division) for i in xrange(4)]
+        self.assertRaises(DrawError, DrawGenerator("round_robin", teams,
+                rosters={1: [0, 1, 2]}).make_draw)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
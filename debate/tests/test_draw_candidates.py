@@ -0,0 +1,94 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+from draw import Pairing, DrawGenerator
+from draw_candidates import score_draw, best_draw
+import draw_candidates
+from test_one_up_one_down import TestTeam
+
+class TestScoreDraw(unittest.TestCase):
+
+    OPTIONS = {"avoid_history": True, "avoid_institution": True, "history_penalty": 1e3,
+            "institution_penalty": 1, "side_allocations": "balance"}
+
+    def test_score(self):
+        teams = [TestTeam(1, 'A', 3, [2], aff_count=2, neg_count=0),
+                 TestTeam(2, 'B', 2, aff_count=1, neg_count=1),
+                 TestTeam(3, 'C', 2, aff_count=1, neg_count=1),
+                 TestTeam(4, 'C', 2, aff_count=1, neg_count=1)]
+        pairings = [Pairing(teams[0:2], 0, 0), Pairing(teams[2:4], 0, 0)]
+        # history conflict, pull-up and side imbalance; institution conflict
+        self.assertEqual(1e3 + 1 + 0.5 + 1, score_draw(pairings, self.OPTIONS))
+
+        options = dict(self.OPTIONS, avoid_history=False, side_allocations="random")
+        self.assertEqual(1 + 1, score_draw(pairings, options))
+
+class TestBestDraw(unittest.TestCase):
+
+    teams = [(1, 'A'), (2, 'B'), (3, 'A'), (4, 'B'), (5, 'C'), (6, 'D'),
+             (7, 'E'), (8, 'A'), (9, 'D'), (10, 'E'), (11, 'D'), (12, 'A')]
+
+    # Conflicts aren't avoided, so that the candidates' scores differ
+    options = {"avoid_conflicts": "off", "avoid_institution": True, "institution_penalty": 1}
+    seeds = [1, 2, 3, 4, 5, 6]
+
+    def make_teams(self):
+        return [TestTeam(*args, aff_count=0) for args in self.teams]
+
+    def candidate_draws(self, teams):
+        """Returns the (score, draw) for each seed, generated in this process
+        as a worker would."""
+        draw_candidates._init_worker("random", teams, None, self.options)
+        candidates = list()
+        for seed in self.seeds:
+            score, seed, rows = draw_candidates._generate(seed)
+            candidates.append((score, self.ids(draw_candidates._pairings(teams, rows))))
+        return candidates
+
+    @staticmethod
+    def ids(draw):
+        return [tuple(team.id for team in pairing.teams) for pairing in draw]
+
+    def test_best_draw(self):
+        teams = self.make_teams()
+        draw = best_draw("random", teams, None, self.options, time_limit=30, processes=2,
+                seeds=self.seeds)
+        self.assertEqual(6, len(draw))
+        self.assertItemsEqual(teams, [team for pairing in draw for team in pairing.teams])
+
+        # The best is the best of the same seeds' draws
+        candidates = self.candidate_draws(teams)
+        drawer = DrawGenerator("random", teams, **self.options)
+        self.assertEqual(min(candidates)[0], score_draw(draw, drawer.options))
+        self.assertIn(self.ids(draw), [ids for score, ids in candidates])
+
+    def test_random_seeds(self):
+        teams = self.make_teams()
+        draw = best_draw("random", teams, None, self.options, candidates=4, processes=2)
+        self.assertEqual(6, len(draw))
+        self.assertItemsEqual(teams, [team for pairing in draw for team in pairing.teams])
+
+    def test_time_limit(self):
+        # With no time, a draw still comes from one of the candidates, rather
+        # than being generated again from scratch
+        teams = self.make_teams()
+        draw = best_draw("random", teams, None, self.options, time_limit=0, processes=2,
+                seeds=self.seeds)
+        self.assertIn(self.ids(draw), [ids for score, ids in self.candidate_draws(teams)])
+
+    def test_before_fork(self):
+        calls = list()
+        teams = self.make_teams()
+        best_draw("random", teams, seeds=self.seeds[:2], processes=2,
+                before_fork=lambda: calls.append(len(calls)))
+        self.assertEqual([0], calls)
+        best_draw("random", teams, candidates=1, before_fork=lambda: calls.append(len(calls)))
+        self.assertEqual([0], calls) # no pool, so no fork
+
+    def test_single(self):
+        teams = [TestTeam(*args, aff_count=0) for args in self.teams]
+        draw = best_draw("random", teams, candidates=1)
+        self.assertEqual(6, len(draw))
+
+if __name__ == '__main__':
+    unittest.main()
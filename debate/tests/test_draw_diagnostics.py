@@ -0,0 +1,48 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+from draw import Pairing
+from draw_diagnostics import DrawDiagnostics
+from test_one_up_one_down import TestTeam
+
+class TestDrawDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        teams = [TestTeam(1, 'A', 4, aff_count=2, neg_count=1), TestTeam(2, 'B', 2, aff_count=1, neg_count=2),
+                 TestTeam(3, 'C', 2, aff_count=2, neg_count=1), TestTeam(4, 'C', 2, aff_count=2, neg_count=1),
+                 TestTeam(5, 'D', 1, aff_count=1, neg_count=2), TestTeam(6, 'E', 0, aff_count=1, neg_count=2)]
+        self.pairings = [Pairing(teams[0:2], 0, 0), Pairing(teams[2:4], 0, 0), Pairing(teams[4:6], 0, 0)]
+        self.history = {(3, 4): 2, (4, 3): 2, (5, 6): 1, (6, 5): 1}
+
+    def test_diagnostics(self):
+        diagnostics = DrawDiagnostics(self.pairings, self.history)
+        self.assertEqual({
+            "debates": 3,
+            "history_conflicts": 2,
+            "history_total": 3,
+            "rematches": {0: 1, 1: 1, 2: 1},
+            "institution_conflicts": 1,
+            "pullups": 2,
+            "bracket_distance_total": 3,
+            "bracket_distance_max": 2,
+            "side_imbalance": {2: 2, -2: 2, 0: 2},
+            "side_imbalanced_teams": 4,
+        }, diagnostics.as_dict())
+
+    def test_sides(self):
+        class Sides(object):
+            def aff_count(self, team):
+                return 0
+            def neg_count(self, team):
+                return 0
+        diagnostics = DrawDiagnostics(self.pairings, self.history, Sides())
+        self.assertEqual({1: 3, -1: 3}, diagnostics.side_imbalance)
+
+    def test_seen(self):
+        # Without a history dict, Team.seen() is used
+        for pairing in self.pairings:
+            pairing.teams[0].hist = [pairing.teams[1].id]
+        self.assertEqual(3, DrawDiagnostics(self.pairings).history_conflicts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+from draw_editor import DrawEditIndex
+
+class TestDrawEditIndex(unittest.TestCase):
+
+    institutions = {1: 10, 2: 10, 3: 11, 4: 12, 5: 13}
+    history = {(1, 3): 1, (3, 1): 1, (2, 4): 2, (4, 2): 2}
+
+    def setUp(self):
+        self.index = DrawEditIndex(self.institutions, self.history)
+
+    def test_conflicts(self):
+        self.assertEqual({"history": 0, "institution": 1}, self.index.conflicts(1, 2))
+        self.assertEqual({"history": 2, "institution": 0}, self.index.conflicts(4, 2))
+        self.assertEqual({"history": 0, "institution": 0}, self.index.conflicts(1, 99))
+
+    def test_swap(self):
+        # 1 vs 2 (institution), 3 vs 4; swapping 2 and 3 gives 1 vs 3 (history)
+        # and 2 vs 4 (history, twice)
+        delta = self.index.swap_delta((1, 2), (3, 4), 1, 0)
+        self.assertEqual(3, delta["history"])
+        self.assertEqual(-1, delta["institution"])
+        self.assertEqual([{"history": 0, "institution": 1}, {"history": 0, "institution": 0}],
+                delta["before"])
+        self.assertEqual([{"history": 1, "institution": 0}, {"history": 2, "institution": 0}],
+                delta["after"])
+
+        # and swapping back undoes it
+        back = self.index.swap_delta((1, 3), (2, 4), 1, 0)
+        self.assertEqual((-3, 1), (back["history"], back["institution"]))
+
+    def test_swap_sides(self):
+        delta = self.index.swap_delta((1, 3), None, 0, 1)
+        self.assertEqual((0, 0), (delta["history"], delta["institution"]))
+        self.assertEqual([{"history": 1, "institution": 0}], delta["after"])
+
+if __name__ == '__main__':
+    unittest.main()
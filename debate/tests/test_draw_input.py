@@ -0,0 +1,62 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+import pickle
+from draw import DrawGenerator
+from draw_input import TeamRecord, DivisionRecord
+
+class TestTeamRecord(unittest.TestCase):
+
+    # One bracket, which slides 1 vs 5, 2 vs 6 and so on
+    teams = [(1, 10, 2), (2, 11, 2), (3, 12, 2), (4, 13, 2),
+             (5, 14, 2), (6, 11, 2), (7, 15, 2), (8, 16, 2)]
+    history = {(1, 5): 1, (5, 1): 1, (1, 2): 2, (2, 1): 2}
+
+    def make_records(self):
+        return [TeamRecord(id, inst, points, aff_count=0, neg_count=0, history=self.history)
+                for id, inst, points in self.teams]
+
+    def test_seen(self):
+        records = self.make_records()
+        self.assertEqual(2, records[0].seen(records[1]))
+        self.assertEqual(1, records[4].seen(records[0]))
+        self.assertEqual(0, records[0].seen(records[2]))
+        self.assertEqual(0, TeamRecord(1, 10).seen(records[1]))
+
+    def test_slots(self):
+        record = TeamRecord(1, 10)
+        self.assertRaises(AttributeError, setattr, record, 'seen_history', {})
+
+    def test_pickle(self):
+        division = DivisionRecord(1, "1")
+        records = self.make_records()
+        for record in records:
+            record.division = division
+        for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+            copies = pickle.loads(pickle.dumps(records, protocol))
+            self.assertEqual([r.id for r in records], [r.id for r in copies])
+            self.assertEqual(2, copies[0].seen(copies[1]))
+            # The history index and divisions are still shared
+            self.assertIs(copies[0].history, copies[7].history)
+            self.assertIs(copies[0].division, copies[7].division)
+            self.assertEqual("1", copies[0].division.name)
+
+    def test_power_paired(self):
+        records = self.make_records()
+        draw = DrawGenerator("power_paired", records, avoid_conflicts="one_up_one_down",
+                avoid_history=True, avoid_institution=True).make_draw()
+        self.assertEqual(4, len(draw))
+        for pairing in draw:
+            self.assertFalse(pairing.conflict_hist)
+            self.assertFalse(pairing.conflict_inst)
+
+    def test_round_robin(self):
+        divisions = [DivisionRecord(1, "1"), DivisionRecord(2, "2")]
+        records = [TeamRecord(i, 10, division=divisions[i % 2]) for i in xrange(8)]
+        draw = DrawGenerator("round_robin", records, round_number=2).make_draw()
+        self.assertEqual(4, len(draw))
+        for pairing in draw:
+            self.assertIs(pairing.division, pairing.neg_team.division)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests for DrawJob. Unlike the rest of this directory, these need the
+database, so they're skipped unless run under Django:
+
+ $ python manage.py test debate.tests.test_draw_job
+"""
+import os
+import unittest
+
+if os.environ.get('DJANGO_SETTINGS_MODULE'):
+    # DrawJob.run() closes the connection when it's done, which a
+    # transaction-wrapped TestCase wouldn't survive
+    from django.test import TransactionTestCase as TestCase
+else:
+    TestCase = unittest.TestCase
+
+@unittest.skipUnless(os.environ.get('DJANGO_SETTINGS_MODULE'), "needs Django")
+class TestDrawJob(TestCase):
+
+    def setUp(self):
+        from debate.models import Round, DrawJob
+        from debate.management.commands._synthetic import build_tournament
+        self.tournament = build_tournament(8, 2, seed=1)
+        self.round = Round.objects.get(tournament=self.tournament, seq=2)
+        self.DrawJob = DrawJob
+
+    def make_old(self, job):
+        from django.utils import timezone
+        updated = timezone.now() - self.DrawJob.STALE_AFTER * 2
+        self.DrawJob.objects.filter(pk=job.pk).update(updated=updated)
+
+    def refresh(self, job):
+        return self.DrawJob.objects.get(pk=job.pk)
+
+    def test_start_reuses_active_job(self):
+        job = self.DrawJob.objects.create(round=self.round, status=self.DrawJob.STATUS_RUNNING)
+        again, started = self.DrawJob.objects.start(self.round)
+        self.assertFalse(started)
+        self.assertEqual(job.pk, again.pk)
+        self.assertEqual(1, self.DrawJob.objects.filter(round=self.round).count())
+
+    def test_stale_job_fails(self):
+        job = self.DrawJob.objects.create(round=self.round, status=self.DrawJob.STATUS_RUNNING)
+        self.make_old(job)
+        latest = self.DrawJob.objects.latest_for_round(self.round)
+        self.assertEqual(job.pk, latest.pk)
+        self.assertEqual(self.DrawJob.STATUS_FAILED, latest.status)
+        self.assertEqual(self.DrawJob.STALE_ERROR, latest.error)
+        self.assertFalse(latest.active)
+
+    def test_recent_job_not_stale(self):
+        job = self.DrawJob.objects.create(round=self.round, status=self.DrawJob.STATUS_RUNNING)
+        self.DrawJob.objects.fail_stale(self.round)
+        self.assertTrue(self.refresh(job).active)
+
+    def test_cancel(self):
+        job = self.DrawJob.objects.create(round=self.round)
+        self.assertEqual(1, self.DrawJob.objects.cancel(self.round))
+        job = self.refresh(job)
+        self.assertEqual(self.DrawJob.STATUS_FAILED, job.status)
+        self.assertEqual(self.DrawJob.CANCELLED_ERROR, job.error)
+
+    def test_cancelled_job_doesnt_run(self):
+        job = self.DrawJob.objects.create(round=self.round)
+        self.DrawJob.objects.cancel(self.round)
+        job.run()
+        job = self.refresh(job)
+        self.assertEqual(self.DrawJob.STATUS_FAILED, job.status)
+        self.assertEqual(self.DrawJob.CANCELLED_ERROR, job.error)
+
+    def test_failure(self):
+        # The round already has a draw, so drawing it fails
+        job = self.DrawJob.objects.create(round=self.round)
+        job.run()
+        job = self.refresh(job)
+        self.assertEqual(self.DrawJob.STATUS_FAILED, job.status)
+        self.assertIn("already has a draw", job.error)
+        self.assertFalse(job.active)
+
+if __name__ == '__main__':
+    unittest.main()
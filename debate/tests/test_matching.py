@@ -0,0 +1,69 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+import itertools
+import numpy as np
+from matching import min_cost_assignment, max_bipartite_matching
+
+class TestMinCostAssignment(unittest.TestCase):
+
+    def brute_force(self, cost):
+        n, m = cost.shape
+        return min(sum(cost[i, j] for i, j in enumerate(columns))
+                for columns in itertools.permutations(xrange(m), n))
+
+    def check(self, cost):
+        assignment = min_cost_assignment(cost)
+        self.assertEqual(len(set(assignment)), len(assignment))
+        total = cost[np.arange(len(assignment)), assignment].sum()
+        self.assertAlmostEqual(self.brute_force(cost), total)
+
+    def test_identity(self):
+        cost = np.ones((4, 4)) - np.eye(4)
+        self.assertEqual([0, 1, 2, 3], list(min_cost_assignment(cost)))
+
+    def test_random(self):
+        random = np.random.RandomState(0)
+        for i in xrange(100):
+            n = random.randint(1, 6)
+            self.check(random.randint(0, 10, size=(n, n)).astype(float))
+
+    def test_rectangular(self):
+        random = np.random.RandomState(1)
+        for i in xrange(20):
+            self.check(random.random_sample((3, 5)))
+
+    def test_too_many_rows(self):
+        self.assertRaises(ValueError, min_cost_assignment, np.zeros((3, 2)))
+
+class TestMaxBipartiteMatching(unittest.TestCase):
+
+    def check(self, compatible):
+        match = max_bipartite_matching(compatible)
+        matched = [(i, j) for i, j in enumerate(match) if j >= 0]
+        self.assertEqual(len(set(j for i, j in matched)), len(matched))
+        for i, j in matched:
+            self.assertTrue(compatible[i, j])
+        # The largest matching has the least cost if incompatible pairs cost 1
+        n, m = compatible.shape
+        best = min_cost_assignment(~compatible)
+        self.assertEqual(np.count_nonzero(compatible[np.arange(n), best]), len(matched))
+
+    def test_augmenting_path(self):
+        # Greedy matching takes (0, 0), which must be undone to match row 1
+        compatible = np.array([[True, True], [True, False]])
+        self.assertEqual([1, 0], list(max_bipartite_matching(compatible)))
+
+    def test_random(self):
+        random = np.random.RandomState(0)
+        for i in xrange(100):
+            n = random.randint(1, 8)
+            self.check(random.random_sample((n, n)) < random.random_sample())
+
+    def test_rectangular(self):
+        random = np.random.RandomState(1)
+        for i in xrange(20):
+            self.check(random.random_sample((4, 6)) < 0.3)
+
+if __name__ == '__main__':
+    unittest.main()
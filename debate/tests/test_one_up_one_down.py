@@ -1,6 +1,7 @@
 import os.path, sys
 if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
 import unittest
+import numpy as np
 from one_up_one_down import OneUpOneDownSwapper
 
 class TestTeam(object):
@@ -149,11 +150,31 @@ class TestOneUpOneDown(unittest.TestCase):
         self.assertEqual(result, self.draw(data))
         return self.draw(data)
 
-    def draw(self, data, **options):
+    def testMatrices(self):
+        data = (((1, 'A', None, 5), (5, 'B')),
+                ((2, 'C'), (6, 'C')),
+                ((3, 'B'), (7, 'D')),
+                ((4, 'C', None, 8), (8, 'A')))
+        result = [(1, 6), (2, 5), (3, 8), (4, 7)]
+        self.assertEqual(result, self.draw(data))
+        self.assertEqual(result, self.draw(data, matrices=True))
+        return self.draw(data)
+
+    def testDP(self):
+        self.assertEqual((0, []), OneUpOneDownSwapper.dp([]))
+        self.assertEqual((5, [1, 3]), OneUpOneDownSwapper.dp([1, 2, 1, 3]))
+        self.assertEqual((5, [0, 2]), OneUpOneDownSwapper.dp(np.array([3, -1, 2, 1])))
+
+    def draw(self, data, matrices=False, **options):
         d = []
         for data1, data2 in data:
             d.append((TestTeam(*data1), TestTeam(*data2)))
-        r = OneUpOneDownSwapper(**options).run(d)
+        if matrices:
+            same_institution = np.array([[a.institution == n.institution for _, n in d] for a, _ in d])
+            history = np.array([[a.seen(n) for _, n in d] for a, _ in d])
+            r = OneUpOneDownSwapper(**options).run(d, same_institution, history)
+        else:
+            r = OneUpOneDownSwapper(**options).run(d)
         return [(a.id, b.id) for (a, b) in r]
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+import os.path, sys
+if os.path.abspath("..") not in sys.path: sys.path.append(os.path.abspath(".."))
+import unittest
+from standings import break_ties_head_to_head, annotate_draw_strength
+from standings import sort_teams, rank_teams, subrank_teams
+from standings import serialise_standings, deserialise_standings
+import json
+
+class TestTeam(object):
+    """Basic implementation of team interface"""
+
+    def __init__(self, id, points, speaker_score=0, draw_strength=0):
+        self.id = id
+        self.points = points
+        self.speaker_score = speaker_score
+        self.draw_strength = draw_strength
+
+    def __repr__(self):
+        return "<Team {0}>".format(self.id)
+
+KEYS = [lambda x: x.points, lambda x: (x.points, x.speaker_score),
+        lambda x: (x.points, x.speaker_score, x.draw_strength)]
+
+class TestHeadToHead(unittest.TestCase):
+
+    def break_ties(self, data, head_to_head):
+        teams = [TestTeam(*args) for args in data]
+        teams.sort(key=KEYS[-1], reverse=True)
+        return [team.id for team in break_ties_head_to_head(teams, KEYS, head_to_head)]
+
+    def test_no_ties(self):
+        data = [(1, 3), (2, 2), (3, 1)]
+        self.assertEqual([1, 2, 3], self.break_ties(data, {(3, 1): 1}))
+
+    def test_two_on_points(self):
+        # Only two teams on 2 points, so head-to-head beats speaker score
+        data = [(1, 3), (2, 2, 300), (3, 2, 290), (4, 1)]
+        self.assertEqual([1, 3, 2, 4], self.break_ties(data, {(3, 2): 1}))
+        self.assertEqual([1, 2, 3, 4], self.break_ties(data, {(2, 3): 1}))
+        self.assertEqual([1, 2, 3, 4], self.break_ties(data, {}))
+
+    def test_two_teams_not_tied(self):
+        # Head-to-head only applies between teams tied on points
+        self.assertEqual([1, 2], self.break_ties([(1, 3), (2, 2)], {(2, 1): 1}))
+        self.assertEqual([1, 2], self.break_ties([(1, 2, 290), (2, 2, 300)], {(1, 2): 1}))
+
+    def test_three_on_points(self):
+        # Three teams on 2 points, so speaker score applies first
+        data = [(1, 2, 300), (2, 2, 290), (3, 2, 280)]
+        self.assertEqual([1, 2, 3], self.break_ties(data, {(3, 2): 1, (2, 1): 1}))
+        # ... unless two are also equal on speaker score
+        data = [(1, 2, 300), (2, 2, 290), (3, 2, 290)]
+        self.assertEqual([1, 3, 2], self.break_ties(data, {(3, 2): 1, (2, 1): 1}))
+
+    def test_draw_strength(self):
+        teams = [TestTeam(1, 2), TestTeam(2, 1), TestTeam(3, 0), TestTeam(4, 1)]
+        annotate_draw_strength(teams, {10: [1, 2], 11: [3, 4], 12: [1, 4], 13: [2, 3]})
+        self.assertEqual([2, 2, 2, 2], [team.draw_strength for team in teams])
+
+class TestRanking(unittest.TestCase):
+
+    DATA = [(1, 2, 150), (2, 3, 140), (3, 2, 160), (4, 2, 150), (5, 0, 130)]
+    METRICS = ("points", "speaker_score")
+
+    def sorted_teams(self, shuffle=False):
+        return sort_teams([TestTeam(*args) for args in self.DATA], self.METRICS, shuffle)
+
+    def test_sort(self):
+        self.assertEqual([2, 3, 1, 4, 5], [team.id for team in self.sorted_teams()])
+
+    def test_sort_shuffle(self):
+        for i in xrange(10):
+            ids = [team.id for team in self.sorted_teams(shuffle=True)]
+            self.assertEqual([2, 3], ids[:2])
+            self.assertEqual(set([1, 4]), set(ids[2:4]))
+            self.assertEqual(5, ids[4])
+
+    def test_rank(self):
+        teams = rank_teams(self.sorted_teams(), self.METRICS)
+        self.assertEqual([1, 2, 3, 3, 5], [team.rank for team in teams])
+
+    def test_subrank(self):
+        teams = subrank_teams(self.sorted_teams(), self.METRICS)
+        self.assertEqual([1, 1, 2, 2, 1], [team.subrank for team in teams])
+
+class TestSnapshot(unittest.TestCase):
+
+    METRICS = ("points", "speaker_score", "draw_strength")
+
+    def test_round_trip(self):
+        teams = [TestTeam(*args) for args in [(1, 2, 150.5, 3), (2, 3, 140, 4), (3, 2, 150.5, 5)]]
+        for team in teams:
+            team.margins = team.id * 2.5
+        teams = subrank_teams(rank_teams(sort_teams(teams, self.METRICS), self.METRICS), self.METRICS)
+        data = json.loads(json.dumps(serialise_standings(teams, self.METRICS)))
+
+        # Teams not in the snapshot are left out
+        fresh = [TestTeam(id, None) for id in (1, 3, 2, 4)]
+        loaded = deserialise_standings(data, fresh)
+        self.assertEqual([2, 3, 1], [team.id for team in loaded])
+        for before, after in zip(teams, loaded):
+            for field in ("points", "speaker_score", "margins", "draw_strength", "rank", "subrank"):
+                self.assertEqual(getattr(before, field), getattr(after, field))
+
+if __name__ == '__main__':
+    unittest.main()
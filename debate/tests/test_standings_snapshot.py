@@ -0,0 +1,43 @@
+"""Tests for StandingsSnapshot. Unlike the rest of this directory, these need
+the database, so they're skipped unless run under Django:
+
+ $ python manage.py test debate.tests.test_standings_snapshot
+"""
+import os
+import unittest
+
+if os.environ.get('DJANGO_SETTINGS_MODULE'):
+    from django.test import TestCase
+else:
+    TestCase = unittest.TestCase
+
+@unittest.skipUnless(os.environ.get('DJANGO_SETTINGS_MODULE'), "needs Django")
+class TestStandingsSnapshot(TestCase):
+
+    def setUp(self):
+        from debate.models import Round, StandingsSnapshot
+        from debate.management.commands._synthetic import build_tournament
+        self.tournament = build_tournament(8, 2, seed=1)
+        self.rounds = list(Round.objects.filter(tournament=self.tournament).order_by('seq'))
+        self.snapshots = StandingsSnapshot.objects
+
+    def test_results_changed_is_lazy(self):
+        self.snapshots.take(self.rounds[0])
+        self.snapshots.take(self.rounds[1])
+        self.snapshots.results_changed(self.rounds[0])
+        self.assertFalse(self.snapshots.filter(round__in=self.rounds).exists())
+
+        # Every result is confirmed, so the snapshot is taken when looked up
+        snapshot = self.snapshots.lookup(self.rounds[1])
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot.pk, self.snapshots.lookup(self.rounds[1]).pk)
+
+    def test_incomplete_round(self):
+        from debate.models import BallotSubmission
+        BallotSubmission.objects.filter(debate__round=self.rounds[1]).update(confirmed=False)
+        self.snapshots.results_changed(self.rounds[1])
+        self.assertIsNone(self.snapshots.lookup(self.rounds[1]))
+        self.assertFalse(self.snapshots.filter(round=self.rounds[1]).exists())
+
+if __name__ == '__main__':
+    unittest.main()
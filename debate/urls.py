@@ -34,6 +34,7 @@ urlpatterns = patterns('debate.views',
 
     url(r'^tab/team/$', 'public_team_tab', name='public_team_tab'),
     url(r'^tab/speaker/$', 'public_speaker_tab', name='public_speaker_tab'),
+    url(r'^tab/speaker/(?P<category>\w+)/$', 'public_speaker_tab', name='public_speaker_tab_category'),
     url(r'^tab/replies/$', 'public_replies_tab', name='public_replies_tab'),
     url(r'^tab/motions/$', 'public_motions_tab', name='public_motions_tab'),
     url(r'^ballots/debate/(?P<debate_id>\d+)/$', 'public_ballots_view', name='public_ballots_view'),
@@ -61,9 +62,14 @@ urlpatterns = patterns('debate.views',
 
     url(r'^admin/round/(?P<round_seq>\d+)/draw/$', 'draw', name='draw'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw/details/$', 'draw_with_standings', name='draw_with_standings'),
+    url(r'^admin/round/(?P<round_seq>\d+)/draw/diagnostics/$', 'draw_diagnostics', name='draw_diagnostics'),
+    url(r'^admin/round/(?P<round_seq>\d+)/draw/swap/check/$', 'draw_swap_check', name='draw_swap_check'),
+    url(r'^admin/round/(?P<round_seq>\d+)/draw/swap/$', 'draw_swap', name='draw_swap'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw_display_by_venue/$', 'draw_display_by_venue', name='draw_display_by_venue'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw_display_by_team/$', 'draw_display_by_team', name='draw_display_by_team'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw/create/$', 'create_draw', name='create_draw'),
+    url(r'^admin/round/(?P<round_seq>\d+)/draw/job/$', 'draw_job_status', name='draw_job_status'),
+    url(r'^admin/round/(?P<round_seq>\d+)/draw/job/cancel/$', 'cancel_draw_job', name='cancel_draw_job'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw/confirm/$', 'confirm_draw', name='confirm_draw'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw/release/$', 'release_draw', name='release_draw'),
     url(r'^admin/round/(?P<round_seq>\d+)/draw/unrelease/$', 'unrelease_draw', name='unrelease_draw'),
@@ -94,6 +100,7 @@ urlpatterns = patterns('debate.views',
     url(r'^admin/round/(?P<round_seq>\d+)/standings/team/print/$', 'team_standings', { 'for_print': True }, name='team_standings_print'),
     url(r'^admin/round/(?P<round_seq>\d+)/standings/speaker/print/$', 'speaker_standings', { 'for_print': True }, name='speaker_standings_print'),
     url(r'^admin/round/(?P<round_seq>\d+)/standings/reply/print/$', 'reply_standings', { 'for_print': True }, name='reply_standings_print'),
+    url(r'^admin/round/(?P<round_seq>\d+)/standings/speaker/(?P<category>\w+)/$', 'speaker_standings', name='speaker_standings_category'),
     url(r'^admin/ballots/(?P<ballots_id>\d+)/edit/$', 'edit_ballots', name='edit_ballots'),
     url(r'^admin/debate/(?P<debate_id>\d+)/new_ballots/$', 'new_ballots', name='new_ballots'),
     url(r'^admin/round/(?P<round_seq>\d+)/ballot_checkin/$', 'ballot_checkin', name='ballot_checkin'),
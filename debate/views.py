@@ -16,8 +16,14 @@ from debate.models import AdjudicatorConflict, AdjudicatorInstitutionConflict, D
 from debate.models import Person, Checkin, Motion, ActionLog, BallotSubmission, AdjudicatorTestScoreHistory
 from debate.models import AdjudicatorFeedback, ActiveVenue, ActiveTeam, ActiveAdjudicator
 from debate.models import TeamPositionAllocation
-from debate.models import Division, TeamVenuePreference, VenueGroup
+from debate.models import Division, TeamVenuePreference, VenueGroup, DrawJob
 from debate.result import BallotSet
+from debate.break_projection import get_break_projection
+from debate.breaking import BREAK_CATEGORIES
+from debate.tab import SpeakerTabs, SPEAKER_CATEGORIES
+from debate.history import SideHistory
+from debate.draw_diagnostics import get_draw_diagnostics
+from debate.draw_editor import evaluate_swap, swap_teams
 from debate import forms
 
 from django.forms.models import modelformset_factory, formset_factory
@@ -36,6 +42,28 @@ def get_ip_address(request):
 def decide_show_draw_strength(tournament):
     return tournament.config.get('team_standings_rule') == "nz"
 
+def get_break_projections(round):
+    """Returns a list of (category name, projected teams) for the break
+    projection on the draw pages, or an empty list if it's disabled or there
+    are no preliminary rounds left to project. Projections are cached until
+    results change, by get_break_projection()."""
+    tournament = round.tournament
+    simulations = tournament.config.get('break_projection_simulations')
+    if simulations <= 0 or round.stage != Round.STAGE_PRELIMINARY:
+        return []
+    return [(category.verbose_name, get_break_projection(round, category.name, simulations))
+            for category in BREAK_CATEGORIES.itervalues()
+            if tournament.config.get(category.break_size_option) > 0]
+
+def get_speaker_category_standings(round, category):
+    """Returns (speakers, category) for a speaker tab category name, or the
+    normal speaker standings (and None) if 'category' is None."""
+    if category is None:
+        return Speaker.objects.standings(round), None
+    if category not in SPEAKER_CATEGORIES:
+        raise Http404("There's no speaker category called %s" % category)
+    return SpeakerTabs(round).get(category), SPEAKER_CATEGORIES[category]
+
 def redirect_round(to, round, **kwargs):
     return redirect(to, tournament_slug=round.tournament.slug,
                     round_seq=round.seq, *kwargs)
@@ -158,7 +186,7 @@ def public_team_standings(request, t):
 
     if round is not None and round.silent is False:
 
-        from debate.models import TeamScore
+        from debate.tab import TeamResultsMatrix
 
         # Ranking by institution__name and reference isn't the same as ordering by
         # short_name, which is what we really want. But we can't rank by short_name,
@@ -166,29 +194,19 @@ def public_team_standings(request, t):
         # The real purpose of this ordering is to obscure the *true* ranking of teams
         # - teams are not supposed to know rankings between teams on the same number
         # of wins.
-        teams = Team.objects.order_by('institution__code', 'reference')
+        teams = Team.objects.filter(tournament=t).order_by('institution__code', 'reference').select_related(
+                'institution', 'division').prefetch_related('speaker_set')
         rounds = t.prelim_rounds(until=round).filter(silent=False).order_by('seq')
-
-        def get_round_result(team, r):
-            try:
-                ts = TeamScore.objects.get(
-                    ballot_submission__confirmed=True,
-                    debate_team__team=team,
-                    debate_team__debate__round=r,
-                )
-                ts.opposition = ts.debate_team.opposition.team
-                return ts
-            except TeamScore.DoesNotExist:
-                return None
+        results = TeamResultsMatrix(round)
 
         for team in teams:
-            team.round_results = [get_round_result(team, r) for r in rounds]
+            team.round_results = [results.get(team, r) for r in rounds]
             # Do this manually, in case there are silent rounds
             team.wins = [ts.win for ts in team.round_results if ts].count(True)
             team.points = sum([ts.points for ts in team.round_results if ts])
 
 
-        return r2r(request, 'public/team_standings.html', dict(teams=teams, rounds=rounds, round=round))
+        return r2r(request, 'public/public_team_standings.html', dict(teams=teams, rounds=rounds, round=round))
     else:
         return r2r(request, 'public/index.html')
 
@@ -329,40 +347,22 @@ def public_side_allocations(request, t):
 @public_optional_tournament_view('tab_released')
 def public_team_tab(request, t):
     round = t.current_round
-    from debate.models import TeamScore
+    from debate.tab import TeamResultsMatrix
     teams = Team.objects.ranked_standings(round)
 
     rounds = t.prelim_rounds(until=round).order_by('seq')
-
-    def get_round_result(team, r):
-        try:
-            ts = TeamScore.objects.get(
-                ballot_submission__confirmed=True,
-                debate_team__team=team,
-                debate_team__debate__round=r,
-            )
-            ts.opposition = ts.debate_team.opposition.team
-            return ts
-        except TeamScore.DoesNotExist:
-            return None
+    results = TeamResultsMatrix(round)
 
     def get_score(team, r):
-        try:
-            ts = TeamScore.objects.get(
-                ballot_submission__confirmed=True,
-                debate_team__team=team,
-                debate_team__debate__round=r,
-            )
-            opposition = ts.debate_team.opposition.team
-            debate_id = ts.debate_team.debate.id
-            return ts.score, ts.points, opposition, debate_id
-        except TeamScore.DoesNotExist:
+        ts = results.get(team, r)
+        if ts is None:
             return None
+        return ts.score, ts.points, ts.opposition, ts.debate_id
 
     for team in teams:
         team.results_in = True # always
         team.scores = [get_score(team, r) for r in rounds]
-        team.round_results = [get_round_result(team, r) for r in rounds]
+        team.round_results = [results.get(team, r) for r in rounds]
         team.wins = [ts.win for ts in team.round_results if ts].count(True)
         team.points = sum([ts.points for ts in team.round_results if ts])
 
@@ -374,45 +374,17 @@ def public_team_tab(request, t):
 
 @cache_page(TAB_PAGES_CACHE_TIMEOUT)
 @public_optional_tournament_view('tab_released')
-def public_speaker_tab(request, t):
+def public_speaker_tab(request, t, category=None):
     round = t.current_round
     rounds = t.prelim_rounds(until=round).order_by('seq')
-    speakers = Speaker.objects.standings(round)
-
-    # TODO is there a way to do this without so many database hits?
-    # Maybe using a select subquery?
-    from debate.models import SpeakerScore
-    def get_score(speaker, r):
-        try:
-            return SpeakerScore.objects.get(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position__lte=3).score
-        except SpeakerScore.DoesNotExist:
-            return None
-
-        # This was an issue once, not sure how, but if it ever happens,
-        # fail gracefully.
-        except SpeakerScore.MultipleObjectsReturned:
-            print("Multiple speaker scores seen for speaker {0:s} in round {1:d}:".format(
-                speaker.name, r.seq))
-            for score in SpeakerScore.objects.filter(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position__lte=3):
-                print("   {dt:s}\n        position {pos:d}, ballot submission ID {id:d} (version {v:d}): score {score}".format(
-                    dt=score.debate_team, pos=score.position, id=score.ballot_submission.id,
-                    v=score.ballot_submission.version, score=score.score))
-            return None
+    speakers, category = get_speaker_category_standings(round, category)
 
     for speaker in speakers:
-        speaker.scores = [get_score(speaker, r) for r in rounds]
         speaker.results_in = True # always
 
     return r2r(request, 'public/speaker_tab.html', dict(speakers=speakers,
-            rounds=rounds, round=round))
+            rounds=rounds, round=round, category=category,
+            speaker_categories=SPEAKER_CATEGORIES.values()))
 
 @cache_page(TAB_PAGES_CACHE_TIMEOUT)
 @public_optional_tournament_view('tab_released')
@@ -421,28 +393,11 @@ def public_replies_tab(request, t):
     rounds = t.prelim_rounds(until=round).order_by('seq')
     speakers = Speaker.objects.reply_standings(round)
 
-    from debate.models import SpeakerScore
-    def get_score(speaker, r):
-        try:
-            return SpeakerScore.objects.get(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position=4).score
-        except SpeakerScore.DoesNotExist:
-            return None
+    from debate.tab import get_teams_with_results
+    teams_with_results = get_teams_with_results(round)
 
     for speaker in speakers:
-        speaker.scores = [get_score(speaker, r) for r in rounds]
-        try:
-            # TODO detect if the speaker's *team's* ballot has been entered
-            # for this round, and set results_in accordingly.
-            #SpeakerScore.objects.get(speaker=speaker,
-                                        #debate_team__debate__round=r,
-                                        #position=4)
-            speaker.results_in = True
-        except SpeakerScore.DoesNotExist:
-            speaker.results_in = False
+        speaker.results_in = round.stage != Round.STAGE_PRELIMINARY or speaker.team_id in teams_with_results
 
     return r2r(request, 'public/reply_tab.html', dict(speakers=speakers,
             rounds=rounds, round=round))
@@ -766,19 +721,27 @@ def draw_none(request, round):
     active_teams = round.active_teams.all()
     active_venues = round.active_venues.all()
     rooms = float(active_teams.count()) / 2
+    job = DrawJob.objects.latest_for_round(round)
     return r2r(request, "draw_none.html", dict(active_teams=active_teams,
                                                active_venues=active_venues,
-                                               rooms=rooms))
+                                               rooms=rooms, job=job))
 
 
 def draw_draft(request, round):
     draw = round.get_draw_with_standings(round)
     show_draw_strength = decide_show_draw_strength(round.tournament)
-    return r2r(request, "draw_draft.html", dict(draw=draw, show_draw_strength=show_draw_strength))
+    break_projections = get_break_projections(round)
+    diagnostics = get_draw_diagnostics(round, draw)
+    return r2r(request, "draw_draft.html", dict(draw=draw, show_draw_strength=show_draw_strength,
+            break_projections=break_projections, diagnostics=diagnostics))
 
 
 def draw_confirmed(request, round):
-    draw = round.get_draw()
+    draw = round.get_draw_with_teams()
+    if round.prev:
+        sides = SideHistory(round.prev)
+        for debate in draw:
+            sides.annotate((debate.aff_team, debate.neg_team))
     rooms = float(round.active_teams.count()) / 2
     active_adjs = round.active_adjudicators.all()
     divisions_assigned = sum(t.division != None for t in round.active_teams.all())
@@ -788,20 +751,80 @@ def draw_confirmed(request, round):
                                                     rooms=rooms,
                                                     divs=divisions_assigned))
 
+@admin_required
+@round_view
+def draw_diagnostics(request, round):
+    diagnostics = get_draw_diagnostics(round)
+    return HttpResponse(json.dumps(diagnostics.as_dict()), content_type="text/json")
+
+def _swap_args(params):
+    try:
+        return (int(params['debate1']), params['side1'], int(params['debate2']), params['side2'])
+    except KeyError as e:
+        raise ValueError("Missing parameter: {0}".format(e.args[0]))
+
+@admin_required
+@round_view
+def draw_swap_check(request, round):
+    """Reports the change in conflicts from swapping two teams, given by the
+    'debate1', 'side1', 'debate2' and 'side2' GET parameters (sides are
+    DebateTeam positions), without making the swap."""
+    try:
+        delta = evaluate_swap(round, *_swap_args(request.GET))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return HttpResponse(json.dumps(delta), content_type="text/json")
+
+@admin_required
+@expect_post
+@round_view
+def draw_swap(request, round):
+    """Swaps two teams in a draft draw, given as for draw_swap_check(), and
+    reports the change in conflicts."""
+    if round.draw_status != round.STATUS_DRAFT:
+        return HttpResponseBadRequest("Draw status is not DRAFT")
+    try:
+        delta = swap_teams(round, *_swap_args(request.POST))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    ActionLog.objects.log(type=ActionLog.ACTION_TYPE_DRAW_EDIT,
+        user=request.user, round=round, tournament=round.tournament)
+    return HttpResponse(json.dumps(delta), content_type="text/json")
+
 @admin_required
 @round_view
 def draw_with_standings(request, round):
     draw = round.get_draw_with_standings(round)
     show_draw_strength = decide_show_draw_strength(round.tournament)
-    return r2r(request, "draw_with_standings.html", dict(draw=draw, show_draw_strength=show_draw_strength))
+    break_projections = get_break_projections(round)
+    return r2r(request, "draw_with_standings.html", dict(draw=draw, show_draw_strength=show_draw_strength,
+            break_projections=break_projections))
 
 @admin_required
 @expect_post
 @round_view
 def create_draw(request, round):
-    round.draw()
-    ActionLog.objects.log(type=ActionLog.ACTION_TYPE_DRAW_CREATE,
-        user=request.user, round=round, tournament=round.tournament)
+    job, started = DrawJob.objects.start(round, request.user)
+    if started:
+        ActionLog.objects.log(type=ActionLog.ACTION_TYPE_DRAW_CREATE,
+            user=request.user, round=round, tournament=round.tournament)
+    return redirect_round('draw', round)
+
+
+@admin_required
+@round_view
+def draw_job_status(request, round):
+    job = DrawJob.objects.latest_for_round(round)
+    status = job.as_dict() if job is not None else {"status": None, "active": False}
+    status["draw_status"] = round.draw_status
+    return HttpResponse(json.dumps(status), content_type="text/json")
+
+
+@admin_required
+@expect_post
+@round_view
+def cancel_draw_job(request, round):
+    DrawJob.objects.cancel(round)
     return redirect_round('draw', round)
 
 
@@ -1334,22 +1357,15 @@ def new_ballots(request, t, debate_id):
 @admin_required
 @round_view
 def team_standings(request, round, for_print=False):
-    from debate.models import TeamScore
+    from debate.tab import TeamResultsMatrix
     teams = Team.objects.ranked_standings(round)
 
     rounds = round.tournament.prelim_rounds(until=round).order_by('seq')
+    results = TeamResultsMatrix(round)
+    SideHistory(round).annotate(teams)
 
     def get_round_result(team, r):
-        try:
-            ts = TeamScore.objects.get(
-                ballot_submission__confirmed=True,
-                debate_team__team=team,
-                debate_team__debate__round=r,
-            )
-            ts.opposition = ts.debate_team.opposition.team
-            return ts
-        except TeamScore.DoesNotExist:
-            return None
+        return results.get(team, r)
 
     for team in teams:
         team.results_in = round.stage != Round.STAGE_PRELIMINARY or get_round_result(team, round) is not None
@@ -1370,44 +1386,16 @@ def team_standings(request, round, for_print=False):
 
 @admin_required
 @round_view
-def speaker_standings(request, round, for_print=False):
+def speaker_standings(request, round, for_print=False, category=None):
     rounds = round.tournament.prelim_rounds(until=round).order_by('seq')
-    speakers = Speaker.objects.standings(round)
-
-    # TODO is there a way to do this without so many database hits?
-    # Maybe using a select subquery?
-    from debate.models import SpeakerScore
-    def get_score(speaker, r):
-        try:
-            return SpeakerScore.objects.get(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position__lte=3).score
-        except SpeakerScore.DoesNotExist:
-            return None
-
-        # This was an issue once, not sure how, but if it ever happens,
-        # fail gracefully.
-        except SpeakerScore.MultipleObjectsReturned:
-            print("Multiple speaker scores seen for speaker {0:s} in round {1:d}:".format(
-                speaker.name, r.seq))
-            for score in SpeakerScore.objects.filter(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position__lte=3):
-                print("   {dt:s}\n        position {pos:d}, ballot submission ID {id:d} (version {v:d}): score {score}".format(
-                    dt=score.debate_team, pos=score.position, id=score.ballot_submission.id,
-                    v=score.ballot_submission.version, score=score.score))
-            return None
+    speakers, category = get_speaker_category_standings(round, category)
 
     for speaker in speakers:
-        speaker.scores = [get_score(speaker, r) for r in rounds]
-        speaker.results_in = round.stage != Round.STAGE_PRELIMINARY or get_score(speaker, round) is not None
+        speaker.results_in = round.stage != Round.STAGE_PRELIMINARY or speaker.scores[-1] is not None
 
     return r2r(request, 'speaker_standings.html', dict(speakers=speakers,
-                                        rounds=rounds, for_print=for_print))
+                                        rounds=rounds, for_print=for_print, category=category,
+                                        speaker_categories=SPEAKER_CATEGORIES.values()))
     # Comment out above line and uncomment below line to prevent access to
     # speaker standings.
     #return r2r(request, 'speaker_standings.html', dict(speakers=None,
@@ -1420,28 +1408,11 @@ def reply_standings(request, round, for_print=False):
     rounds = round.tournament.prelim_rounds(until=round).order_by('seq')
     speakers = Speaker.objects.reply_standings(round)
 
-    from debate.models import SpeakerScore
-    def get_score(speaker, r):
-        try:
-            return SpeakerScore.objects.get(
-                ballot_submission__confirmed=True,
-                speaker=speaker,
-                debate_team__debate__round=r,
-                position=4).score
-        except SpeakerScore.DoesNotExist:
-            return None
+    from debate.tab import get_teams_with_results
+    teams_with_results = get_teams_with_results(round)
 
     for speaker in speakers:
-        speaker.scores = [get_score(speaker, r) for r in rounds]
-        try:
-            # TODO detect if the speaker's *team's* ballot has been entered
-            # for this round, and set results_in accordingly.
-            #SpeakerScore.objects.get(speaker=speaker,
-                                     #debate_team__debate__round=r,
-                                     #position=4)
-            speaker.results_in = True
-        except SpeakerScore.DoesNotExist:
-            speaker.results_in = False
+        speaker.results_in = round.stage != Round.STAGE_PRELIMINARY or speaker.team_id in teams_with_results
 
     return r2r(request, 'reply_standings.html', dict(speakers=speakers,
                                         rounds=rounds, for_print=for_print))